@@ -2,13 +2,19 @@
 """
 __all__ = [
 # general
-"angle",
+"angle", "anglearray", "geometry", "epochs", "pointmatch",
+"kdtree", "deformation",
 # readers
 "reader", "confreader", "csvreader", "filereader", "georeader", 
 "httpreader", "jsonreader", "sqlitereader", "queuereader",
 # interfaces
 "iface", "localiface", "serialiface", "videoiface", "bluetoothiface",
-"gamaiface", "i2ciface", "picamiface", "webiface", "tcpiface",
+"gamaiface", "lsqadjust", "sparseadjust", "i2ciface", "picamiface",
+"webiface", "tcpiface",
+"linebuffer", "latencystats", "telemetry", "asynciface",
+"asyncserialiface", "asynctcpiface", "asyncthreadiface", "simiface",
+"recorderiface", "replayiface", "broker", "brokeriface",
+"instrumentgateway",
 # measure units
 "measureunit", "leicameasureunit", "leicatca1800", "leicatps1200",
 "trimble5500", "leicadnaunit", "nmeagnssunit", "videomeasureunit",
@@ -17,6 +23,8 @@ __all__ = [
 # writers
 "writer", "echowriter", "filewriter", "csvwriter", "imagewriter", 
 "videowriter", "httpwriter", "geowriter", "sqlitewriter", "queuewriter",
+"writebehindwriter",
 # instruments/sensors
 "instrument", "totalstation", "digitallevel", "webcam", "gnss", "bmp180",
-"lsm9ds0", "webmet", "wificollector", "camera", "camerastation", "sensehat" ]
+"lsm9ds0", "webmet", "wificollector", "camera", "camerastation", "sensehat",
+"asyncinstrument", "asynctotalstation", "asyncgnss", "asyncwebmet" ]
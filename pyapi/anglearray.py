@@ -0,0 +1,353 @@
+#!/usr/bin/python
+# -*- coding: UTF-8 -*-
+"""
+.. module:: anglearray.py
+  :platform: Unix, Windows
+  :synopsis: Ulyxes - an open source project to drive total stations and
+      publish observation results.
+      GPL v2.0 license
+      Copyright (C) 2010- Zoltan Siki <siki.zoltan@epito.bme.hu>
+
+.. moduleauthor:: dr. Zoltan Siki <siki.zoltan@epito.bme.hu>
+
+Vectorized version of Angle for many observations, values are stored in a
+numpy array in radians::
+
+    hz = AngleArray(['12-34-56', '123-45-6', '359-59-59'], 'DMS')
+    print(hz.GetAngle('GON'))
+    print(hz.Format('DMS'))
+    a = hz[1]           # Angle
+"""
+
+import math
+import numpy as np
+from angle import Angle, RO, PI2
+
+_NODMS = str.maketrans('', '', '0123456789-\n')
+_POW10 = np.array([1.0, 10.0, 100.0])
+
+def _dms2rad(dms):
+    """ Convert DMS strings to RAD, checked like Angle does without regular
+        expression on each item
+    """
+    dms = list(dms)
+    if not dms:
+        return np.zeros(0)
+    text = '\n' + '\n'.join(dms) + '\n'
+    if text.translate(_NODMS) or '--' in text or '\n-' in text or \
+       '-\n' in text or '\n\n' in text:
+        raise ValueError("AngleArray invalid argument")
+    # value of digits summed by fields, fields end at '-' or new line
+    b = np.frombuffer(text.encode('ascii'), np.uint8)
+    isSep = (b == 45) | (b == 10)
+    sep = np.flatnonzero(isSep)
+    pos = np.flatnonzero(~isSep)
+    field = np.cumsum(isSep, dtype=np.int32)[pos]
+    exp = sep[field] - pos - 1
+    if exp.size and exp.max() > 2:
+        raise ValueError("AngleArray invalid argument")
+    digits = (b[pos] - 48) * _POW10[exp]
+    values = np.bincount(field - 1, digits, len(sep) - 1)
+    # place fields into degree, minute, second columns of lines
+    isNl = b[sep[:-1]] == 10
+    idx = np.arange(len(isNl))
+    col = idx - np.maximum.accumulate(np.where(isNl, idx, 0))
+    if np.any(col > 2):
+        raise ValueError("AngleArray invalid argument")
+    parts = np.zeros((len(dms), 3))
+    parts[np.cumsum(isNl, dtype=np.int32) - 1, col] = values
+    if np.any(parts[:, 0] >= 1000) or np.any(parts[:, 1:] >= 100):
+        raise ValueError("AngleArray invalid argument")
+    return np.radians(parts[:, 0] + parts[:, 1] / 60.0 + parts[:, 2] / 3600.0)
+
+def _dm2rad(angle):
+    """ Convert DDMM.nnnnnn NMEA angles to radian
+    """
+    w = angle / 100.0
+    d = np.trunc(w)
+    return np.radians(d + (w - d) * 100.0 / 60.0)
+
+def _pdeg2rad(angle):
+    """ Convert dd.mmss to radian
+    """
+    d = np.floor(angle)
+    angle = np.round((angle - d) * 100, 10)
+    m = np.floor(angle)
+    s = np.round((angle - m) * 100, 10)
+    return np.radians(d + m / 60.0 + s / 3600.0)
+
+def _dms(value):
+    """ Convert radian to DMS strings
+    """
+    secs = np.rint(np.abs(value) * RO).astype(np.int64)
+    mi, sec = np.divmod(secs, 60)
+    deg, mi = np.divmod(mi, 60)
+    if len(deg) == 0 or deg.max() >= 1000:
+        return [f"{'-' if s else ''}{d}-{m:02d}-{c:02d}" for s, d, m, c in
+                zip((value < 0).tolist(), deg.tolist(), mi.tolist(), sec.tolist())]
+    # fixed width lines, padding spaces are removed
+    chars = np.empty((len(deg), 11), np.uint8)
+    chars[:, 0] = np.where(value < 0, 45, 32)
+    chars[:, 1] = np.where(deg >= 100, deg // 100 + 48, 32)
+    chars[:, 2] = np.where(deg >= 10, deg // 10 % 10 + 48, 32)
+    chars[:, 3] = deg % 10 + 48
+    chars[:, 4] = 45
+    chars[:, 5] = mi // 10 + 48
+    chars[:, 6] = mi % 10 + 48
+    chars[:, 7] = 45
+    chars[:, 8] = sec // 10 + 48
+    chars[:, 9] = sec % 10 + 48
+    chars[:, 10] = 10
+    return chars.tobytes().decode('ascii').replace(' ', '').split('\n')[:-1]
+
+def _rad2dm(value):
+    """ Convert radian to NMEA DDDMM.nnnnn
+    """
+    w = value / math.pi * 180.0
+    d = np.trunc(w)
+    return d * 100 + (w - d) * 60
+
+def _rad2pdeg(value):
+    """ Convert radian to pseudo DMS ddd.mmss
+    """
+    secs = np.rint(value * RO)
+    mi, sec = np.divmod(secs, 60)
+    deg, mi = np.divmod(mi, 60)
+    return deg + mi / 100.0 + sec / 10000.0
+
+class AngleArray():
+    """ Array of angles, values stored in radian in a numpy array. Units are
+        the same as of Angle (RAD/DMS/DEG/GON/NMEA/PDEG/SEC/MIL).
+
+        Operators supported:
+
+        * \\+ \\- add/substract AngleArray, Angle or radians
+        * [i] Angle of an item, [i:j] AngleArray sharing the values
+        * len(), iteration (Angle items), numpy.asarray() (radians)
+
+        :param values: angle values (iterable of floats or strings, numpy array)
+        :param unit: angle unit (available units RAD/DMS/DEG/GON/NMEA/PDEG/SEC/MIL)
+        :param copy: copy values, if False a float64 array in radians is used (and normalized) in place
+    """
+
+    # jump table to import from
+    im = {'DMS': _dms2rad, 'DEG': np.radians,
+          'GON': lambda a: a / 200.0 * math.pi, 'NMEA': _dm2rad,
+          'PDEG': _pdeg2rad, 'SEC': lambda a: a / RO,
+          'MIL': lambda a: a / 6400.0 * 2.0 * math.pi}
+    # jump table for convert to
+    ex = {'DMS': _dms, 'DEG': np.degrees,
+          'GON': lambda v: v / math.pi * 200.0, 'NMEA': _rad2dm,
+          'PDEG': _rad2pdeg, 'SEC': lambda v: v * RO,
+          'MIL': lambda v: v / math.pi / 2.0 * 6400.0}
+
+    def __init__(self, values=(), unit='RAD', copy=True):
+        """ Constructor for an angle array
+        """
+        self.value = None
+        self.SetAngle(values, unit, copy)
+
+    @classmethod
+    def FromAngles(cls, angles):
+        """ Create array from Angle objects
+
+            :param angles: Angle objects (iterable)
+            :returns: AngleArray
+        """
+        angles = list(angles)
+        return cls(np.fromiter((a.value if a.value is not None else np.nan
+                                for a in angles), float, len(angles)),
+                   copy=False)
+
+    def SetAngle(self, values, unit='RAD', copy=True):
+        """ Set or change values of the array
+
+            :param values: new values (iterable of floats or strings, numpy array)
+            :param unit: unit of the new values (str)
+            :param copy: copy values, see constructor
+        """
+        if unit == 'DMS':
+            if isinstance(values, str):
+                values = [values]
+            self.value = _dms2rad(values)
+        else:
+            if isinstance(values, (list, tuple)) and len(values) and \
+               isinstance(values[0], str):
+                # faster than numpy conversion of strings
+                values = np.fromiter(map(float, values), float, len(values))
+            elif copy or not isinstance(values, np.ndarray) or \
+               values.dtype != np.float64:
+                values = np.array(values, dtype=float, ndmin=1)
+            if unit == 'RAD':
+                self.value = values
+            elif unit in self.im:
+                self.value = self.im[unit](values)
+            else:
+                # unknown unit
+                self.value = np.full(values.shape, np.nan)
+        # move angles to -2*PI : 2*PI interval
+        np.fmod(self.value, PI2, out=self.value)
+
+    def GetAngle(self, out='RAD'):
+        """ Get values in different units
+
+            :param out: output unit (str RAD/DMS/DEG/GON/NMEA/PDEG/SEC/MIL)
+            :returns: values (numpy array, no copy for RAD) or list of strings for DMS, None for unknown unit
+        """
+        if out == 'RAD':
+            return self.value
+        if out in self.ex:
+            return self.ex[out](self.value)
+        return None
+
+    def Format(self, out='GON', fmt='{:.4f}'):
+        """ Angles as strings
+
+            :param out: output unit (str)
+            :param fmt: format of numeric units
+            :returns: list of strings
+        """
+        values = self.GetAngle(out)
+        if out == 'DMS':
+            return values
+        return [fmt.format(v) for v in values.tolist()]
+
+    def Angles(self):
+        """ Angle objects of items
+
+            :returns: list of Angle
+        """
+        return [Angle(v) for v in self.value.tolist()]
+
+    def Positive(self):
+        """ Change negative values to positive
+        """
+        self.value[self.value < 0] += PI2
+        return self
+
+    def Normalize(self):
+        """ Normalize angles between 0-360 DEG
+        """
+        np.mod(self.value, PI2, out=self.value)
+        # mod of tiny negative values may be rounded to 2*PI
+        self.value[self.value >= PI2] = 0.0
+        return self
+
+    def __len__(self):
+        """ number of angles """
+        return len(self.value)
+
+    def __iter__(self):
+        """ iterate on Angle objects """
+        return iter(self.Angles())
+
+    def __array__(self, dtype=None, copy=None):
+        """ values in radians for numpy """
+        return self.value if dtype is None else self.value.astype(dtype)
+
+    def __getitem__(self, i):
+        """ Angle of an item or AngleArray of a slice (sharing values) """
+        v = self.value[i]
+        if isinstance(v, np.ndarray):
+            return AngleArray(v, copy=False)
+        return Angle(float(v))
+
+    def __setitem__(self, i, a):
+        """ set items from Angle, AngleArray or radians """
+        self.value[i] = a.GetAngle() if isinstance(a, (Angle, AngleArray)) \
+            else a
+
+    def __str__(self):
+        """ GON string representation of angles
+
+            :returns: GON string
+        """
+        return '[' + ', '.join(self.Format()) + ']'
+
+    def __repr__(self):
+        """
+        angle array representation
+            :returns: angle array string
+        """
+        return type(self).__name__ + "(" + repr(self.value) + ")"
+
+    @staticmethod
+    def _Rad(a):
+        """ radians of an operand """
+        return a.GetAngle() if isinstance(a, (Angle, AngleArray)) else a
+
+    def __add__(self, a):
+        """ add angles
+
+            :param a: AngleArray, Angle or radians to add
+            :returns: sum (AngleArray)
+        """
+        return AngleArray(self.value + self._Rad(a), copy=False)
+
+    def __iadd__(self, a):
+        """ add angles to current
+
+            :param a: AngleArray, Angle or radians to add
+        """
+        self.value += self._Rad(a)
+        return self
+
+    def __sub__(self, a):
+        """ substract angles
+
+            :param a: AngleArray, Angle or radians to substract
+            :returns: difference (AngleArray)
+        """
+        return AngleArray(self.value - self._Rad(a), copy=False)
+
+    def __isub__(self, a):
+        """ substract angles from current
+
+            :param a: AngleArray, Angle or radians to substract
+        """
+        self.value -= self._Rad(a)
+        return self
+
+if __name__ == "__main__":
+    # convert a million angles in each unit, compare speed and values with
+    # Angle on a sample
+    #    argv[1]: number of angles, default 1000000
+    import sys
+    import time
+
+    n = int(sys.argv[1]) if len(sys.argv) > 1 else 1000000
+    k = min(n, 100000)     # sample converted by Angle
+    rng = np.random.default_rng(1)
+    rad = rng.uniform(0, PI2, n)
+    print("{:5s} {:>10s} {:>10s} {:>10s} {:>10s} {:>8s} {:>10s}".format(
+        'unit', 'parse s', 'Angle s', 'format s', 'Angle s', 'speedup', 'max diff'))
+    for unit in ('DMS', 'DEG', 'GON', 'NMEA', 'PDEG', 'SEC', 'MIL'):
+        src = AngleArray(rad).GetAngle(unit)
+        if unit == 'DMS':
+            scalar = src[:k]
+        else:
+            src = [f"{v:.10f}" for v in src.tolist()]   # e.g. read from file
+            scalar = [float(v) for v in src[:k]]
+        t = time.perf_counter()
+        arr = AngleArray(src, unit)
+        tp = time.perf_counter() - t
+        t = time.perf_counter()
+        angles = [Angle(v, unit) for v in scalar]
+        ta = (time.perf_counter() - t) * n / k
+        t = time.perf_counter()
+        out = arr.GetAngle(unit)
+        tf = time.perf_counter() - t
+        t = time.perf_counter()
+        scalar_out = [a.GetAngle(unit) for a in angles]
+        tb = (time.perf_counter() - t) * n / k
+        diff = np.max(np.abs(arr.value[:k] - [a.GetAngle() for a in angles]))
+        if unit == 'DMS':
+            diff = max(diff, sum(x != y for x, y in zip(out, scalar_out)))
+        else:
+            diff = max(diff, np.max(np.abs(out[:k] - scalar_out)))
+        print("{:5s} {:10.3f} {:10.3f} {:10.3f} {:10.3f} {:8.1f} {:10.2e}".format(
+            unit, tp, ta, tf, tb, (ta + tb) / (tp + tf), diff))
+    arr = AngleArray(rad) + Angle(1.0)
+    t = time.perf_counter()
+    arr.Normalize()
+    print("normalize {:d} angles {:.4f} s".format(n, time.perf_counter() - t))
@@ -0,0 +1,65 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+"""
+.. module:: asyncgnss.py
+   :platform: Unix, Windows
+   :synopsis: Ulyxes - an open source project to drive total stations and
+       publish observation results.  GPL v2.0 license Copyright (C)
+       2010- Zoltan Siki <siki.zoltan@epito.bme.hu>.
+
+.. moduleauthor:: Zoltan Siki <siki.zoltan@epito.bme.hu>
+"""
+from gnss import Gnss
+
+class AsyncGnss(Gnss):
+    """ GNSS receiver sending NMEA messages read from an asyncio interface
+
+            :param name: name of gnss instrument
+            :param measureUnit: reference to measure unit
+            :param measureIface: reference to asyncio measure interface (AsyncIface)
+            :param writerUnit: store data, default None
+    """
+
+    async def _process(self, msg, dummy=None):
+        """ Get a line from measure unit and process answer
+
+            :param msg: empty string, not used
+            :param dummy: dummy parameter for compatibility with instrument
+            :returns: parsed answer (dictionary)
+        """
+        ans = await self.measureIface.GetLine()
+        if self.measureIface.state != self.measureIface.IF_OK:
+            return ''
+        res = self.measureUnit.Result(msg, ans)
+        if self.writerUnit is not None and res is not None and len(res) > 0:
+            self.writerUnit.WriteData(res)
+        return res
+
+    async def Measure(self):
+        """ Get position from nmea stream
+        """
+        ret = None
+        while ret is None:
+            if self.measureIface.state != self.measureIface.IF_OK:
+                break
+            msg = self.measureUnit.MeasureMsg()
+            ret = await self._process(msg)
+        return ret
+
+if __name__ == '__main__':
+    import asyncio
+    import logging
+    from echowriter import EchoWriter
+    from asynctcpiface import AsyncTCPIface
+    from nmeagnssunit import NmeaGnssUnit
+
+    async def main():
+        """ print positions from a NMEA TCP stream """
+        iface = AsyncTCPIface('gnss', ('127.0.0.1', 5017))
+        await iface.Open()
+        g = AsyncGnss('', NmeaGnssUnit(), iface, EchoWriter())
+        while g.measureIface.state == g.measureIface.IF_OK:
+            await g.Measure()
+
+    logging.basicConfig()
+    asyncio.run(main())
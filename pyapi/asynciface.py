@@ -0,0 +1,139 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+"""
+.. module:: asynciface.py
+   :platform: Unix, Windows
+   :synopsis: Ulyxes - an open source project to drive total stations and
+       publish observation results. GPL v2.0 license Copyright (C)
+       2010- Zoltan Siki <siki.zoltan@epito.bme.hu>.
+
+.. moduleauthor:: Zoltan Siki <siki.zoltan@epito.bme.hu>
+
+Base class of the asyncio interfaces. Several instruments can be driven from a
+single event loop, Send/GetLine/PutLine are coroutines.
+"""
+
+import asyncio
+import logging
+from iface import Iface
+
+class AsyncIface(Iface):
+    """ Base class for asyncio interfaces reading lines from an asyncio
+        stream reader. Descendant classes have to set the reader in their Open
+        coroutine and the writer or override Write.
+
+        :param name: name of the interface (str) (default None)
+        :param timeout: communication timeout seconds (int), default 15
+        :param eomRead: end of message char from instrument (str), default '\\r\\n'
+        :param eomWrite: end of message char from computer (str), default '\\r\\n'
+    """
+
+    def __init__(self, name=None, timeout=15, eomRead='\r\n', eomWrite='\r\n'):
+        """ Constructor
+        """
+        super().__init__(name)
+        self.timeout = timeout
+        self.eomRead = eomRead
+        self.eomWrite = eomWrite
+        self.reader = None
+        self.writer = None
+        self.lock = None    # created in the event loop on first use
+
+    async def Open(self):
+        """ Open connection, it must be implemented in inherited classes
+        """
+        self.opened = True
+
+    async def Close(self):
+        """ Close connection
+        """
+        if self.writer is not None:
+            try:
+                self.writer.close()
+                await self.writer.wait_closed()
+            except Exception:
+                pass
+        self.reader = None
+        self.writer = None
+        self.opened = False
+
+    async def Write(self, data):
+        """ Write bytes to the connection
+
+            :param data: bytes to send
+        """
+        self.writer.write(data)
+        await self.writer.drain()
+
+    async def GetLine(self):
+        """ read a line from the stream, waiting at most timeout seconds
+
+            :returns: line read (str) or empty string on timeout or error, state is set also
+        """
+        if self.reader is None or self.state != self.IF_OK:
+            logging.error(" async interface not opened or in error state")
+            return None
+        try:
+            ans = await asyncio.wait_for(
+                self.reader.readuntil(self.eomRead.encode('ascii')),
+                self.timeout)
+        except asyncio.TimeoutError:
+            # partial data stays in the stream buffer
+            self.state = self.IF_TIMEOUT
+            logging.error(" timeout on async interface")
+            return ''
+        except asyncio.IncompleteReadError as e:
+            ans = e.partial
+            self.state = self.IF_EOF
+            logging.error(" end of stream on async interface")
+        except Exception:
+            self.state = self.IF_READ
+            logging.error(" cannot read async interface")
+            return ''
+        ans = ans.decode('ascii', 'ignore')
+        logging.debug(" message got: %s", ans)
+        # remove end of line
+        return ans.strip(self.eomRead)
+
+    async def PutLine(self, msg):
+        """ send message through the stream
+
+            :param msg: message to send (str)
+            :returns: 0 - on OK, -1 on error or interface is in error state
+        """
+        if not self.opened or self.state != self.IF_OK:
+            logging.error(" async interface not opened or in error state")
+            return -1
+        # add end of message
+        w = -1 * len(self.eomWrite)
+        if msg[w:] != self.eomWrite:
+            msg += self.eomWrite
+        # remove special characters
+        msg = msg.encode('ascii', 'ignore')
+        logging.debug(" message sent: %s", msg)
+        try:
+            await self.Write(msg)
+        except Exception:
+            self.state = self.IF_WRITE
+            logging.error(" cannot write async interface")
+            return -1
+        return 0
+
+    async def Send(self, msg):
+        """ send message and read answer, concurrent callers are serialized
+            so request/answer pairs are never interleaved
+
+            :param msg: message to send, it can be multipart message separated by '|' (str)
+            :returns: answer from instrument (str)
+        """
+        if self.lock is None:
+            self.lock = asyncio.Lock()
+        async with self.lock:
+            res = ''
+            for m in msg.split('|'):
+                if await self.PutLine(m) == 0:
+                    ans = await self.GetLine()
+                    res += (ans if ans is not None else '') + '|'
+            if res.endswith('|'):
+                res = res[:-1]
+        return res
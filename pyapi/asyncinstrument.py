@@ -0,0 +1,135 @@
+#!/usr/bin/env python
+# -*- coding: UTF-8 -*-
+"""
+.. module:: asyncinstrument.py
+  :platform: Unix, Windows
+  :synopsis: Ulyxes - an open source project to drive total stations and
+      publish observation results.
+      GPL v2.0 license
+      Copyright (C) 2010- Zoltan Siki <siki.zoltan@epito.bme.hu>
+
+.. moduleauthor:: Zoltan Siki <siki.zoltan@epito.bme.hu>
+
+Instruments using asyncio interfaces. Mix AsyncInstrument before the blocking
+instrument class, methods which simply return the result of _process become
+awaitable without change, e.g.::
+
+    class AsyncTotalStation(AsyncInstrument, TotalStation)
+"""
+import time
+from instrument import Instrument
+from latencystats import LatencyStats
+
+class AsyncInstrument(Instrument):
+    """ Base class for instruments driven by an AsyncIface
+
+            :param name: name of instrument (str)
+            :param measureUnit: measure unit of the instrument (MeasureUnit)
+            :param MeasureIface: asyncio interface to physical intrument (AsyncIface)
+            :param writerUnit: unit to save observed data (Writer), optional
+    """
+
+    async def _process(self, msg, pic=None):
+        """ Send message to measure unit and process answer
+
+            :param msg: message to send
+            :param pic: when using a camera you have tive give writable binary file
+            :returns: parsed answer (dictionary), binary data (bytes) if a block follows the answer and pic is not given
+        """
+        tel = self.telemetry
+        if tel is not None:
+            key = LatencyStats.Key(msg)
+            start = time.monotonic()
+        ans = await self.measureIface.Send(msg)
+        if tel is not None:
+            t = time.monotonic()
+            tel.Add('send', key, t - start)
+            start = t
+        if self.measureIface.state != self.measureIface.IF_OK:
+            if tel is not None:
+                tel.IfaceError(self.measureIface)
+            return {}
+        res = self.measureUnit.Result(msg, ans)
+        if tel is not None:
+            t = time.monotonic()
+            tel.Add('result', key, t - start)
+            start = t
+            if isinstance(res, dict) and 'errorCode' in res:
+                tel.Error('instrument', '{}:{}'.format(key, res['errorCode']))
+
+        if self.writerUnit is not None and res is not None and len(res) > 0:
+            self.writerUnit.WriteData(res)
+            if tel is not None:
+                tel.Add('write', type(self.writerUnit).__name__,
+                        time.monotonic() - start)
+        if isinstance(res, dict) and res.get('binsize', 0) > 0:
+            # binary block follows the answer
+            data = await self.measureIface.GetLine(res['binsize'])
+            if pic is None:
+                return data
+            if data:
+                pic.write(data)
+            res['pic'] = pic
+        return res
+
+if __name__ == "__main__":
+    # check on a local socket, the server sends a binary block after the
+    # answer line of a photo request
+    import asyncio
+    import io
+    from measureunit import MeasureUnit
+    from asynctcpiface import AsyncTCPIface
+
+    PHOTO = bytes(range(256)) * 40
+
+    class PhotoUnit(MeasureUnit):
+        """ measure unit answering size of photo """
+
+        @staticmethod
+        def TakePhotoMsg():
+            """ photo request """
+            return 'PHOTO'
+
+        @staticmethod
+        def AngleMsg():
+            """ line request """
+            return 'ANGLE'
+
+        def Result(self, msgs, anss):
+            """ parse answer """
+            key, val = anss.split(':')
+            return {key: int(val)}
+
+    async def Serve(reader, writer):
+        """ answer requests """
+        while True:
+            line = await reader.readline()
+            if not line:
+                break
+            if line.strip() == b'PHOTO':
+                writer.write(b'binsize:%d\n' % len(PHOTO) + PHOTO)
+            else:
+                writer.write(b'hz:1\n')
+            await writer.drain()
+        writer.close()
+
+    async def main():
+        """ run the checks """
+        server = await asyncio.start_server(Serve, '127.0.0.1', 0)
+        port = server.sockets[0].getsockname()[1]
+        iface = AsyncTCPIface('photo', ('127.0.0.1', port), timeout=2)
+        await iface.Open()
+        ins = AsyncInstrument('photo', PhotoUnit(), iface)
+        pic = io.BytesIO()
+        res = await ins._process(PhotoUnit.TakePhotoMsg(), pic)
+        print("photo to file: %s, same bytes %s" %
+              (res.get('pic') is pic, pic.getvalue() == PHOTO))
+        res = await ins._process(PhotoUnit.TakePhotoMsg())
+        print("photo returned: %s" % (res == PHOTO))
+        print("line after photo: %s" %
+              await ins._process(PhotoUnit.AngleMsg()))
+        await iface.Close()
+        server.close()
+        await server.wait_closed()
+
+    asyncio.run(main())
@@ -0,0 +1,151 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+"""
+.. module:: asyncserialiface.py
+   :platform: Unix
+   :synopsis: Ulyxes - an open source project to drive total stations and
+       publish observation results. GPL v2.0 license Copyright (C)
+       2010- Zoltan Siki <siki.zoltan@epito.bme.hu>.
+
+.. moduleauthor:: Zoltan Siki <siki.zoltan@epito.bme.hu>
+"""
+
+import asyncio
+import logging
+import serial
+from asynciface import AsyncIface
+
+class AsyncSerialIface(AsyncIface):
+    """ Asyncio interface to communicate through serial line. The port is
+        configured by pyserial, reading is done by the event loop on the
+        file descriptor of the port (Unix only). Open must be awaited
+        before use.
+
+            :param name: name of serial interface (str)
+            :param port: port name e.g. /dev/ttyUSB0
+            :param baud: communication speed (int), default 9600
+            :param byteSize: byte size in communication (int), default 8
+            :param parity: parity of bytes even/odd/none, default none
+            :param stop: number of stop bits (int), default 1
+            :param timeout: communication timeout seconds (int), default 17
+            :param eomRead: end of message char from instrument (str), default '\\r\\n'
+            :param eomWrite: end of message char from computer (str), default '\\r\\n'
+    """
+
+    def __init__(self, name, port, baud=9600, byteSize=8,
+                 parity=serial.PARITY_NONE, stop=1, timeout=17,
+                 eomRead='\r\n', eomWrite='\r\n'):
+        """ Constructor for async serial interface
+        """
+        super().__init__(name, timeout, eomRead, eomWrite)
+        self.port = port
+        self.baud = baud
+        self.byteSize = byteSize
+        self.parity = parity
+        self.stop = stop
+        self.ser = None
+        self.transport = None
+
+    async def Open(self):
+        """ Open serial line and attach it to the running event loop
+        """
+        loop = asyncio.get_running_loop()
+        try:
+            self.ser = serial.Serial(self.port, self.baud, self.byteSize,
+                                     self.parity, self.stop, timeout=0)
+            self.reader = asyncio.StreamReader()
+            self.transport, _ = await loop.connect_read_pipe(
+                lambda: asyncio.StreamReaderProtocol(self.reader), self.ser)
+            self.opened = True
+            self.state = self.IF_OK
+        except Exception:
+            self.opened = False
+            self.state = self.IF_ERROR
+            logging.error(" cannot open serial line")
+
+    async def Close(self):
+        """ Close serial line
+        """
+        if self.transport is not None:
+            # transport closes the serial port
+            self.transport.close()
+            self.transport = None
+        self.reader = None
+        self.ser = None
+        self.opened = False
+
+    async def Write(self, data):
+        """ Write bytes to the serial line
+
+            :param data: bytes to send
+        """
+        # pyserial write blocks until the data is taken by the driver
+        await asyncio.get_running_loop().run_in_executor(None, self.ser.write,
+                                                         data)
+
+if __name__ == "__main__":
+    # check on a pseudo terminal, the instrument at the other end answers
+    # each line and reads slowly, the event loop must not stall while a
+    # large block is written
+    import os
+    import threading
+    import time
+
+    def Instrument(fd, delay):
+        """ answer lines on the master side of the pty """
+        buf = b''
+        while True:
+            try:
+                data = os.read(fd, 4096)
+            except OSError:
+                return
+            if not data:
+                return
+            buf += data
+            while b'\r\n' in buf:
+                line, buf = buf.split(b'\r\n', 1)
+                if line and not line.startswith(b'x'):
+                    os.write(fd, b'ok:' + line + b'\r\n')
+            if len(buf) > 100:
+                buf = buf.lstrip(b'x')
+                time.sleep(delay)  # slow reader of large blocks
+
+    async def Ticker(gaps):
+        """ record the largest delay of the event loop """
+        last = time.monotonic()
+        while True:
+            await asyncio.sleep(0.01)
+            t = time.monotonic()
+            gaps.append(t - last)
+            last = t
+
+    async def main():
+        """ run the checks """
+        master, slave = os.openpty()
+        threading.Thread(target=Instrument, args=(master, 0.05),
+                         daemon=True).start()
+        iface = AsyncSerialIface('pty', os.ttyname(slave), 115200, timeout=2)
+        await iface.Open()
+        print("opened: %s" % iface.opened)
+        ans = await asyncio.gather(*[iface.Send('line%d' % i)
+                                     for i in range(20)])
+        print("answers in order: %s" %
+              (ans == ['ok:line%d' % i for i in range(20)]))
+        print("multipart: %s" % await iface.Send('a|b'))
+        gaps = []
+        tick = asyncio.ensure_future(Ticker(gaps))
+        await asyncio.sleep(0.05)
+        del gaps[:]
+        start = time.monotonic()
+        await iface.Write(b'x' * 65536 + b'\r\n')
+        dt = time.monotonic() - start
+        print("large block written in %.2f s, largest loop gap %.3f s" %
+              (dt, max(gaps, default=dt)))
+        tick.cancel()
+        print("after large block: %s" % await iface.Send('last'))
+        await iface.Close()
+        os.close(slave)
+        os.close(master)
+
+    logging.basicConfig()
+    asyncio.run(main())
@@ -0,0 +1,69 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+"""
+.. module:: asynctcpiface.py
+   :platform: Unix, Windows
+   :synopsis: Ulyxes - an open source project to drive total stations and
+       publish observation results. GPL v2.0 license Copyright (C)
+       2010- Zoltan Siki <siki.zoltan@epito.bme.hu>.
+
+.. moduleauthor:: Zoltan Siki <siki.zoltan@epito.bme.hu>
+"""
+
+import asyncio
+import logging
+from asynciface import AsyncIface
+
+class AsyncTCPIface(AsyncIface):
+    """ Asyncio interface to communicate on TCP/IP protocol (e.g. NMEA stream
+        from a GNSS receiver or a serial to ethernet converter). Open must be
+        awaited before use.
+
+        :param name: name of tcp interface (str)
+        :param address: address of server (tuple) (ip(str), port(int))
+        :param timeout: communication timeout seconds (int), default 15
+        :param eomRead: end of message char from server (str), default '\\n'
+        :param eomWrite: end of message char to server (str), default '\\n'
+    """
+
+    def __init__(self, name, address, timeout=15, eomRead='\n', eomWrite='\n'):
+        """ Constructor for async TCP socket interface
+        """
+        super().__init__(name, timeout, eomRead, eomWrite)
+        self.address = address
+
+    async def Open(self):
+        """ Open TCP connection
+        """
+        try:
+            self.reader, self.writer = await asyncio.wait_for(
+                asyncio.open_connection(*self.address), self.timeout)
+            self.opened = True
+            self.state = self.IF_OK
+        except Exception:
+            self.opened = False
+            self.state = self.IF_ERROR
+            logging.error(" cannot open TCP socket")
+
+    async def GetLine(self, fileSize=None):
+        """ read a line or a binary block from the TCP connection
+
+            :param fileSize: the size of the expected binary data (int), default None read a line
+            :returns: line read (str) or binary data (bytes)
+        """
+        if fileSize is None:
+            return await super().GetLine()
+        if self.reader is None or self.state != self.IF_OK:
+            logging.error(" TCP socket not opened")
+            return None
+        try:
+            return await asyncio.wait_for(self.reader.readexactly(fileSize),
+                                          self.timeout)
+        except asyncio.TimeoutError:
+            self.state = self.IF_TIMEOUT
+            logging.error(" timeout on TCP socket")
+        except asyncio.IncompleteReadError as e:
+            self.state = self.IF_EOF
+            logging.error(" end of stream on TCP socket")
+            return e.partial
+        return b''
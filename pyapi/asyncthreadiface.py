@@ -0,0 +1,91 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+"""
+.. module:: asyncthreadiface.py
+   :platform: Unix, Windows
+   :synopsis: Ulyxes - an open source project to drive total stations and
+       publish observation results. GPL v2.0 license Copyright (C)
+       2010- Zoltan Siki <siki.zoltan@epito.bme.hu>.
+
+.. moduleauthor:: Zoltan Siki <siki.zoltan@epito.bme.hu>
+"""
+
+import asyncio
+from asynciface import AsyncIface
+
+class AsyncThreadIface(AsyncIface):
+    """ Asyncio wrapper around a blocking interface (e.g. BluetoothIface,
+        WebIface, I2CIface, LocalIface). Blocking calls run in the default
+        executor of the event loop, calls to the same interface are
+        serialized. The state of the wrapper is passed to the wrapped
+        interface before each call and copied back after it.
+
+        :param iface: blocking interface to wrap (Iface)
+        :param name: name of the interface (str), default name of the wrapped interface
+    """
+
+    def __init__(self, iface, name=None):
+        """ Constructor
+        """
+        self.iface = iface
+        super().__init__(name if name is not None else iface.GetName(),
+                         eomRead=getattr(iface, 'eomRead', '\r\n'),
+                         eomWrite=getattr(iface, 'eomWrite', '\r\n'))
+        self.state = iface.state
+        self.opened = True
+
+    @property
+    def eomRead(self):
+        """ end of message marker of the wrapped interface """
+        return getattr(self.iface, 'eomRead', None)
+
+    @eomRead.setter
+    def eomRead(self, value):
+        if hasattr(self.iface, 'eomRead'):
+            self.iface.eomRead = value
+
+    async def _call(self, func, *args):
+        """ call a blocking function of the wrapped interface in the executor
+
+            :param func: function to call
+            :param args: positional parameters to the function
+            :returns: the result of the function
+        """
+        if self.lock is None:
+            self.lock = asyncio.Lock()
+        async with self.lock:
+            loop = asyncio.get_running_loop()
+            self.iface.state = self.state   # state may be cleared by caller
+            res = await loop.run_in_executor(None, func, *args)
+            self.state = self.iface.state
+            return res
+
+    async def Close(self):
+        """ Close the wrapped interface if it has a Close method
+        """
+        if hasattr(self.iface, 'Close'):
+            await self._call(self.iface.Close)
+        self.opened = False
+
+    async def GetLine(self, *args):
+        """ read a line from the wrapped interface
+
+            :returns: line read
+        """
+        return await self._call(self.iface.GetLine, *args)
+
+    async def PutLine(self, msg):
+        """ send message through the wrapped interface
+
+            :param msg: message to send (str)
+            :returns: 0 - on OK, -1 on error
+        """
+        return await self._call(self.iface.PutLine, msg)
+
+    async def Send(self, msg):
+        """ send message through the wrapped interface and read answer
+
+            :param msg: message to send
+            :returns: answer from the wrapped interface
+        """
+        return await self._call(self.iface.Send, msg)
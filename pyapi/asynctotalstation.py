@@ -0,0 +1,166 @@
+#!/usr/bin/env python
+"""
+.. module:: asynctotalstation.py
+   :platform: Unix, Windows
+   :synopsis: Ulyxes - an open source project to drive total stations and
+       publish observation results.  GPL v2.0 license Copyright (C)
+       2010- Zoltan Siki <siki.zoltan@epito.bme.hu>
+
+.. moduleauthor:: Zoltan Siki <siki.zoltan@epito.bme.hu>
+"""
+import logging
+import asyncio
+from asyncinstrument import AsyncInstrument
+from totalstation import TotalStation
+from angle import Angle
+from trimble5500 import Trimble5500
+
+class AsyncTotalStation(AsyncInstrument, TotalStation):
+    """ Total station driven from an asyncio event loop, all methods of
+        TotalStation are coroutines (must be awaited)
+
+            :param name: name of instrument
+            :param measureUnit: measure unit part of instrument
+            :param measureIface: asyncio interface to physical unit (AsyncIface)
+            :param writerUnit: store data, default None
+    """
+
+    async def _process(self, msg, pic=None):
+        """ Send message to measure unit and process answer, the settings
+            are forgotten after communication errors
+
+            :param msg: message to send
+            :param pic: when using a camera you have tive give writable binary file
+            :returns: parsed answer (dictionary)
+        """
+        res = await super()._process(msg, pic)
+        if self.measureIface.state != self.measureIface.IF_OK:
+            self.ClearShadow()
+        return res
+
+    async def _Set(self, key, value, msg):
+        """ Send a setting unless the instrument has the same value
+
+            :param key: name of the setting
+            :param value: value of the setting (comparable)
+            :param msg: message to send
+            :returns: processed answer from instrument or empty dictionary if not sent
+        """
+        if self.shadow is not None and key in self.shadow and \
+           self.shadow[key] == value:
+            self.savedTrips += 1
+            return {}
+        res = await self._process(msg)
+        self._Confirm(key, value, res)
+        return res
+
+    async def SetOri(self, ori):
+        """ Set orientation
+
+            :param ori: bearing to direction (Angle)
+            :returns: empty dictionary
+        """
+        # clear previous distance measured
+        ans = await self.Measure('CLEAR')
+        if 'errCode' in ans:
+            return ans
+        msg = self.measureUnit.SetOriMsg(ori)
+        return await self._process(msg)
+
+    async def GetMeasure(self, wait=15000, incl=0):
+        """ Get measured values
+
+            :param wait: waiting time in ms
+            :param inc: inclination ...
+            :returns: observations in a dictionary
+        """
+        msg = self.measureUnit.GetMeasureMsg(wait, incl)
+        i = 0
+        meas = await self._process(msg)
+        if isinstance(self.measureUnit, Trimble5500):
+            while 'distance' not in meas and i < 20:   # wait for trimble 5500
+                i += 1
+                await asyncio.sleep(2)
+                meas = await self._process(msg)
+        return meas
+
+    async def ChangeFace(self):
+        """ Change face
+
+            :returns: empty dictionary
+        """
+        msg = self.measureUnit.ChangeFaceMsg()
+        if msg is None:
+            angles = await self.GetAngles()
+            angles['hz'] += Angle(180, 'DEG')
+            angles['v'] = Angle(360, 'DEG') - angles['v']
+            return await self.Move(angles['hz'], angles['v'])
+        return await self._process(msg)
+
+    async def SetSearchArea(self, hzCenter=None, vCenter=None, \
+                            hzRange=None, vRange=None, on=1):
+        """ Set range for power search
+
+            :param hzCenter: center direction (Angle)
+            :param vCenter: center direction (Angle)
+            :param hzRange: horizontal range to search (default full circle) (Angle)
+            :param vRange: vertical range to search (default 95 degree) (Angle)
+            :param on: 0/1 off/on
+        """
+        if hzCenter is None or vCenter is None:
+            angles = await self.GetAngles()
+            if hzCenter is None:
+                hzCenter = angles['hz']
+            if vCenter is None:
+                vCenter = angles['v']
+            if hzRange is None:
+                hzRange = Angle(399.9999, 'GON')
+            if vRange is None:
+                vRange = Angle(95, 'DEG')
+        msg = self.measureUnit.SetSearchAreaMsg(hzCenter, vCenter, hzRange,
+                                                vRange, on)
+        return await self._process(msg)
+
+    async def GetFace(self):
+        """ Get face left or face right
+
+            :returns: 0/1 face left/face right in a dictionary or None in case of error
+        """
+        a = await self.GetAngles()
+        if 'v' in a:
+            if a['v'].GetAngle('GON') < 200:
+                face = self.FACE_LEFT
+            else:
+                face = self.FACE_RIGHT
+            return {'face': face}
+        logging.error(" Getangles failed")
+        return None
+
+    async def MoveRel(self, hz_rel, v_rel, atr=0):
+        """ Rotate the instrument relative to actual direction
+
+            :param hz_rel: relative horizontal rotation (Angle)
+            :param v_rel: relative zenith rotation (Angle)
+            :param atr: 0/1 atr on/off
+        """
+        #get the actual direction
+        msg = self.measureUnit.GetAnglesMsg()
+        res = await self._process(msg)
+        if 'hz' in res and 'v' in res:
+            return await self.Move(res['hz'] + hz_rel, res['v'] + v_rel, atr)
+        return None
+
+if __name__ == "__main__":
+    from asyncserialiface import AsyncSerialIface
+    from leicatps1200 import LeicaTPS1200
+
+    async def main():
+        """ read angles from a TPS1200 """
+        iface = AsyncSerialIface("rs-232", "/dev/ttyUSB0")
+        await iface.Open()
+        ts = AsyncTotalStation("Leica", LeicaTPS1200(), iface)
+        print(await ts.GetAngles())
+        await iface.Close()
+
+    logging.getLogger().setLevel(logging.DEBUG)
+    asyncio.run(main())
@@ -0,0 +1,71 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+"""
+.. module:: asyncwebmet.py
+   :platform: Unix, Windows
+   :synopsis: Ulyxes - an open source project to drive total stations and
+       publish observation results.  GPL v2.0 license Copyright (C)
+       2010- Zoltan Siki <siki.zoltan@epito.bme.hu>.
+
+.. moduleauthor:: Zoltan Siki <siki.zoltan@epito.bme.hu>
+
+"""
+
+from asyncinstrument import AsyncInstrument
+from webmet import WebMet
+
+class AsyncWebMet(AsyncInstrument, WebMet):
+    """ Get meteorological data from the Internet in an asyncio event loop.
+        Use an AsyncThreadIface around a WebIface as interface.
+
+            :param name: name of sensor (str)
+            :param measureUnit: measure unit of the sensor (MeasureUnit)
+            :param MeasureIface: asyncio interface (AsyncIface)
+            :param writerUnit: unit to save observed data (Writer), optional
+    """
+
+    async def GetTemp(self):
+        """ Get temperature from sensor
+
+            :returns: temperature data as dict
+        """
+        msg = self.measureUnit.GetTempMsg()
+        res = await self._process(msg)
+        if res is not None and 'temp' in res:
+            res['temp'] = res['temp'] - 273.1
+        return res
+
+    async def GetPressure(self, withTemp=0):
+        """ Get pressure in HPa from sensor
+
+            :param withTemp: dummy parameter for inherited classes
+            :returns: temperature data as dict
+        """
+        return await self.GetTemp()
+
+    async def GetHumi(self):
+        """ Get humidity from sensor
+
+            :returns: temperature data as dict
+        """
+        return await self.GetTemp()
+
+    async def SetSealevel(self, altitude, pressure=None):
+        """ calculate sealevel pressure from known elevation and pressure
+
+            :param altitude: known elevation (float) meters
+            :param pressure: know pressure at elevation, default None means get the pressure from sensor
+        """
+        if pressure is None:
+            pressure = (await self.GetPressure(1))['pressure'] * 100.0
+        self.p0 = pressure / pow(1.0 - altitude / 44330.0, 5.255)
+
+    async def GetAltitude(self):
+        """ calculate altitude from sealevel pressure
+
+            :returns: altitude
+        """
+        if self.p0 is None:
+            return None    # no reference pressure
+        pressure = (await self.GetPressure())['pressure'] * 100
+        return 44330.0 * (1.0 - pow(pressure / self.p0, (1.0 / 5.255)))
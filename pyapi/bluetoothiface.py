@@ -26,6 +26,7 @@ import time
 import logging
 import bluetooth
 from iface import Iface
+from linebuffer import LineBuffer
 
 class BluetoothIface(Iface):
     """ Interface to communicate through bluetooth interfacei as a client.
@@ -49,6 +50,7 @@ class BluetoothIface(Iface):
         self.eomRead = eomRead
         self.eomWrite = eomWrite
         self.socket = None
+        self.buffer = LineBuffer(1024)
         self.Open()
 
     def __del__(self):
@@ -61,6 +63,7 @@ class BluetoothIface(Iface):
         """ Open bluetooth communication
         """
         self.socket = bluetooth.BluetoothSocket(bluetooth.RFCOMM)
+        self.buffer.Clear()
         try:
             self.socket.connect((self.mac, self.port))
         except Exception:
@@ -82,25 +85,21 @@ class BluetoothIface(Iface):
         if self.socket is None or self.state != self.IF_OK:
             logging.error(" bluetooth connection not opened or in error state")
             return None
-        # read answer till end of message marker
-        ans = ''
-        w = -1 * len(self.eomRead)
-        while ans[w:] != self.eomRead:
-            ch = ''
-            try:
-                ch = (self.socket.recv(1)).decode('ascii')
-            except Exception:
-                self.state = self.IF_READ
-                logging.error(" cannot read bluetooth connection")
-                break
-            if ch == '':
-                # timeout exit loop
-                self.state = self.IF_TIMEOUT
-                logging.error(" timeout on bluetooth")
-                break
-            ans += ch
-        # remove end of line
+        # read answer till end of message marker, bytes after the marker
+        # are kept in the buffer for the next call
+        try:
+            ans, complete = self.buffer.ReadLine(self.socket.recv, self.eomRead)
+        except Exception:
+            ans, complete = self.buffer.Flush(), True
+            self.state = self.IF_READ
+            logging.error(" cannot read bluetooth connection")
+        if not complete:
+            # timeout
+            self.state = self.IF_TIMEOUT
+            logging.error(" timeout on bluetooth")
+        ans = ans.decode('ascii', 'ignore')
         logging.debug(" message got: %s", ans)
+        # remove end of line
         ans = ans.strip(self.eomRead)
         return ans
 
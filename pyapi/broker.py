@@ -0,0 +1,393 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+"""
+.. module:: broker.py
+   :platform: Unix, Windows
+   :synopsis: Ulyxes - an open source project to drive total stations and
+       publish observation results. GPL v2.0 license Copyright (C)
+       2010- Zoltan Siki <siki.zoltan@epito.bme.hu>.
+
+.. moduleauthor:: Zoltan Siki <siki.zoltan@epito.bme.hu>
+
+Share one instrument among threads and local processes. The broker owns the
+interface, requests are executed one by one in priority order (multipart
+messages are not split), so GeoCOM frames of different clients are never
+interleaved. Use BrokerIface as the interface of an instrument::
+
+    broker = Broker(SerialIface('rs-232', '/dev/ttyUSB0'))
+    ts1 = TotalStation('track', LeicaTPS1200(), BrokerIface('t', broker, Broker.TRACKING))
+    ts2 = TotalStation('mon', LeicaTPS1200(), BrokerIface('m', broker, Broker.MONITORING))
+
+Other processes can reach the broker after Serve, see Broker.Connect. The
+connection is authenticated by a random key generated by Serve, the key has
+to be passed to the clients (e.g. in the ULYXES_BROKER_KEY environment
+variable or in a key file readable by the owner only).
+A client can lock the broker for a sequence of requests (e.g. Move,
+Measure, GetMeasure), the requests of other clients wait until it is
+unlocked or the lease of the lock expires.
+"""
+
+import os
+import time
+import logging
+import functools
+import itertools
+import threading
+from multiprocessing.managers import BaseManager
+from latencystats import LatencyStats
+
+class BrokerRequest(object):
+    """ Request waiting in the queue of the broker
+
+            :param msg: message to send (str) or job called with the interface (callable)
+            :param priority: priority, smaller first (int)
+            :param deadline: monotonic time the request must be started before, None for no deadline
+            :param owner: id of the client for locks (str), default None
+    """
+
+    def __init__(self, msg, priority, deadline=None, owner=None):
+        """ Constructor
+        """
+        self.msg = msg
+        self.priority = priority
+        self.deadline = deadline
+        self.owner = owner
+        self.submitted = time.monotonic()
+        self.started = None
+        self.answer = None
+        self.state = None       # state of the interface after the request
+        self.cancelled = False
+        self.event = threading.Event()
+        self.lock = threading.Lock()
+        self.callbacks = []
+
+    def Cancel(self):
+        """ Cancel the request if it is not started yet
+
+            :returns: True if cancelled
+        """
+        with self.lock:
+            if self.started is None:
+                self.cancelled = True
+            return self.cancelled
+
+    def Done(self):
+        """ Is the request finished (answered, cancelled or expired)
+
+            :returns: True/False
+        """
+        return self.event.is_set()
+
+    def Wait(self, timeout=None):
+        """ Wait for the answer
+
+            :param timeout: maximal time to wait in seconds, None for no limit
+            :returns: answer or None if not answered
+        """
+        self.event.wait(timeout)
+        return self.answer
+
+    def AddCallback(self, func):
+        """ Call a function with the request when it is finished, in the
+            thread of the broker or at once if it is already finished
+
+            :param func: function to call
+        """
+        with self.lock:
+            if not self.event.is_set():
+                self.callbacks.append(func)
+                return
+        func(self)
+
+    def _Finish(self):
+        """ Mark the request finished and call the callbacks
+        """
+        with self.lock:
+            self.event.set()
+            callbacks, self.callbacks = self.callbacks, []
+        for func in callbacks:
+            try:
+                func(self)
+            except Exception:
+                logging.error(" broker: callback failed %s", self.msg)
+
+class _BrokerServer(BaseManager):
+    """ manager serving a broker to other processes """
+
+class _BrokerConnection(BaseManager):
+    """ manager connecting to a served broker """
+
+_BrokerConnection.register('GetBroker')
+
+KEY_ENV = 'ULYXES_BROKER_KEY'   # environment variable of the broker key
+
+class Broker(object):
+    """ Serialize the access of several clients to one interface with a
+        priority queue
+
+            :param iface: interface to the instrument (Iface)
+            :param name: name of the broker (str), default 'Broker'
+            :param aging: seconds of waiting which raise the priority of a request by one level, default None (strict priorities, low priority requests may starve)
+    """
+    # priorities, smaller first
+    TRACKING = 0
+    MONITORING = 1
+    HOUSEKEEPING = 2
+
+    def __init__(self, iface, name='Broker', aging=None):
+        """ Constructor
+        """
+        self.iface = iface
+        self.name = name
+        self.aging = aging
+        self.queue = []     # (priority, sequence, request), few clients
+        self.seq = itertools.count()
+        self.cond = threading.Condition()
+        self.stats = LatencyStats(maxCount=None)    # queueing latency by priority
+        self.expired = 0    # requests not started before deadline
+        self.owner = None   # client holding the lock
+        self.lease = 0
+        self.leaseEnd = 0   # monotonic time the lock expires
+        self.running = True
+        self.server = None
+        self.authkey = None     # key of the served broker
+        self.thread = threading.Thread(target=self._Run, daemon=True)
+        self.thread.start()
+
+    def Submit(self, msg, priority=MONITORING, deadline=None, owner=None):
+        """ Queue a request
+
+            :param msg: message to send, it can be multipart message separated by '|' (str) or a job called with the interface in the thread of the broker, its return value is the answer (callable)
+            :param priority: TRACKING/MONITORING/HOUSEKEEPING or other int, smaller first
+            :param deadline: seconds from now the request must be started within, None for no deadline
+            :param owner: id of the client for locks (str), default None
+            :returns: the request (BrokerRequest)
+        """
+        if deadline is not None:
+            deadline = time.monotonic() + deadline
+        req = BrokerRequest(msg, priority, deadline, owner)
+        with self.cond:
+            if not self.running:
+                req.state = self.iface.IF_ERROR
+                req._Finish()
+                logging.error(" broker stopped")
+                return req
+            self.queue.append((priority, next(self.seq), req))
+            self.cond.notify_all()
+        return req
+
+    def Send(self, msg, priority=MONITORING, deadline=None, owner=None):
+        """ Send a message and wait for the answer
+
+            :param msg: message to send (str)
+            :param priority: priority of the request
+            :param deadline: seconds from now the request must be started within
+            :param owner: id of the client for locks (str), default None
+            :returns: answer and state of interface (tuple)
+        """
+        req = self.Submit(msg, priority, deadline, owner)
+        req.Wait()
+        return req.answer, req.state
+
+    def _Locked(self):
+        """ Is the broker locked by a client, called holding cond
+
+            :returns: True/False
+        """
+        return self.owner is not None and time.monotonic() < self.leaseEnd
+
+    def Lock(self, owner, lease=30, timeout=None, priority=MONITORING):
+        """ Lock the broker for the requests of a client, requests of
+            other clients wait until Unlock or until the owner sends no
+            request for lease seconds. The lock is a request in the queue,
+            requests waiting with higher priority are executed before it.
+
+            :param owner: id of the client (str)
+            :param lease: seconds the lock is kept without requests of the owner, default 30
+            :param timeout: seconds to wait for the lock, None for no limit
+            :param priority: priority of the lock request, default MONITORING
+            :returns: True if locked
+        """
+        req = self.Submit(functools.partial(self._Grant, owner, lease),
+                          priority, owner=owner)
+        if not req.event.wait(timeout) and req.Cancel():
+            return False
+        req.Wait()
+        return req.answer is True
+
+    def _Grant(self, owner, lease, iface):
+        """ Lock the broker, job of the lock request
+
+            :param owner: id of the client (str)
+            :param lease: seconds the lock is kept without requests of the owner
+            :param iface: interface of the broker
+            :returns: True
+        """
+        with self.cond:
+            self.owner = owner
+            self.lease = lease
+            self.leaseEnd = time.monotonic() + lease
+        return True
+
+    def Unlock(self, owner):
+        """ Release the lock of a client
+
+            :param owner: id of the client (str)
+        """
+        with self.cond:
+            if self.owner == owner:
+                self.owner = None
+                self.cond.notify_all()
+
+    def Stats(self):
+        """ Queueing latency by priority
+
+            :returns: dictionary of priority: statistics
+        """
+        return self.stats.Stats()
+
+    def Stop(self):
+        """ Stop the broker, waiting requests are cancelled
+        """
+        with self.cond:
+            self.running = False
+            for _, _, req in self.queue:
+                req.cancelled = True
+                req._Finish()
+            self.queue = []
+            self.cond.notify_all()
+        self.thread.join()
+        if self.server is not None:
+            self.server.stop_event.set()
+
+    def _Next(self):
+        """ Remove the next request from the queue, only requests of the
+            owner are taken while the broker is locked
+
+            :returns: request of the highest (aged) priority, the first of equal ones, or None and seconds to wait
+        """
+        now = time.monotonic()
+        queue = self.queue
+        wait = None
+        if self._Locked():
+            queue = [x for x in queue if x[2].owner == self.owner]
+            wait = self.leaseEnd - now
+        if not queue:
+            return None, wait
+        if self.aging:
+            key = lambda x: (x[0] - (now - x[2].submitted) / self.aging, x[1])
+        else:
+            key = lambda x: (x[0], x[1])
+        item = min(queue, key=key)
+        self.queue.remove(item)
+        return item[2], None
+
+    def _Run(self):
+        """ Execute queued requests one by one
+        """
+        while True:
+            with self.cond:
+                while True:
+                    if not self.running:
+                        return
+                    req, wait = self._Next()
+                    if req is not None:
+                        break
+                    self.cond.wait(wait)
+            with req.lock:
+                if not req.cancelled:
+                    req.started = time.monotonic()
+            if req.cancelled:
+                req._Finish()
+                continue
+            if req.deadline is not None and req.started > req.deadline:
+                self.expired += 1
+                req.answer = ''
+                req.state = self.iface.IF_TIMEOUT
+                logging.warning(" broker: deadline missed %s", req.msg)
+                req._Finish()
+                continue
+            self.stats.Record(str(req.priority), req.started - req.submitted)
+            try:
+                if callable(req.msg):
+                    req.answer = req.msg(self.iface)
+                else:
+                    req.answer = self.iface.Send(req.msg)
+                req.state = self.iface.state
+            except Exception:
+                req.answer = ''
+                req.state = self.iface.IF_ERROR
+                logging.error(" broker: send failed %s", req.msg)
+            if self.iface.state != self.iface.IF_OK:
+                # other clients must not inherit the error
+                self.iface.ClearState()
+            if req.owner is not None:
+                with self.cond:
+                    if req.owner == self.owner:
+                        # the lock is kept while the owner is active
+                        self.leaseEnd = time.monotonic() + self.lease
+            req._Finish()
+
+    def Serve(self, address=('127.0.0.1', 0), authkey=None):
+        """ Make the broker available for other processes in a background
+            thread, the clients can run code in this process, keep the key
+            secret
+
+            :param address: address to listen on (host, port) or name of a unix socket
+            :param authkey: authentication key (bytes), default None a random key is generated, see authkey member
+            :returns: address of the server
+        """
+        self.authkey = os.urandom(32) if authkey is None else authkey
+        # registry of a subclass, other brokers are not taken over;
+        # only methods with plain arguments and results are exposed,
+        # requests cannot be pickled
+        server = type('_BrokerServer', (_BrokerServer,), {})
+        server.register('GetBroker', callable=lambda: self,
+                        exposed=('Send', 'Stats', 'Lock', 'Unlock'))
+        self.server = server(address, self.authkey).get_server()
+        threading.Thread(target=self.server.serve_forever, daemon=True).start()
+        return self.server.address
+
+    @staticmethod
+    def AuthKey(keyFile=None):
+        """ Authentication key of a served broker from the
+            ULYXES_BROKER_KEY environment variable or from a key file (hex
+            string)
+
+            :param keyFile: name of key file, default None environment only
+            :returns: key (bytes) or None if not found
+        """
+        key = os.environ.get(KEY_ENV)
+        try:
+            if key is None and keyFile is not None and \
+                    os.path.isfile(keyFile):
+                with open(keyFile) as f:
+                    key = f.read()
+            return None if key is None else bytes.fromhex(key.strip())
+        except Exception:
+            logging.error(" invalid broker key")
+            return None
+
+    @staticmethod
+    def SaveKey(key, keyFile):
+        """ Write the authentication key to a file readable by the owner
+            only
+
+            :param key: authentication key (bytes)
+            :param keyFile: name of key file
+        """
+        fd = os.open(keyFile, os.O_WRONLY | os.O_CREAT | os.O_TRUNC, 0o600)
+        with os.fdopen(fd, 'w') as f:
+            f.write(key.hex())
+
+    @staticmethod
+    def Connect(address, authkey):
+        """ Connect to a broker served by another process
+
+            :param address: address of the server
+            :param authkey: authentication key given to Serve (bytes)
+            :returns: proxy of the broker, Send, Stats, Lock and Unlock can be called
+        """
+        conn = _BrokerConnection(address, authkey)
+        conn.connect()
+        return conn.GetBroker()
@@ -0,0 +1,237 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+"""
+.. module:: brokeriface.py
+   :platform: Unix, Windows
+   :synopsis: Ulyxes - an open source project to drive total stations and
+       publish observation results. GPL v2.0 license Copyright (C)
+       2010- Zoltan Siki <siki.zoltan@epito.bme.hu>.
+
+.. moduleauthor:: Zoltan Siki <siki.zoltan@epito.bme.hu>
+"""
+
+import uuid
+import logging
+from iface import Iface
+from broker import Broker
+
+class BrokerIface(Iface):
+    """ Interface to an instrument shared through a broker
+
+            :param name: name of the interface (str)
+            :param broker: broker or proxy of a broker served by another process (Broker)
+            :param priority: priority of requests Broker.TRACKING/MONITORING/HOUSEKEEPING, default MONITORING
+            :param deadline: seconds the requests must be started within, default None (no deadline)
+    """
+
+    def __init__(self, name, broker, priority=Broker.MONITORING,
+                 deadline=None):
+        """ Constructor
+        """
+        super().__init__(name)
+        self.broker = broker
+        self.priority = priority
+        self.deadline = deadline
+        self.session = uuid.uuid4().hex     # owner id for locks
+        self.opened = True
+
+    def Send(self, msg):
+        """ Send message through the broker and wait for the answer
+
+            :param msg: message to send, it can be multipart message separated by '|' (str)
+            :returns: answer from instrument (str)
+        """
+        if self.state != self.IF_OK:
+            logging.error(" broker interface in error state")
+            return None
+        try:
+            ans, self.state = self.broker.Send(msg, self.priority,
+                                               self.deadline, self.session)
+        except Exception:
+            self.state = self.IF_ERROR
+            logging.error(" cannot reach broker")
+            return None
+        return ans
+
+    def Lock(self, lease=30, timeout=None):
+        """ Lock the instrument for the requests of this interface, e.g.
+            for a Move, Measure, GetMeasure sequence
+
+            :param lease: seconds the lock is kept without requests, default 30
+            :param timeout: seconds to wait for the lock, None for no limit
+            :returns: True if locked
+        """
+        try:
+            return self.broker.Lock(self.session, lease, timeout,
+                                    self.priority)
+        except Exception:
+            logging.error(" cannot reach broker")
+            return False
+
+    def Unlock(self):
+        """ Release the lock of this interface
+        """
+        try:
+            self.broker.Unlock(self.session)
+        except Exception:
+            logging.error(" cannot reach broker")
+
+    def GetLine(self):
+        """ Lines cannot be read without a request through a broker
+
+            :returns: None
+        """
+        logging.error(" GetLine not supported through broker")
+        return None
+
+    def PutLine(self, msg):
+        """ Lines cannot be sent without reading the answer through a
+            broker, the answer is dropped
+
+            :param msg: message to send (str)
+            :returns: 0/-1 OK/error
+        """
+        self.Send(msg)
+        return 0 if self.state == self.IF_OK else -1
+
+def _Housekeeping(address, key, n, res):
+    """ poll the instrument from another process (demo) """
+    from leicatps1200 import LeicaTPS1200
+    from totalstation import TotalStation
+    ts = TotalStation('hk', LeicaTPS1200(),
+                      BrokerIface('hk', Broker.Connect(address, key),
+                                  Broker.HOUSEKEEPING))
+    for _ in range(n):
+        # lock through the proxy
+        ts.measureIface.Lock()
+        if 'intTemp' in ts.GetInternalTemperature() and \
+           'pressure' in ts.GetAtmCorr():
+            res.value += 1
+        ts.measureIface.Unlock()
+
+if __name__ == "__main__":
+    # three clients with different priorities share a simulated instrument
+    # on a pty, answers are checked by GeoCOM transaction ID
+    import os
+    import pty
+    import time
+    import threading
+    import multiprocessing
+    from simiface import SimIface
+    from serialiface import SerialIface
+    from leicatps1200 import LeicaTPS1200
+
+    master, slave = pty.openpty()
+    sim = SimIface(targets=[{'id': '1', 'east': 100.0, 'north': 50.0,
+                             'elev': 10.0}], latency=0.005, baud=115200,
+                   timeScale=0.1, seed=1)
+    threading.Thread(target=sim.Serve, args=(master,), daemon=True).start()
+    broker = Broker(SerialIface('pty', os.ttyname(slave), baud=115200,
+                                timeout=5), aging=0.5)
+    address = broker.Serve()
+    errors = []
+    counts = {}
+
+    def TrId(msg):
+        """ transaction ID of a request or answer """
+        m = SerialIface.trIdRe.match(msg)
+        return m.group(1) if m else None
+
+    def Client(name, priority, msgs, n, pause):
+        """ send tagged requests and check the answers """
+        mu = LeicaTPS1200()
+        iface = BrokerIface(name, broker, priority)
+        counts[name] = 0
+        for _ in range(n):
+            msg = mu.PipelineMsg(msgs)
+            ans = iface.Send(msg)
+            for m, a in zip(msg.split('|'), (ans or '').split('|')):
+                if TrId(m) != TrId(a):
+                    errors.append((name, m, a))
+            counts[name] += 1
+            time.sleep(pause)
+
+    mu = LeicaTPS1200()
+    clients = [
+        threading.Thread(target=Client, args=(
+            'tracking', Broker.TRACKING, [mu.GetAnglesMsg()], 300, 0.002)),
+        threading.Thread(target=Client, args=(
+            'monitoring', Broker.MONITORING,
+            [mu.GetAnglesMsg(), mu.MeasureMsg(), mu.GetMeasureMsg()], 60,
+            0.01)),
+        threading.Thread(target=Client, args=(
+            'housekeeping', Broker.HOUSEKEEPING,
+            [mu.GetInternalTemperatureMsg(), mu.GetAtmCorrMsg()], 30, 0.02))]
+    hk = multiprocessing.Value('i', 0)
+    proc = multiprocessing.Process(target=_Housekeeping,
+                                   args=(address, broker.authkey, 20, hk))
+    t = time.perf_counter()
+    proc.start()
+    for c in clients:
+        c.start()
+    for c in clients:
+        c.join()
+    proc.join()
+    print("%.2f s, requests: %s, other process: %d" %
+          (time.perf_counter() - t, counts, hk.value))
+    print("mismatched answers: %d" % len(errors))
+    names = {'0': 'tracking', '1': 'monitoring', '2': 'housekeeping'}
+    for k, v in broker.Stats().items():
+        print("{:>12s} queued {:4d} p50 {:.4f} s p99 {:.4f} s max {:.4f} s".format(
+            names[k], v['count'], v['p50'], v['p99'], v['max']))
+    broker.Stop()
+    # locked sequence of separate requests is not interleaved with a busy
+    # tracking client
+    order = []
+
+    class Recorder(Iface):
+        """ record the order of requests """
+        def Send(self, msg):
+            order.append(msg)
+            time.sleep(0.0005)
+            return msg
+
+    broker = Broker(Recorder('rec'))
+    running = True
+
+    def Tracker():
+        """ send tracking requests until stopped """
+        iface = BrokerIface('t', broker, Broker.TRACKING)
+        while running:
+            iface.Send('T')
+
+    th = threading.Thread(target=Tracker)
+    th.start()
+    bi = BrokerIface('m', broker)
+    for _ in range(50):
+        bi.Lock()
+        for m in ('MOVE', 'MEASURE', 'GETMEASURE'):
+            bi.Send(m)
+            time.sleep(0.001)
+        bi.Unlock()
+    running = False
+    th.join()
+    broker.Stop()
+    seq = [m for m in order if m != 'T']
+    ok = all(order[i + 1:i + 3] == ['MEASURE', 'GETMEASURE']
+             for i, m in enumerate(order) if m == 'MOVE')
+    print("locked sequences: %d, tracking requests: %d, not interleaved %s" %
+          (len(seq) // 3, len(order) - len(seq), ok))
+    # served brokers are separated, a wrong key is refused
+    class Named(Iface):
+        """ answer the name of the interface """
+        def Send(self, msg):
+            return self.name
+
+    b1, b2 = Broker(Named('b1')), Broker(Named('b2'))
+    a1, a2 = b1.Serve(), b2.Serve()
+    print("own broker: %s" %
+          ([Broker.Connect(a, b.authkey).Send('x')[0]
+            for a, b in ((a1, b1), (a2, b2))] == ['b1', 'b2']))
+    try:
+        Broker.Connect(a1, b2.authkey)
+        print("wrong key refused: False")
+    except Exception:
+        print("wrong key refused: True")
+    b1.Stop()
+    b2.Stop()
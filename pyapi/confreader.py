@@ -19,7 +19,7 @@ class ConfReader(JSONReader):
 
             :param name: name of reader (str), default None
             :param fname: name of input file
-            :param pars: a dictionary for parameter validation e.g. {key : {}}, valid keys for individual config parameters are: required (True/False), type (int/float/str/list)
+            :param pars: a dictionary for parameter validation e.g. {key : {}}, valid keys for individual config parameters are: required (True/False), type (int/float/str/list/file/logfile), keywords (values accepted without type check e.g. ['native'])
     """
 
     def __init__(self, name=None, fname=None, pars=None):
@@ -51,7 +51,8 @@ class ConfReader(JSONReader):
             if self.json[par] is None and pardef['default'] is None:
                 # do not check type for None if it is the default
                 continue
-            if 'type' in pardef:
+            if 'type' in pardef and \
+                self.json[par] not in pardef.get('keywords', []):
                 if pardef['type'] == 'int' and type(self.json[par]) is not int:
                     msg_lst.append(f"type mismatch parameter: {par}")
                     return 'FATAL', msg_lst
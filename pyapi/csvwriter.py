@@ -42,15 +42,6 @@ class CsvWriter(FileWriter):
             except Exception:
                 logging.error(" file write failed")
 
-
-    def __del__(self):
-        """ Destructor
-        """
-        try:
-            self.fp.close()
-        except Exception:
-            pass
-
     def WriteData(self, data):
         """ Write observation data to csv file
 
@@ -59,10 +59,19 @@ class DbWriter(Writer):
         self.table = table
 
     def __del__(self):
-        try:
-            self.conn.close()
-        except Exception:
-            pass
+        """ Destructor
+        """
+        self.Close()
+
+    def Close(self):
+        """ Close the database connection
+        """
+        if getattr(self, 'conn', None) is not None:
+            try:
+                self.conn.close()
+            except Exception:
+                pass
+            self.conn = None
 
     def WriteData(self, data):
         """ Write observation data to db
@@ -0,0 +1,280 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+"""
+.. module:: deformation.py
+   :platform: Unix, Windows
+   :synopsis: Ulyxes - an open source project to drive total stations and
+       publish observation results. GPL v2.0 license Copyright (C)
+       2010- Zoltan Siki <siki.zoltan@epito.bme.hu>.
+
+.. moduleauthor:: Zoltan Siki <siki.zoltan@epito.bme.hu>
+
+Statistical deformation analysis of monitoring coordinates stored epoch by
+epoch (monitoring_coo table). Coordinates are arranged into a
+points x epochs x 3 array, displacement vectors of all points and epochs
+are tested at once. The point test compares the displacement of a point
+to its standard deviation, the congruence test checks all points of an
+epoch together and the points having the largest test values are removed
+until the remaining points are congruent, the removed points are movers.
+Coordinates of different epochs are supposed to be independent and in
+the same datum, the standard deviations of coordinates are given or
+estimated from the scatter of the series.
+"""
+
+import math
+from statistics import NormalDist
+import numpy as np
+from epochs import ParseTimes, Split, ToDatetime
+from dbreader import DbReader
+
+def Chi2(df, probability=0.95):
+    """ Quantile of chi-square distribution, exact for 1 and 2 degrees of
+        freedom, Wilson-Hilferty approximation above
+
+        :param df: degrees of freedom (int or array)
+        :param probability: probability level, default 0.95
+        :returns: quantile (float or array)
+    """
+    df = np.maximum(np.asarray(df, dtype=float), 1.0)
+    z = NormalDist().inv_cdf(probability)
+    z1 = NormalDist().inv_cdf((1.0 + probability) / 2.0)
+    a = 2.0 / (9.0 * df)
+    return np.where(df == 1, z1 * z1,
+                    np.where(df == 2, -2.0 * math.log(1.0 - probability),
+                             df * (1.0 - a + z * np.sqrt(a)) ** 3))
+
+def Fetch(db, ids=None, start=None, end=None):
+    """ Load monitoring coordinates from database ordered by time
+
+        :param db: sqlite file or postgres connection string
+        :param ids: list of point ids, optional default all points
+        :param start: first date (str), optional
+        :param end: last date (str), optional
+        :returns: list of coordinate records
+    """
+    where = []
+    if ids:
+        where.append("id in (" + ",".join(["'%s'" % i for i in ids]) + ")")
+    if start:
+        where.append("datetime >= '%s'" % start)
+    if end:
+        where.append("datetime <= '%s'" % end)
+    sql = "SELECT id, east, north, elev, datetime FROM monitoring_coo" + \
+        ("" if not where else " WHERE " + " and ".join(where)) + \
+        " ORDER BY datetime"
+    return DbReader(db, sql).Load()
+
+def Series(records, delta=1800):
+    """ Arrange coordinate records into epochs, points measured within
+        delta seconds belong to the same epoch, repeated coordinates of a
+        point in an epoch are averaged
+
+        :param records: coordinate records (id, east, north, elev, datetime)
+        :param delta: length of epoch in seconds (a measurement round), default 1800
+        :returns: point ids, start of epochs (datetime64 array) and coordinates (points x epochs x 3 array, NaN if missing)
+    """
+    t = ParseTimes([r['datetime'] for r in records])
+    order = np.argsort(t, kind='stable')
+    t = t[order]
+    starts = np.array([i for i, _ in Split(t, delta)], dtype=int)
+    ep = np.searchsorted(starts, np.arange(len(t)), side='right') - 1
+    ids, pi = np.unique(np.array([str(r['id']) for r in records])[order],
+                        return_inverse=True)
+    pi = pi.ravel()
+    xyz = np.array([[np.nan if r.get(k) is None else r[k]
+                     for k in ('east', 'north', 'elev')] for r in records],
+                   dtype=float).reshape(-1, 3)[order]
+    ok = ~np.isnan(xyz)
+    s = np.zeros((len(ids), len(starts), 3))
+    c = np.zeros((len(ids), len(starts), 3))
+    np.add.at(s, (pi, ep), np.where(ok, xyz, 0.0))
+    np.add.at(c, (pi, ep), ok)
+    with np.errstate(invalid='ignore'):
+        return ids.tolist(), t[starts], s / c
+
+def Std(xyz):
+    """ Robust estimation of standard deviation of coordinates from the
+        differences of consecutive epochs (median absolute deviation)
+
+        :param xyz: coordinates (points x epochs x 3 array)
+        :returns: standard deviations of east, north, elev
+    """
+    dif = np.diff(xyz, axis=1).reshape(-1, 3)
+    res = np.zeros(3)
+    for k in range(3):
+        d = dif[~np.isnan(dif[:, k]), k]
+        if len(d):
+            res[k] = 1.4826 * np.median(np.abs(d - np.median(d))) / \
+                math.sqrt(2.0)
+    return res
+
+class Deformation(object):
+    """ Displacements and their tests between epochs
+
+            :param ids: point ids
+            :param t: start of epochs (datetime64 array)
+            :param xyz: coordinates (points x epochs x 3 array, NaN if missing)
+            :param std: standard deviations of east, north, elev in metres, optional default estimated from the series
+            :param probability: probability level of tests, default 0.95
+            :param dims: coordinates to test, 0/1/2 for east/north/elev, default all
+    """
+
+    def __init__(self, ids, t, xyz, std=None, probability=0.95,
+                 dims=(0, 1, 2)):
+        """ Constructor
+        """
+        self.ids = list(ids)
+        self.t = np.asarray(t)
+        self.xyz = np.asarray(xyz, dtype=float)
+        self.std = Std(self.xyz) if std is None else \
+            np.broadcast_to(np.asarray(std, dtype=float), (3,)).copy()
+        self.probability = probability
+        self.dims = list(dims)
+
+    def Displacement(self, i, j):
+        """ Displacement vectors of all points between epochs
+
+            :param i: reference epoch (int)
+            :param j: epoch or epochs (int or array)
+            :returns: displacements (points x 3 or points x epochs x 3) and their standard deviations (east, north, elev)
+        """
+        ref = self.xyz[:, i]
+        if np.ndim(j):
+            ref = ref[:, None]
+        return self.xyz[:, j] - ref, self.std * math.sqrt(2.0)
+
+    def PointTest(self, i, j):
+        """ Test displacement of each point
+
+            :param i: reference epoch (int)
+            :param j: epoch or epochs (int or array)
+            :returns: test values (chi-square, NaN if missing) and significant displacements (bool), points or points x epochs arrays
+        """
+        d, sd = self.Displacement(i, j)
+        tst = np.sum((d[..., self.dims] / sd[self.dims]) ** 2, axis=-1)
+        with np.errstate(invalid='ignore'):
+            return tst, tst > Chi2(len(self.dims), self.probability)
+
+    def Congruence(self, i, j):
+        """ Congruence test of all points between epochs, the point with
+            the largest test value is removed until the remaining points
+            are congruent and the largest point test value is under the
+            limit corrected for the number of points (a single mover is
+            hidden in the global test of many points), epochs are
+            processed together
+
+            :param i: reference epoch (int)
+            :param j: epoch or epochs (int or array)
+            :returns: movers (bool) and global test values of the congruent points, points or points x epochs and epochs arrays
+        """
+        tst, _ = self.PointTest(i, j)
+        shape = tst.shape
+        tst = tst.reshape(len(self.ids), -1)
+        active = ~np.isnan(tst)
+        moved = np.zeros(tst.shape, dtype=bool)
+        cols = np.arange(tst.shape[1])
+        # limit of the largest point test value, Bonferroni correction
+        limit = Chi2(len(self.dims),
+                     1.0 - (1.0 - self.probability) / len(self.ids))
+        while True:
+            omega = np.where(active, tst, 0.0).sum(axis=0)
+            df = len(self.dims) * active.sum(axis=0)
+            big = np.where(active, tst, -np.inf)
+            fail = ((df > 0) & (omega > Chi2(df, self.probability))) | \
+                (big.max(axis=0) > limit)
+            if not np.any(fail):
+                break
+            k = np.argmax(big, axis=0)
+            moved[k[fail], cols[fail]] = True
+            active[k[fail], cols[fail]] = False
+        return moved.reshape(shape), omega.reshape(shape[1:])
+
+    def Movers(self, ref=0, persist=3):
+        """ Points moved in the series compared to the reference epoch, a
+            point is a mover if the congruence test removes it in persist
+            consecutive epochs
+
+            :param ref: index of reference epoch, default 0
+            :param persist: number of consecutive epochs, default 3
+            :returns: list of movers, id, start of first epoch of movement, displacement in the last epoch (east, north, elev) and its test value
+        """
+        j = np.arange(len(self.t))
+        moved, _ = self.Congruence(ref, j)
+        moved[:, :ref + 1] = False
+        if moved.shape[1] < persist:
+            return []
+        run = np.lib.stride_tricks.sliding_window_view(moved, persist,
+                                                       axis=1).all(axis=-1)
+        d, _ = self.Displacement(ref, j)
+        tst, _ = self.PointTest(ref, j)
+        res = []
+        for p in np.flatnonzero(run.any(axis=1)):
+            last = np.flatnonzero(~np.isnan(tst[p]))[-1]
+            res.append({'id': self.ids[p],
+                        'datetime': ToDatetime(self.t[np.argmax(run[p])]),
+                        'east': float(d[p, last, 0]),
+                        'north': float(d[p, last, 1]),
+                        'elev': float(d[p, last, 2]),
+                        'test': float(tst[p, last])})
+        return res
+
+if __name__ == "__main__":
+    # deformation analysis of monitoring coordinates
+    #    argv[1]: database (sqlite file or postgres connection), if not
+    #             given a simulated archive is analysed
+    #    argv[2]: probability level, default 0.95
+    import sys
+    import time
+
+    prob = float(sys.argv[2]) if len(sys.argv) > 2 else 0.95
+    if len(sys.argv) > 1:
+        ids, t, xyz = Series(Fetch(sys.argv[1]))
+        d = Deformation(ids, t, xyz, probability=prob)
+        print("%d points, %d epochs, std %s mm" %
+              (len(ids), len(t), np.round(d.std * 1000, 2)))
+        for m in d.Movers():
+            print(m)
+        sys.exit(0)
+    # 300 points, 3 years, 2 epochs a day, linear drifts and jumps
+    rng = np.random.default_rng(7)
+    npt, ne = 300, 3 * 365 * 2
+    t0 = np.datetime64('2020-01-01 06:00:00')
+    sec = (np.arange(ne) * 43200)[None, :] + np.arange(npt)[:, None] * 5
+    base = rng.uniform(0, 500, (npt, 3))
+    xyz = base[:, None, :] + rng.normal(0, 1, (npt, ne, 3)) * \
+        np.array([0.001, 0.001, 0.0015])
+    movers = {}
+    for p in rng.choice(npt, 12, replace=False):
+        start = int(rng.integers(ne // 10, ne // 2))
+        v = rng.normal(0, 1, 3)
+        v *= 0.010 / np.linalg.norm(v)      # 10 mm in a year or jump
+        step = np.arange(ne) >= start
+        if len(movers) % 2:
+            xyz[p] += step[:, None] * v
+        else:
+            xyz[p] += (step * (np.arange(ne) - start) / 730.0)[:, None] * v
+        movers[p] = start
+    miss = rng.random((npt, ne)) < 0.02     # missing measurements
+    recs = [{'id': 'P%03d' % p, 'east': xyz[p, e, 0], 'north': xyz[p, e, 1],
+             'elev': xyz[p, e, 2],
+             'datetime': str(t0 + np.timedelta64(int(sec[p, e]), 's'))}
+            for e in range(ne) for p in range(npt) if not miss[p, e]]
+    print("%d records" % len(recs))
+    tm = time.perf_counter()
+    ids, t, c = Series(recs)
+    t1 = time.perf_counter() - tm
+    tm = time.perf_counter()
+    d = Deformation(ids, t, c, probability=prob)
+    res = d.Movers()
+    t2 = time.perf_counter() - tm
+    print("%d points, %d epochs, series %.2f s, analysis %.2f s, "
+          "std %s mm" % (len(ids), len(t), t1, t2,
+                         np.round(d.std * 1000, 2)))
+    found = {int(m['id'][1:]): m for m in res}
+    for p, start in sorted(movers.items()):
+        m = found.get(p)
+        print("P%03d %-5s start %s detected %s" %
+              (p, 'jump' if list(movers).index(p) % 2 else 'drift',
+               ToDatetime(t[start]), None if m is None else m['datetime']))
+    print("false movers: %s" % [m['id'] for p, m in found.items()
+                                if p not in movers])
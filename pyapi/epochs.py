@@ -0,0 +1,188 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+"""
+.. module:: epochs.py
+   :platform: Unix, Windows
+   :synopsis: Ulyxes - an open source project to drive total stations and
+       publish observation results. GPL v2.0 license Copyright (C)
+       2010- Zoltan Siki <siki.zoltan@epito.bme.hu>.
+
+.. moduleauthor:: Zoltan Siki <siki.zoltan@epito.bme.hu>
+
+Tools to reprocess stored monitoring observations by epochs: observations
+are streamed from a reader in chunks, timestamps are parsed by numpy,
+observations are grouped into epochs and a checkpoint file stores a hash
+of the inputs and the result of each processed epoch, so an interrupted
+or repeated run processes only new or changed epochs.
+"""
+
+import os
+import json
+import hashlib
+import datetime
+import numpy as np
+
+def Stream(reader, start=None, end=None, size=10000):
+    """ Read records from a reader in chunks, records must be ordered by
+        datetime
+
+        :param reader: reader of observations (Reader)
+        :param start: skip records before this time (str), optional
+        :param end: stop at records after this time (str), optional
+        :param size: number of records in a chunk, default 10000
+        :returns: generator of record lists
+    """
+    start = None if start is None else np.datetime64(start, 's')
+    end = None if end is None else np.datetime64(end, 's')
+    chunk = []
+    done = False
+    while not done:
+        w = reader.GetNext() if reader.GetState() == reader.RD_OK else None
+        if w is not None and 'datetime' in w:
+            chunk.append(w)
+        done = w is None or reader.GetState() != reader.RD_OK
+        if chunk and (done or len(chunk) >= size):
+            t = ParseTimes([c['datetime'] for c in chunk])
+            keep = np.ones(len(chunk), dtype=bool)
+            if start is not None:
+                keep &= t >= start
+            if end is not None:
+                keep &= t <= end
+                done = done or t[-1] > end
+            chunk = [c for c, k in zip(chunk, keep) if k]
+            if chunk:
+                yield chunk
+            chunk = []
+
+def ParseTimes(values):
+    """ Convert timestamps to numpy datetime64 in one step
+
+        :param values: datetime objects or strings like '2017-11-17 12:00:00'
+        :returns: array of datetime64[s]
+    """
+    return np.array([str(v) for v in values], dtype='datetime64[s]')
+
+def Split(t, delta=20):
+    """ Group ordered timestamps into epochs, an epoch contains the
+        observations not later than delta seconds from its first one
+
+        :param t: ordered timestamps (datetime64 array)
+        :param delta: length of epoch in seconds, default 20
+        :returns: list of first and last + 1 index of epochs
+    """
+    t = np.asarray(t, dtype='datetime64[s]')
+    res = []
+    i = 0
+    while i < len(t):
+        j = int(np.searchsorted(t, t[i] + np.timedelta64(delta, 's'),
+                                side='right'))
+        res.append((i, j))
+        i = j
+    return res
+
+def ToDatetime(t):
+    """ Convert datetime64 to datetime
+
+        :param t: timestamp (datetime64)
+        :returns: timestamp (datetime)
+    """
+    return t.astype('datetime64[s]').astype(datetime.datetime)
+
+def Key(*items):
+    """ Hash of the inputs of an epoch
+
+        :param items: values to hash, their repr is used
+        :returns: hex digest
+    """
+    h = hashlib.sha1()
+    for item in items:
+        h.update(repr(item).encode('utf-8'))
+    return h.hexdigest()
+
+class Checkpoint(object):
+    """ Keys and results of processed epochs in a JSON file
+
+            :param fname: name of checkpoint file, None for no checkpoint
+            :param config: hash of the processing parameters, if it differs from the stored one all epochs are processed again
+    """
+
+    def __init__(self, fname, config=''):
+        """ Constructor
+        """
+        self.fname = fname
+        self.config = config
+        self.epochs = {}    # epoch -> [key, result]
+        self.last = None    # last completed epoch
+        if fname is not None and os.path.isfile(fname):
+            with open(fname) as f:
+                data = json.load(f)
+            if data.get('config') == config:
+                self.epochs = data.get('epochs', {})
+                self.last = data.get('last')
+
+    def Get(self, epoch, key):
+        """ Stored result of an epoch if its inputs are unchanged
+
+            :param epoch: start of epoch (str)
+            :param key: hash of inputs of epoch
+            :returns: True and result or False and None if epoch must be processed
+        """
+        if epoch in self.epochs and self.epochs[epoch][0] == key:
+            return True, self.epochs[epoch][1]
+        return False, None
+
+    def Set(self, epoch, key, result=None):
+        """ Store a completed epoch
+
+            :param epoch: start of epoch (str)
+            :param key: hash of inputs of epoch
+            :param result: JSON serializable result of epoch
+        """
+        self.epochs[epoch] = [key, result]
+        if self.last is None or epoch > self.last:
+            self.last = epoch
+
+    def Save(self):
+        """ Write checkpoint file, the previous file is replaced after the
+            new one is written
+        """
+        if self.fname is None:
+            return
+        tmp = self.fname + '.tmp'
+        with open(tmp, 'w') as f:
+            json.dump({'config': self.config, 'last': self.last,
+                       'epochs': self.epochs}, f)
+        os.replace(tmp, self.fname)
+
+if __name__ == "__main__":
+    # compare timestamp parsing and epoch grouping to per record code
+    #    argv[1]: number of records, default 200000
+    import sys
+    import time
+
+    n = int(sys.argv[1]) if len(sys.argv) > 1 else 200000
+    rng = np.random.default_rng(1)
+    # rounds of 12 observations every hour
+    sec = np.cumsum(np.where(np.arange(n) % 12 == 0, 3600, rng.integers(1, 3, n)))
+    t0 = np.datetime64('2017-01-01 00:00:00')
+    strs = [str(t0 + np.timedelta64(int(s), 's')).replace('T', ' ') for s in sec]
+    t = time.perf_counter()
+    ref = [datetime.datetime.strptime(s, '%Y-%m-%d %H:%M:%S') for s in strs]
+    epochs_ref = []
+    i = 0
+    delta = datetime.timedelta(seconds=20)
+    while i < n:
+        d = ref[i]
+        j = i
+        while j < n and ref[j] - d <= delta:
+            j += 1
+        epochs_ref.append((i, j))
+        i = j
+    t1 = time.perf_counter() - t
+    t = time.perf_counter()
+    ts = ParseTimes(strs)
+    epochs = Split(ts, 20)
+    t2 = time.perf_counter() - t
+    print("%d records, %d epochs: strptime loop %.2f s, numpy %.2f s, same %s" %
+          (n, len(epochs), t1, t2, epochs == epochs_ref and
+           all(ToDatetime(a) == b for a, b in zip(ts[::1000], ref[::1000]))))
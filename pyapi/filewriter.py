@@ -49,10 +49,18 @@ class FileWriter(Writer):
     def __del__(self):
         """ Destructor
         """
-        try:
-            self.fp.close()
-        except Exception:
-            pass
+        self.Close()
+
+    def Close(self):
+        """ Close the output file, stdout is left open
+        """
+        fp = getattr(self, 'fp', None)
+        if fp is not None and fp is not sys.stdout:
+            try:
+                fp.close()
+            except Exception:
+                pass
+        self.fp = None
 
     def WriteData(self, data):
         """ Write observation data to file
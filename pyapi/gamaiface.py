@@ -13,25 +13,38 @@
 import sys
 import os
 import math
-import re
+import copy
+import hashlib
 import tempfile
 import logging
+import subprocess
+from collections import OrderedDict
 # for XML
 import xml.etree.ElementTree as ET
 
 class GamaIface():
     """ Interface class to GNU Gama
     """
+    # element names in gama-local output
+    POINT_KEYS = {'id': 'id', 'y': 'east', 'x': 'north', 'z': 'elev',
+                  'Y': 'east', 'X': 'north', 'Z': 'elev'}
+    COV_KEYS = ['std_east', 'std_north', 'std_elev', 'std_ori']
+    OBS_TYPES = ('direction', 'slope-distance', 'zenith-angle', 'distance')
+    # results of networks adjusted before, shared by instances
+    cache = OrderedDict()
+    cacheSize = 32
+
     def __init__(self, gama_path, dimension=3, probability=0.95, stdev_angle=1,
-                 stdev_dist=1, stdev_dist1=1.5):
+                 stdev_dist=1, stdev_dist1=1.5, timeout=60):
         """ Initialize a new GamaIface instance.
 
             :param gama_path: path to gama-local program
             :param dimension: dimension of network (int), 1/2/3
             :param probability: porbability for statistical tests (0.9/0.95/0.997) (float)
-            :param stdev_angle: standard deviation for directions in cc (float)
+            :param stdev_angle: standard deviation for directions in arc seconds (float)
             :param stdev_dist: base standard deviation for distances mm (float)
             :param stdev_dist1: standard deviation for distances mm/km (float)
+            :param timeout: seconds to wait for gama-local (float)
         """
         self.dimension = dimension
         # limit probability to 90/95/99.7%
@@ -47,8 +60,11 @@ class GamaIface():
         self.stdev_angle = stdev_angle
         self.stdev_dist = stdev_dist
         self.stdev_dist1 = stdev_dist1
+        self.timeout = timeout
         self.points = []
         self.observations = []
+        self.adjusted = []      # adjusted points
+        self.residuals = []     # observations with residuals
         if not (gama_path.startswith('/') or gama_path.startswith('.')):
             # search path for file
             path = os.getenv('PATH')
@@ -114,13 +130,23 @@ class GamaIface():
         if self.gama_path is None:
             logging.error("GNU gama path is None")
             return (None, None)
+        w = self.xml()
+        if w is None:
+            return (None, None)
+        return self._Run(w)
+
+    def xml(self):
+        """ Export points and observations to GNU Gama xml
+
+            :returns: gama-local xml input (bytes) or None
+        """
         # fix = 0 free network
         fix = sum([1 for p, s in self.points if s == 'FIX'])
         adj = sum([1 for p, s in self.points if s == 'ADJ'])
         if adj == 0 or len(self.observations) < 2:
             # no unknowns or observations
             logging.error("GNU gama no unknowns or not enough observations")
-            return (None, None)
+            return None
 
         gama_local = ET.Element('gama-local', {'version': '2.0'})
         comment = ET.Comment('Gama XML created by Ulyxes')
@@ -138,11 +164,12 @@ class GamaIface():
             {'sigma-apr': '1', 'conf-pr': str(self.probability),
             'tol-abs': '1000', 'sigma-act': 'aposteriori'})
             #'update-constrained-coordinates': 'yes'}) gama 2.10!
+        # arc seconds to cc, 1 cc = 0.324"
         points_observations = ET.SubElement(network, 'points-observations',
             {'distance-stdev': str(self.stdev_dist)+' '+str(self.stdev_dist1),
-            'direction-stdev': str(self.stdev_angle / 3600.0 * 10000.0),
-            'angle-stdev': str(math.sqrt(2)*self.stdev_angle/3600.0*10000),
-            'zenith-angle-stdev': str(self.stdev_angle/3600.0*10000.0)})
+            'direction-stdev': str(self.stdev_angle / 0.324),
+            'angle-stdev': str(math.sqrt(2) * self.stdev_angle / 0.324),
+            'zenith-angle-stdev': str(self.stdev_angle / 0.324)})
         for p, s in self.points:
             attr = {}
             if self.dimension == 1:
@@ -216,7 +243,7 @@ class GamaIface():
                         hd = math.sin(o['v'].GetAngle()) * o['distance']
                         attr['to'] = o['id']
                         attr['val'] = str(hd)
-                        tmp = ET.SubElement(sta, 'direction', attr)
+                        tmp = ET.SubElement(sta, 'distance', attr)
                 elif self.dimension == 1:
                     # elevations only
                     pass
@@ -244,93 +271,170 @@ class GamaIface():
                 else:
                     # unknown dimension
                     logging.error("GNU gama unknown dimension")
-                    return (None, None)
-        # generate temp file name
-        with tempfile.NamedTemporaryFile() as f:
-            tmp_name = f.name
-        w = ET.tostring(gama_local).decode('utf-8')
-        with open(tmp_name + '.xml', 'w') as f:
-            f.write(w)
+                    return None
+        return ET.tostring(gama_local)
 
-        # run gama-local
-        status = os.system(self.gama_path + ' ' + tmp_name + '.xml --text ' +
-                           tmp_name + '.txt --xml ' + tmp_name + 'out.xml ' +
-                           '--cov-band 0')
-        if status != 0:
-            logging.error("GNU gama failed")
-            return (None, None)
+    def _Run(self, w):
+        """ Adjust GNU Gama xml input by gama-local, results are cached
 
-        doc = ET.parse(tmp_name + 'out.xml')
-        root = doc.getroot()
+            :param w: gama-local xml input (bytes)
+            :returns: result list of adjusment and blunder from GNU Gama
+        """
+        key = hashlib.sha1(w + self.gama_path.encode('utf-8')).hexdigest()
+        if key in self.cache:
+            # same network adjusted before
+            self.cache.move_to_end(key)
+            p, blunder, self.adjusted, self.residuals = \
+                copy.deepcopy(self.cache[key])
+            return (p, blunder)
+        # RAM backed temporary directory if available
+        tmp_dir = '/dev/shm' if os.path.isdir('/dev/shm') else None
+        with tempfile.TemporaryDirectory(dir=tmp_dir) as d:
+            with open(os.path.join(d, 'in.xml'), 'wb') as f:
+                f.write(w)
+            # run gama-local, text output to the pipe
+            try:
+                res = subprocess.run([self.gama_path,
+                                      os.path.join(d, 'in.xml'),
+                                      '--xml', os.path.join(d, 'out.xml'),
+                                      '--cov-band', '0'],
+                                     stdout=subprocess.PIPE,
+                                     stderr=subprocess.PIPE,
+                                     timeout=self.timeout)
+            except subprocess.TimeoutExpired:
+                logging.error("GNU gama timeout")
+                return (None, None)
+            except OSError as e:
+                logging.error("GNU gama failed %s", e)
+                return (None, None)
+            if res.returncode != 0 or \
+               not os.path.isfile(os.path.join(d, 'out.xml')):
+                logging.error("GNU gama failed %s",
+                              res.stderr.decode('utf-8', 'ignore').strip())
+                return (None, None)
+            try:
+                p, blunder = self._Parse(os.path.join(d, 'out.xml'))
+            except ET.ParseError:
+                logging.error("GNU gama invalid output")
+                return (None, None)
+        self.cache[key] = copy.deepcopy((p, blunder, self.adjusted,
+                                         self.residuals))
+        if len(self.cache) > self.cacheSize:
+            self.cache.popitem(last=False)
+        return (p, blunder)
 
-        if not root.tag.endswith("gama-local-adjustment"):
-            #return res
-            print("***")
-        root_tag = re.sub('gama-local-adjustment$', '', root.tag)
+    def _Parse(self, source):
+        """ Parse GNU Gama xml output in a single pass, adjusted points and
+            observations are collected into adjusted and residuals
+
+            :param source: name or file object of gama-local xml output
+            :returns: the single adjusted point and blunder
+        """
         p = {}  # the single adjusted point from result
         blunder = {'std-residual': 0}
-        for child in root:
-            if root_tag + "coordinates" == child.tag:
-                for gchild in child:
-                    if root_tag + "adjusted" == gchild.tag:
-                        for ggchild in gchild:
-                            if root_tag + "point" == ggchild.tag:
-                                for pdata in ggchild:
-                                    if root_tag + "id" == pdata.tag:
-                                        p['id'] = pdata.text
-                                    elif root_tag + "y" == pdata.tag:
-                                        p['east'] = float(pdata.text)
-                                    elif root_tag + "x" == pdata.tag:
-                                        p['north'] = float(pdata.text)
-                                    elif root_tag + "z" == pdata.tag:
-                                        p['elev'] = float(pdata.text)
-                    if root_tag + "orientation-shifts" == gchild.tag:
-                        for ggchild in gchild:
-                            if root_tag + "orientation" == ggchild.tag:
-                                for pdata in ggchild:
-                                    if root_tag + "approx" == pdata.tag:
-                                        p['approx_ori'] = float(pdata.text)
-                                    if root_tag + "adj" == pdata.tag:
-                                        p['ori'] = float(pdata.text)
-                    if root_tag + "cov-mat" == gchild.tag:
-                        i = 0
-                        idx = ['std_east', 'std_north', 'std_elev', 'std_ori']
-                        for ggchild in gchild:
-                            if root_tag + "flt" == ggchild.tag:
-                                p[idx[i]] = math.sqrt(float(ggchild.text))
-                                i += 1
-            if root_tag + "observations" == child.tag:
-                for gchild in child:
-                    o = {'std-residual': 0}
-                    if gchild.tag in (root_tag + "direction",
-                                      root_tag + "slope-distance",
-                                      root_tag + "zenith-angle"):
-                        o["type"] = re.sub('^' + root_tag, '', gchild.tag)
-                        for ggchild in gchild:
-                            if root_tag + "from" == ggchild.tag:
-                                o["from"] = ggchild.text
-                            if root_tag + "to" == ggchild.tag:
-                                o["to"] = ggchild.text
-                            if root_tag + "f" == ggchild.tag:
-                                o["f"] = float(ggchild.text)
-                            if root_tag + "std-residual" == ggchild.tag:
-                                o["std-residual"] = float(ggchild.text)
-                    if o['std-residual'] > self.krit and \
-                       o['std-residual'] > blunder['std-residual'] and \
-                       o['f'] > 10:     # extra observations ratio
-                        blunder = o
-
-        # remove input xml and output xml
-        os.remove(tmp_name + '.xml')
-        os.remove(tmp_name + '.txt')
-        os.remove(tmp_name + 'out.xml')
-
+        self.adjusted = []
+        self.residuals = []
+        path = []
+        item = {}
+        i = 0   # index in cov-mat
+        for event, elem in ET.iterparse(source, events=('start', 'end')):
+            tag = elem.tag.rsplit('}', 1)[-1]   # without namespace
+            if event == 'start':
+                path.append(tag)
+                continue
+            path.pop()
+            parent = path[-1] if path else None
+            if parent in ('point', 'orientation') or \
+               (parent in self.OBS_TYPES and path[-2] == 'observations'):
+                item[tag] = elem.text
+            elif tag == 'point' and parent == 'adjusted':
+                pnt = {self.POINT_KEYS[k]: (v if k == 'id' else float(v))
+                       for k, v in item.items() if k in self.POINT_KEYS}
+                self.adjusted.append(pnt)
+                p.update(pnt)
+            elif tag == 'orientation' and parent == 'orientation-shifts':
+                if 'approx' in item:
+                    p['approx_ori'] = float(item['approx'])
+                if 'adj' in item:
+                    p['ori'] = float(item['adj'])
+            elif tag == 'flt' and parent == 'cov-mat' and i < 4:
+                p[self.COV_KEYS[i]] = math.sqrt(float(elem.text))
+                i += 1
+            elif tag in self.OBS_TYPES and parent == 'observations':
+                o = {'type': tag, 'std-residual': 0}
+                for k in ('from', 'to'):
+                    if k in item:
+                        o[k] = item[k]
+                for k in ('f', 'std-residual'):
+                    if k in item:
+                        o[k] = float(item[k])
+                self.residuals.append(o)
+                if o['std-residual'] > self.krit and \
+                   o['std-residual'] > blunder['std-residual'] and \
+                   o.get('f', 0) > 10:     # extra observations ratio
+                    blunder = o
+            if parent not in ('point', 'orientation') and \
+               parent not in self.OBS_TYPES:
+                item = {}
+                elem.clear()
         return (p, blunder)
 
 if __name__ == "__main__":
-    # unit test
+    # unit test, without parameters a stub gama-local is used
+    #    argv[1]: geo/coo file
     from georeader import GeoReader
 
+    if len(sys.argv) == 1:
+        import time
+        from angle import Angle
+        STUB_OUT = """<?xml version="1.0" ?>
+<gama-local-adjustment xmlns="http://www.gnu.org/software/gama/gama-local-adjustment">
+<coordinates>
+<fixed><point><id>2</id><x>200.0</x><y>100.0</y><z>10.0</z></point></fixed>
+<adjusted><point><id>1</id><x>120.0011</x><y>110.0022</y><z>9.9993</z></point></adjusted>
+<orientation-shifts><orientation><id>1</id><approx>12.3400</approx><adj>12.3412</adj></orientation></orientation-shifts>
+<cov-mat><dim>4</dim><band>0</band><flt>0.25</flt><flt>0.36</flt><flt>0.49</flt><flt>4.0</flt></cov-mat>
+</coordinates>
+<observations>
+<direction><from>1</from><to>2</to><obs>10.0</obs><adj>10.0</adj><f>55.1</f><std-residual>0.5</std-residual></direction>
+<slope-distance><from>1</from><to>3</to><obs>80.0</obs><adj>80.01</adj><f>40.0</f><std-residual>3.5</std-residual></slope-distance>
+<zenith-angle><from>1</from><to>4</to><obs>99.0</obs><adj>99.0</adj><f>5.0</f><std-residual>9.0</std-residual></zenith-angle>
+</observations>
+</gama-local-adjustment>
+"""
+        with tempfile.TemporaryDirectory() as d:
+            stub = os.path.join(d, 'gama-local')
+            with open(stub, 'w') as f:
+                f.write("#!" + sys.executable + "\nimport sys, time\n"
+                        "time.sleep(float(open(%r).read()))\n"
+                        "open(sys.argv[sys.argv.index('--xml') + 1], 'w')"
+                        ".write(%r)\n" % (os.path.join(d, 'sleep'), STUB_OUT))
+            os.chmod(stub, 0o755)
+            with open(os.path.join(d, 'sleep'), 'w') as f:
+                f.write('0')
+            g = GamaIface(stub, 3, 0.95, 1, 1, 1.5, timeout=1)
+            g.add_point({'id': '1'}, 'ADJ')
+            for i in range(2, 5):
+                g.add_point({'id': str(i), 'east': 100.0 + i, 'north': 200.0,
+                             'elev': 10.0}, 'FIX')
+            g.add_observation({'station': '1', 'ih': 1.5})
+            for i in range(2, 5):
+                g.add_observation({'id': str(i), 'hz': Angle(i),
+                                   'v': Angle(1.5), 'distance': 80.0})
+            for label in ('stub', 'cached'):
+                t = time.perf_counter()
+                p, blunder = g.adjust()
+                print("%s %.1f ms: %s %s" % (label, (time.perf_counter() - t) *
+                                              1000, p, blunder))
+            print("%d adjusted points, %d observations" %
+                  (len(g.adjusted), len(g.residuals)))
+            with open(os.path.join(d, 'sleep'), 'w') as f:
+                f.write('5')
+            g.stdev_angle = 2   # new network, not cached
+            t = time.perf_counter()
+            print("timeout %s in %.1f s" % (g.adjust(), time.perf_counter() - t))
+        sys.exit(0)
+
     fname = "/home/siki/GeoEasy_old/data/freestation.geo"
     gama_path = '/home/siki/GeoEasy/src/gama-local'
     if len(sys.argv) > 1:
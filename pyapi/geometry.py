@@ -0,0 +1,213 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+"""
+.. module:: geometry.py
+   :platform: Unix, Windows
+   :synopsis: Ulyxes - an open source project to drive total stations and
+       publish observation results. GPL v2.0 license Copyright (C)
+       2010- Zoltan Siki <siki.zoltan@epito.bme.hu>.
+
+.. moduleauthor:: Zoltan Siki <siki.zoltan@epito.bme.hu>
+
+Survey geometry on numpy arrays. Angles are in radians, parameters can be
+scalars, arrays or AngleArray objects of the same length, so a whole target
+list is computed in one call::
+
+    ids, e, n, z = Coords(coords)
+    hz, v, d = Inverse(st['east'], st['north'], st['elev'], e, n, z, ih)
+"""
+
+import numpy as np
+
+PI2 = 2.0 * np.pi
+
+def Coords(coords, keys=('east', 'north', 'elev')):
+    """ Arrays from a list of coordinate dictionaries
+
+        :param coords: list of coordinates (dict)
+        :param keys: coordinate keys, missing values are NaN
+        :returns: list of point ids and arrays of coordinates
+    """
+    ids = [c.get('id') for c in coords]
+    return [ids] + [np.fromiter((c.get(k, np.nan) for c in coords), float,
+                                len(coords)) for k in keys]
+
+def Wrap(angle):
+    """ Move angles into -PI : PI interval
+
+        :param angle: angles (radians)
+        :returns: angles in -PI : PI
+    """
+    return np.mod(np.asarray(angle) + np.pi, PI2) - np.pi
+
+def Bearing(e0, n0, e, n):
+    """ Bearings (whole circle) from station to targets
+
+        :param e0, n0: coordinates of station
+        :param e, n: coordinates of targets
+        :returns: bearings in 0 : 2*PI
+    """
+    return np.mod(np.arctan2(np.subtract(e, e0), np.subtract(n, n0)), PI2)
+
+def Distance(e0, n0, e, n, z0=None, z=None):
+    """ Horizontal distance or spatial distance if elevations given
+
+        :param e0, n0, z0: coordinates of first points
+        :param e, n, z: coordinates of second points
+        :returns: distances
+    """
+    d = np.hypot(np.subtract(e, e0), np.subtract(n, n0))
+    if z0 is not None and z is not None:
+        d = np.hypot(d, np.subtract(z, z0))
+    return d
+
+def DistanceMatrix(e, n, z=None):
+    """ Distances among points in all combination
+
+        :param e, n, z: coordinates of points, z optional
+        :returns: symmetric matrix of distances
+    """
+    e = np.asarray(e, dtype=float)
+    n = np.asarray(n, dtype=float)
+    d2 = (e[:, None] - e) ** 2 + (n[:, None] - n) ** 2
+    if z is not None:
+        z = np.asarray(z, dtype=float)
+        d2 += (z[:, None] - z) ** 2
+    return np.sqrt(d2)
+
+def Reduce(dist, v):
+    """ Horizontal distances and height differences from slope distances
+
+        :param dist: slope distances
+        :param v: zenith angles
+        :returns: horizontal distances and height differences
+    """
+    v = np.asarray(v)
+    return np.multiply(dist, np.sin(v)), np.multiply(dist, np.cos(v))
+
+def Polar(e0, n0, z0, hz, v, dist, ih=0.0, th=0.0):
+    """ Coordinates of targets from polar observations (oriented directions)
+
+        :param e0, n0, z0: coordinates of station
+        :param hz: bearings (oriented horizontal directions)
+        :param v: zenith angles
+        :param dist: slope distances
+        :param ih: instrument height
+        :param th: target heights
+        :returns: east, north, elev of targets
+    """
+    hz = np.asarray(hz)
+    hd, dz = Reduce(dist, v)
+    return e0 + hd * np.sin(hz), n0 + hd * np.cos(hz), \
+        np.add(z0, ih) + dz - th
+
+def Inverse(e0, n0, z0, e, n, z, ih=0.0, th=0.0):
+    """ Polar observations from station to targets
+
+        :param e0, n0, z0: coordinates of station
+        :param e, n, z: coordinates of targets
+        :param ih: instrument height
+        :param th: target heights
+        :returns: bearings (0 : 2*PI), zenith angles, slope distances
+    """
+    de = np.subtract(e, e0)
+    dn = np.subtract(n, n0)
+    dz = np.subtract(z, np.add(z0, ih)) + th
+    hd = np.hypot(de, dn)
+    return np.mod(np.arctan2(de, dn), PI2), np.arctan2(hd, dz), \
+        np.hypot(hd, dz)
+
+def MeanDirection(angles, weights=None, axis=None):
+    """ Weighted mean of directions, directions around 0/2*PI are averaged
+        correctly
+
+        :param angles: directions
+        :param weights: weights of directions, default equal
+        :param axis: axis of average, default all values
+        :returns: mean direction in 0 : 2*PI
+    """
+    angles = np.asarray(angles)
+    w = 1.0 if weights is None else np.asarray(weights)
+    return np.mod(np.arctan2(np.sum(w * np.sin(angles), axis=axis),
+                             np.sum(w * np.cos(angles), axis=axis)), PI2)
+
+def Orientation(hz, bearings, weights=None):
+    """ Orientation angle of station from directions to known points
+
+        :param hz: horizontal directions observed to known points
+        :param bearings: bearings to the same points
+        :param weights: weights, e.g. distances, default equal
+        :returns: orientation angle (0 : 2*PI) and residuals of directions (-PI : PI)
+    """
+    z = np.subtract(bearings, hz)
+    ori = MeanDirection(z, weights)
+    return ori, Wrap(z - ori)
+
+if __name__ == "__main__":
+    # check against the per point code of the applications and compare speed
+    #    argv[1]: number of targets, default 100000
+    import sys
+    import math
+    import time
+    from angle import Angle
+
+    n = int(sys.argv[1]) if len(sys.argv) > 1 else 100000
+    rng = np.random.default_rng(1)
+    e = rng.uniform(-500, 500, n)
+    no = rng.uniform(-500, 500, n)
+    z = rng.uniform(-20, 20, n)
+    st = (10.0, 20.0, 1.5)
+    ih = 1.6
+
+    def InversePoint(e0, n0, z0, e, n, z, ih):
+        """ ObsGen.run """
+        d_north = n - n0
+        d_east = e - e0
+        d_elev = z - z0 - ih
+        bearing = math.atan2(d_east, d_north)
+        dist = math.hypot(d_east, d_north)
+        zenith = math.atan2(dist, d_elev)
+        return Angle(bearing).Positive().GetAngle(), \
+            Angle(zenith).Positive().GetAngle(), math.hypot(dist, d_elev)
+
+    def PolarPoint(e0, n0, z0, hz, v, d, ih):
+        """ Robot.polar """
+        return e0 + d * math.sin(v) * math.sin(hz), \
+            n0 + d * math.sin(v) * math.cos(hz), z0 + ih + d * math.cos(v)
+
+    t = time.perf_counter()
+    ref = [InversePoint(*st, e[i], no[i], z[i], ih) for i in range(n)]
+    t1 = time.perf_counter() - t
+    t = time.perf_counter()
+    hz, v, d = Inverse(*st, e, no, z, ih)
+    t2 = time.perf_counter() - t
+    print("inverse {:d} targets: per point {:.3f} s, vectorized {:.4f} s, max diff {:.1e}".format(
+        n, t1, t2, np.max(np.abs(np.array(ref) - np.column_stack((hz, v, d))))))
+    t = time.perf_counter()
+    ref = [PolarPoint(*st, hz[i], v[i], d[i], ih) for i in range(n)]
+    t1 = time.perf_counter() - t
+    t = time.perf_counter()
+    pe, pn, pz = Polar(*st, hz, v, d, ih)
+    t2 = time.perf_counter() - t
+    print("polar   {:d} targets: per point {:.3f} s, vectorized {:.4f} s, max diff {:.1e}".format(
+        n, t1, t2, np.max(np.abs(np.array(ref) - np.column_stack((pe, pn, pz))))))
+    print("polar(inverse) max coordinate error {:.1e} m".format(
+        max(np.max(np.abs(pe - e)), np.max(np.abs(pn - no)), np.max(np.abs(pz - z)))))
+    # orientation from 10 backsights around 0/360 degree, 5" noise
+    ori = 0.01
+    bearings = np.linspace(-0.2, 0.2, 10) % PI2
+    obs = Wrap(bearings - ori + rng.normal(0, 5 / 206265, 10)) % PI2
+    o, res = Orientation(obs, bearings)
+    print("orientation error {:.1f}\", max residual {:.1f}\"".format(
+        (o - ori) * 206265, np.max(np.abs(res)) * 206265))
+    m = min(n, 2000)
+    t = time.perf_counter()
+    dm = DistanceMatrix(e[:m], no[:m], z[:m])
+    t2 = time.perf_counter() - t
+    t = time.perf_counter()
+    for i in range(m):
+        for j in range(i + 1, m):
+            math.hypot(math.hypot(e[i] - e[j], no[i] - no[j]), z[i] - z[j])
+    t1 = time.perf_counter() - t
+    print("distance matrix {:d} points: per pair {:.3f} s, vectorized {:.4f} s".format(
+        m, t1, t2))
@@ -37,14 +37,6 @@ class GeoWriter(FileWriter):
         """
         super().__init__(name, angle, dist, dt, filt, fname, mode)
 
-    def __del__(self):
-        """ Destructor
-        """
-        try:
-            self.fp.close()
-        except Exception:
-            pass
-
     def WriteData(self, data):
         """ Write observation data to csv file
 
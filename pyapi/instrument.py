@@ -43,6 +43,9 @@ codes handles by descendent classes:
 - vRange: vertical search range, totalstation
 - wetTemp: wet temperature, met sensor
 """
+import time
+from latencystats import LatencyStats
+
 class Instrument():
     """ Base class for different instruments
 
@@ -51,6 +54,8 @@ class Instrument():
             :param MeasureIface: interface to physical intrument (Iface)
             :param writerUnit: unit to save observed data (Writer), optional
     """
+    telemetry = None    # collect times and errors (Telemetry)
+
     def __init__(self, name, measureUnit, measureIface, writerUnit = None):
         """ constructor
         """
@@ -87,6 +92,14 @@ class Instrument():
         """
         return self.name
 
+    def SetTelemetry(self, telemetry):
+        """ Collect the time of communication, parsing and writing and the
+            errors of the instrument
+
+            :param telemetry: collector object (Telemetry) or None to stop
+        """
+        self.telemetry = telemetry
+
     def _process(self, msg, pic = None):
         """ Send message to measure unit and process answer
 
@@ -94,13 +107,32 @@ class Instrument():
             :param pic: when using a camera you have tive give writable binary file
             :returns: parsed answer (dictionary)
         """
+        tel = self.telemetry
+        if tel is not None:
+            key = LatencyStats.Key(msg)
+            start = time.monotonic()
         ans = self.measureIface.Send(msg)
+        if tel is not None:
+            t = time.monotonic()
+            tel.Add('send', key, t - start)
+            start = t
         if self.measureIface.state != self.measureIface.IF_OK:
+            if tel is not None:
+                tel.IfaceError(self.measureIface)
             return {}
         res = self.measureUnit.Result(msg, ans)
+        if tel is not None:
+            t = time.monotonic()
+            tel.Add('result', key, t - start)
+            start = t
+            if isinstance(res, dict) and 'errorCode' in res:
+                tel.Error('instrument', '{}:{}'.format(key, res['errorCode']))
 
         if self.writerUnit is not None and res is not None and len(res) > 0:
             self.writerUnit.WriteData(res)
+            if tel is not None:
+                tel.Add('write', type(self.writerUnit).__name__,
+                        time.monotonic() - start)
         try:
             if res['binsize'] and res['binsize'] > 0:
                 res = self.measureIface.GetLine(res['binsize'])
@@ -0,0 +1,396 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+"""
+.. module:: instrumentgateway.py
+   :platform: Unix, Windows
+   :synopsis: Ulyxes - an open source project to drive total stations and
+       publish observation results. GPL v2.0 license Copyright (C)
+       2010- Zoltan Siki <siki.zoltan@epito.bme.hu>.
+
+.. moduleauthor:: Zoltan Siki <siki.zoltan@epito.bme.hu>
+
+TCP gateway to an instrument shared by many clients. The instrument
+connection is opened once and kept, the requests of the clients are
+serialized by a Broker. Requests and answers are lines ending with
+new line character:
+
+- GeoCOM request (e.g. %R1Q,2003:0), multipart requests separated by '|'
+  are executed without interleaving, the answer is the GeoCOM reply
+- JSON request of RemoteMeasureUnit, executed by execCmd on an instrument
+- binary request of RemoteMeasureUnit in a frame with 4 byte big endian
+  length prefix (the first byte is zero), answers are sent in frames
+- SUBSCRIBE [period]: stream tracking observations as JSON lines
+- UNSUBSCRIBE: stop streaming
+- PRIORITY n: priority of the following requests of the client
+
+TCPIface with a GeoCOM measure unit or RemoteMeasureUnit can be used as
+client. JSON and binary requests of a client are executed on its own
+instrument object as jobs of the broker, so the commands of a request are
+not interleaved with other clients, the repetitions of a streamed binary
+request are separate jobs. No thread waits for the answers, the broker
+completes a future of the event loop.
+"""
+
+import json
+import struct
+import asyncio
+import logging
+import functools
+from angle import Angle
+from broker import Broker
+from totalstation import TotalStation
+from remotemeasureunit import RemoteMeasureUnit
+
+class InstrumentGateway(object):
+    """ Serve an instrument to TCP clients
+
+            :param broker: broker of the instrument (Broker)
+            :param mu: measure unit of the instrument to create tracking requests and parse them (MeasureUnit)
+            :param host: address to listen on, default 127.0.0.1
+            :param port: TCP port, default 8081
+            :param instrument: class of instrument to execute RemoteMeasureUnit requests, default TotalStation
+            :param track: tracking request streamed to subscribers, default GetAngles
+            :param period: minimal seconds between tracking observations, default 0.2
+            :param maxBuffer: subscribers having more unsent bytes miss observations, default 65536
+    """
+
+    def __init__(self, broker, mu, host='127.0.0.1', port=8081,
+                 instrument=TotalStation, track=None, period=0.2,
+                 maxBuffer=65536):
+        """ Constructor
+        """
+        self.broker = broker
+        self.mu = mu
+        self.host = host
+        self.port = port
+        self.instrument = instrument
+        self.track = track if track is not None else mu.GetAnglesMsg()
+        self.period = period
+        self.maxBuffer = maxBuffer
+        self.subscribers = {}   # writer -> period
+        self.tracker = None     # tracking task
+        self.server = None
+        self.clients = 0
+        self.requests = 0
+        self.skipped = 0        # observations not sent to slow subscribers
+
+    async def Start(self):
+        """ Start listening
+
+            :returns: address of the server
+        """
+        self.server = await asyncio.start_server(self._Client, self.host,
+                                                 self.port)
+        return self.server.sockets[0].getsockname()
+
+    async def Stop(self):
+        """ Stop listening and streaming
+        """
+        if self.tracker is not None:
+            self.tracker.cancel()
+        if self.server is not None:
+            self.server.close()
+            await self.server.wait_closed()
+
+    async def _Send(self, msg, priority):
+        """ Send a request through the broker without blocking the loop,
+            the request is cancelled if the waiting task is cancelled
+
+            :param msg: message to send (str) or job of the broker (callable)
+            :param priority: priority of the request
+            :returns: answer and state of interface (tuple)
+        """
+        loop = asyncio.get_running_loop()
+        fut = loop.create_future()
+
+        def Done(req):
+            """ complete the future in the event loop """
+            if not fut.done():
+                fut.set_result((req.answer, req.state))
+
+        req = self.broker.Submit(msg, priority)
+        req.AddCallback(lambda r: loop.call_soon_threadsafe(Done, r))
+        try:
+            return await fut
+        except asyncio.CancelledError:
+            req.Cancel()
+            raise
+
+    @staticmethod
+    def _Exec(ts, msg, iface):
+        """ Execute a JSON request on the instrument of a client, job of
+            the broker
+
+            :param ts: instrument of the client
+            :param msg: JSON request (bytes)
+            :param iface: interface of the broker
+            :returns: JSON answer and photo file (tuple)
+        """
+        try:
+            return RemoteMeasureUnit.execCmd(ts, msg)
+        except Exception:
+            logging.error(" gateway: invalid JSON request %s", msg)
+            return json.dumps({'params': {}, 'err': 1}).encode('ascii'), None
+
+    async def _ExecFrame(self, ts, frame, writer, priority):
+        """ Execute a binary request on the instrument of a client, each
+            repetition is a job of the broker
+
+            :param ts: instrument of the client
+            :param frame: binary request (bytes)
+            :param writer: stream writer of the client
+            :param priority: priority of the jobs
+        """
+        rmu = RemoteMeasureUnit
+        loop = asyncio.get_running_loop()
+        req = rmu.parseFrame(frame)
+        calls, count, period = req if req is not None else ([], 1, 0)
+        for rep in range(max(count, 1)):
+            start = loop.time()
+            if req is None:
+                ans = rmu.errorFrame()
+            else:
+                ans, _ = await self._Send(
+                    lambda iface, rep=rep: rmu.execCalls(ts, calls, rep),
+                    priority)
+                if ans is None:
+                    break   # broker stopped
+            writer.write(struct.pack('!I', len(ans)) + ans)
+            await writer.drain()
+            wait = period - (loop.time() - start)
+            if rep + 1 < count and wait > 0:
+                await asyncio.sleep(wait)
+
+    async def _Client(self, reader, writer):
+        """ Serve a client
+
+            :param reader: stream reader of the connection
+            :param writer: stream writer of the connection
+        """
+        self.clients += 1
+        # jobs run in the thread of the broker on its interface
+        ts = self.instrument('gateway', self.mu, self.broker.iface)
+        priority = Broker.MONITORING
+        try:
+            while True:
+                try:
+                    first = await reader.readexactly(1)
+                    if first == b'\x00':
+                        head = first + await reader.readexactly(3)
+                        frame = await reader.readexactly(
+                            struct.unpack('!I', head)[0])
+                    else:
+                        line = first + await reader.readline()
+                except (ConnectionError, asyncio.IncompleteReadError,
+                        asyncio.LimitOverrunError, ValueError):
+                    break
+                if first == b'\x00':
+                    self.requests += 1
+                    await self._ExecFrame(ts, frame, writer, priority)
+                    continue
+                line = line.decode('ascii', 'ignore').strip()
+                if not line:
+                    continue
+                self.requests += 1
+                binary = None
+                if line.startswith('%R1Q'):
+                    ans, _ = await self._Send(line, priority)
+                    ans = (ans or '').encode('ascii', 'ignore')
+                elif line.startswith('{'):
+                    res, _ = await self._Send(functools.partial(
+                        self._Exec, ts, line.encode('ascii')), priority)
+                    ans, binary = res or (json.dumps(
+                        {'params': {}, 'err': 1}).encode('ascii'), None)
+                else:
+                    words = line.split()
+                    cmd = words[0].upper()
+                    if cmd == 'SUBSCRIBE':
+                        try:
+                            period = float(words[1]) if len(words) > 1 \
+                                else self.period
+                        except ValueError:
+                            period = 0
+                        if period > 0:
+                            self.subscribers[writer] = period
+                            if self.tracker is None or self.tracker.done():
+                                self.tracker = asyncio.create_task(
+                                    self._Track())
+                            ans = b'OK'
+                        else:
+                            ans = b'ERROR invalid period'
+                    elif cmd == 'UNSUBSCRIBE':
+                        self.subscribers.pop(writer, None)
+                        ans = b'OK'
+                    elif cmd == 'PRIORITY' and len(words) > 1 and \
+                         words[1].isdigit():
+                        priority = int(words[1])
+                        ans = b'OK'
+                    else:
+                        ans = b'ERROR unknown request'
+                writer.write(ans + b'\n')
+                if binary is not None:
+                    binary.seek(0)
+                    writer.write(binary.read())
+                await writer.drain()
+        except ConnectionError:
+            pass
+        finally:
+            self.subscribers.pop(writer, None)
+            self.clients -= 1
+            writer.close()
+
+    async def _Track(self):
+        """ Stream tracking observations to subscribers
+        """
+        last = {}   # writer -> time of last observation sent
+        loop = asyncio.get_running_loop()
+        while self.subscribers:
+            start = loop.time()
+            ans, state = await self._Send(self.track, Broker.TRACKING)
+            if state != self.broker.iface.IF_OK:
+                await asyncio.sleep(self.period)
+                continue
+            res = self.mu.Result(self.track, ans)
+            obs = {k: (v.GetAngle() if isinstance(v, Angle) else v)
+                   for k, v in res.items()}
+            obs['time'] = start
+            line = (json.dumps(obs) + '\n').encode('ascii')
+            for w, period in list(self.subscribers.items()):
+                if start - last.get(w, 0) < period:
+                    continue
+                if w.is_closing():
+                    self.subscribers.pop(w, None)
+                    continue
+                if w.transport.get_write_buffer_size() > self.maxBuffer:
+                    self.skipped += 1   # slow client
+                    continue
+                w.write(line)
+                last[w] = start
+            wait = self.period - (loop.time() - start)
+            if wait > 0:
+                await asyncio.sleep(wait)
+
+if __name__ == "__main__":
+    # load test: 50 clients and 5 subscribers against a simulated instrument
+    #    argv[1]: number of clients, default 50
+    #    argv[2]: number of requests per client, default 40
+    import sys
+    import time
+    import threading
+    from simiface import SimIface
+    from serialiface import SerialIface
+    from leicatps1200 import LeicaTPS1200
+    from latencystats import LatencyStats
+
+    nClients = int(sys.argv[1]) if len(sys.argv) > 1 else 50
+    nReq = int(sys.argv[2]) if len(sys.argv) > 2 else 40
+    mu = LeicaTPS1200()
+    sim = SimIface(targets=[{'id': '1', 'east': 100.0, 'north': 50.0,
+                             'elev': 10.0}], mu=mu, latency=0.001, baud=0,
+                   timeScale=0.01, seed=1)
+    broker = Broker(sim, aging=1)
+    stats = LatencyStats(maxCount=None)
+    errors = []
+
+    async def Client(i, port):
+        """ send tagged GeoCOM requests and check answers """
+        reader, writer = await asyncio.open_connection('127.0.0.1', port)
+        cmu = LeicaTPS1200()
+        for _ in range(nReq):
+            msg = cmu.PipelineMsg([cmu.GetAnglesMsg(), cmu.GetPcMsg()])
+            start = time.perf_counter()
+            writer.write((msg + '\n').encode('ascii'))
+            ans = (await reader.readline()).decode('ascii').strip()
+            stats.Record('request', time.perf_counter() - start)
+            for m, a in zip(msg.split('|'), ans.split('|')):
+                if SerialIface.trIdRe.match(m).group(1) != \
+                   SerialIface.trIdRe.match(a).group(1):
+                    errors.append((i, m, a))
+        writer.close()
+
+    async def JsonClient(n, port):
+        """ send RemoteMeasureUnit requests """
+        reader, writer = await asyncio.open_connection('127.0.0.1', port)
+        req = json.dumps({'cmd': RemoteMeasureUnit.codes['GETANGLES'],
+                          'params': {}}) + '\n'
+        ok = 0
+        for _ in range(n):
+            writer.write(req.encode('ascii'))
+            ans = json.loads(await reader.readline())
+            if ans['err'] == 0 and 'hz' in ans['params']:
+                ok += 1
+        writer.close()
+        return ok
+
+    async def StreamClient(n, port):
+        """ send a streamed binary request, count the answers """
+        reader, writer = await asyncio.open_connection('127.0.0.1', port)
+        rmu = RemoteMeasureUnit(binary=True)
+        req = rmu.StreamMsg(rmu.GetAnglesMsg(), n, 0.01)
+        writer.write(struct.pack('!I', len(req)) + req)
+        ok = 0
+        for _ in range(n):
+            size = struct.unpack('!I', await reader.readexactly(4))[0]
+            ans = rmu.Result(req, await reader.readexactly(size))
+            if 'errorCode' not in ans and 'hz' in ans:
+                ok += 1
+        writer.close()
+        return ok
+
+    async def Subscriber(port, duration):
+        """ count streamed observations """
+        reader, writer = await asyncio.open_connection('127.0.0.1', port)
+        writer.write(b'SUBSCRIBE 0.05\n')
+        await reader.readline()
+        n = 0
+        end = time.perf_counter() + duration
+        while time.perf_counter() < end:
+            try:
+                line = await asyncio.wait_for(reader.readline(), 1)
+            except asyncio.TimeoutError:
+                break
+            if 'hz' in json.loads(line):
+                n += 1
+        writer.close()
+        return n
+
+    async def BadSubscribe(port):
+        """ invalid periods are refused, the connection is kept """
+        reader, writer = await asyncio.open_connection('127.0.0.1', port)
+        ans = []
+        for req in (b'SUBSCRIBE abc\n', b'SUBSCRIBE 0\n', b'SUBSCRIBE -1\n',
+                    b'UNSUBSCRIBE\n'):
+            writer.write(req)
+            ans.append((await reader.readline()).decode('ascii').strip())
+        # wait until the gateway closes the connection
+        writer.write_eof()
+        await reader.read()
+        writer.close()
+        return ans
+
+    async def main():
+        """ run clients and subscribers """
+        gw = InstrumentGateway(broker, mu, port=0, period=0.05)
+        port = (await gw.Start())[1]
+        t = time.perf_counter()
+        subs = [asyncio.create_task(Subscriber(port, 3)) for _ in range(5)]
+        res = await asyncio.gather(JsonClient(nReq, port),
+                                   StreamClient(nReq, port),
+                                   *[Client(i, port) for i in range(nClients)])
+        t = time.perf_counter() - t
+        streamed = await asyncio.gather(*subs)
+        bad = await BadSubscribe(port)
+        await gw.Stop()
+        print("%d clients x %d requests in %.2f s, %.0f requests/s" %
+              (nClients, nReq, t, nClients * nReq / t))
+        s = stats.Stats()['request']
+        print("latency p50 %.4f s p99 %.4f s" % (s['p50'], s['p99']))
+        print("mismatched answers: %d" % len(errors))
+        print("JSON requests answered: %d of %d" % (res[0], nReq))
+        print("streamed binary answers: %d of %d" % (res[1], nReq))
+        print("threads: %d" % threading.active_count())
+        print("streamed observations per subscriber: %s" % streamed)
+        print("invalid subscriptions: %s" % bad)
+
+    asyncio.run(main())
+    broker.Stop()
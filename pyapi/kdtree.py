@@ -0,0 +1,159 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+"""
+.. module:: kdtree.py
+   :platform: Unix, Windows
+   :synopsis: Ulyxes - an open source project to drive total stations and
+       publish observation results. GPL v2.0 license Copyright (C)
+       2010- Zoltan Siki <siki.zoltan@epito.bme.hu>.
+
+.. moduleauthor:: Zoltan Siki <siki.zoltan@epito.bme.hu>
+
+KD-tree of points for tolerance queries. The tree is built once, a query
+returns the points inside a box around the query point ranked by their
+distance, so a linear scan over all points is avoided.
+"""
+
+import numpy as np
+
+class KDTree(object):
+    """ KD-tree of points in any dimension
+
+            :param points: coordinates of points, one row for each point
+            :param leaf: maximal number of points in a leaf, default 16
+    """
+
+    def __init__(self, points, leaf=16):
+        """ Constructor
+        """
+        self.points = np.asarray(points, dtype=float)
+        if self.points.ndim < 2:
+            self.points = self.points.reshape(-1, 1)
+        self.leaf = leaf
+        n = len(self.points)
+        self.order = np.arange(n)   # point indices ordered by nodes
+        # nodes: index range in order, bounding box and children
+        self.start = []
+        self.end = []
+        self.lo = []
+        self.hi = []
+        self.left = []
+        self.right = []
+        if n:
+            self._Build()
+
+    def _Node(self, start, end):
+        """ Add a node
+
+            :param start, end: range of node in order
+            :returns: index of node
+        """
+        p = self.points[self.order[start:end]]
+        self.start.append(start)
+        self.end.append(end)
+        self.lo.append(p.min(axis=0))
+        self.hi.append(p.max(axis=0))
+        self.left.append(-1)
+        self.right.append(-1)
+        return len(self.start) - 1
+
+    def _Build(self):
+        """ Split nodes at median along the widest extent
+        """
+        stack = [self._Node(0, len(self.points))]
+        while stack:
+            node = stack.pop()
+            start, end = self.start[node], self.end[node]
+            if end - start <= self.leaf:
+                continue
+            dim = int(np.argmax(self.hi[node] - self.lo[node]))
+            mid = (end - start) // 2
+            idx = self.order[start:end]
+            self.order[start:end] = idx[np.argpartition(
+                self.points[idx, dim], mid)]
+            self.left[node] = self._Node(start, start + mid)
+            self.right[node] = self._Node(start + mid, end)
+            stack.extend((self.left[node], self.right[node]))
+
+    def Box(self, lo, hi):
+        """ Points inside an open box
+
+            :param lo, hi: lower and upper corner of box
+            :returns: indices of points in increasing order (array)
+        """
+        res = []
+        if self.start:
+            lo = np.asarray(lo, dtype=float)
+            hi = np.asarray(hi, dtype=float)
+            stack = [0]
+            while stack:
+                node = stack.pop()
+                if np.any(self.lo[node] >= hi) or np.any(self.hi[node] <= lo):
+                    continue    # disjoint
+                idx = self.order[self.start[node]:self.end[node]]
+                if self.left[node] < 0 or \
+                   (np.all(self.lo[node] > lo) and np.all(self.hi[node] < hi)):
+                    p = self.points[idx]
+                    res.append(idx[np.all((p > lo) & (p < hi), axis=1)])
+                else:
+                    stack.extend((self.left[node], self.right[node]))
+        if not res:
+            return np.zeros(0, dtype=int)
+        return np.sort(np.concatenate(res))
+
+    def Query(self, x, tol):
+        """ Points closer than tolerance to a point in each coordinate
+
+            :param x: query point
+            :param tol: tolerance for each coordinate
+            :returns: indices of points ranked by distance, equal distances in increasing order of indices (array)
+        """
+        x = np.asarray(x, dtype=float)
+        # wider box, rounding of its corners must not drop points
+        w = tol + 1e-9 * (tol + np.abs(x))
+        idx = self.Box(x - w, x + w)
+        dx = np.abs(self.points[idx] - x)
+        ok = np.all(dx < tol, axis=1)
+        idx, dx = idx[ok], dx[ok]
+        d = np.sqrt(np.sum(dx * dx, axis=1))
+        return idx[np.argsort(d, kind='stable')]
+
+if __name__ == "__main__":
+    # compare queries to a linear scan
+    #    argv[1]: number of points, default 5000
+    #    argv[2]: number of queries, default 1000
+    import sys
+    import time
+
+    n = int(sys.argv[1]) if len(sys.argv) > 1 else 5000
+    m = int(sys.argv[2]) if len(sys.argv) > 2 else 1000
+    tol = 0.1
+    rng = np.random.default_rng(1)
+    pts = np.column_stack((rng.uniform(1, 500, n), rng.uniform(-30, 30, n)))
+    qs = pts[rng.integers(0, n, m)] + rng.normal(0, tol / 2, (m, 2))
+    t = time.perf_counter()
+    ref = []
+    for q in qs:
+        best = None
+        mind = 1e10
+        for i, p in enumerate(pts.tolist()):
+            dd = abs(p[0] - q[0])
+            de = abs(p[1] - q[1])
+            if dd < tol and de < tol:
+                ddd = (dd * dd + de * de) ** 0.5
+                if mind > ddd:
+                    mind = ddd
+                    best = i
+        ref.append(best)
+    t1 = time.perf_counter() - t
+    t = time.perf_counter()
+    tree = KDTree(pts)
+    t2 = time.perf_counter() - t
+    t = time.perf_counter()
+    res = []
+    for q in qs:
+        idx = tree.Query(q, tol)
+        res.append(int(idx[0]) if len(idx) else None)
+    t3 = time.perf_counter() - t
+    print("%d points, %d queries: linear scan %.3f s, build %.3f s, "
+          "KD-tree %.3f s, same %s" % (n, m, t1, t2, t3, res == ref))
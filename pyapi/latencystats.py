@@ -0,0 +1,249 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+"""
+.. module:: latencystats.py
+   :platform: Unix, Windows
+   :synopsis: Ulyxes - an open source project to drive total stations and
+       publish observation results. GPL v2.0 license Copyright (C)
+       2010- Zoltan Siki <siki.zoltan@epito.bme.hu>.
+
+.. moduleauthor:: Zoltan Siki <siki.zoltan@epito.bme.hu>
+"""
+
+import re
+import json
+import math
+import logging
+
+class LatencyStats(object):
+    """ Latency histograms of instrument commands (GeoCOM RPC codes) and
+        adaptive timeouts derived from them. The histograms have
+        logarithmic bins (steps bins per decade from 1 ms), counts are
+        halved when a histogram reaches maxCount samples, so old
+        observations fade out.
+
+            :param fname: JSON file to load/save statistics, default None
+            :param factor: timeout is quantile * factor (float), default 3
+            :param quantile: quantile of latencies to use (float), default 0.99
+            :param floor: minimal timeout in seconds (float), default 0.3
+            :param ceiling: maximal timeout in seconds (float), default None (the fixed timeout of the interface)
+            :param minCount: number of samples needed before adaptive timeout is used (int), default 20
+            :param maxCount: number of samples when counts are halved (int), default 1000, None for no halving
+    """
+    BASE = 0.001    # lower edge of first bin (s)
+    STEPS = 20      # bins per decade
+    NBINS = 120     # up to 1000 s
+    # GeoCOM commands lasting by slew angle, target or distance (measure,
+    # get measure/coords with wait time, lock in, move, change face, search,
+    # fine adjust, power search, BAP measure/search), fixed timeout for them
+    variable = ('2008', '2082', '2108', '9013', '9027', '9028', '9029',
+                '9037', '9051', '9052', '17017', '17020')
+
+    def __init__(self, fname=None, factor=3.0, quantile=0.99, floor=0.3,
+                 ceiling=None, minCount=20, maxCount=1000):
+        """ Constructor
+        """
+        self.fname = fname
+        self.factor = factor
+        self.quantile = quantile
+        self.floor = floor
+        self.ceiling = ceiling
+        self.minCount = minCount
+        self.maxCount = maxCount
+        self.hist = {}      # key -> list of bin counts
+        self.count = {}     # key -> number of samples in histogram
+        self.max = {}       # key -> longest latency
+        self.timeouts = {}  # key -> number of adaptive timeouts
+        if fname is not None:
+            self.Load()
+
+    @staticmethod
+    def Key(msg):
+        """ Key of a command, the RPC code of GeoCOM requests or the
+            first field of other commands
+
+            :param msg: command sent to the instrument (str or bytes)
+            :returns: key (str)
+        """
+        if not isinstance(msg, str):
+            return 'frame'      # binary request
+        m = re.match(r'%R1Q,(\d+)', msg)
+        if m:
+            return m.group(1)
+        return re.split('[,=: ]', msg.strip(), 1)[0]
+
+    def _Bin(self, t):
+        """ Histogram bin of a latency
+
+            :param t: latency in seconds
+            :returns: bin index
+        """
+        if t <= self.BASE:
+            return 0
+        return min(int(math.log10(t / self.BASE) * self.STEPS),
+                   self.NBINS - 1)
+
+    def _Edge(self, i):
+        """ Upper edge of a bin
+
+            :param i: bin index
+            :returns: upper edge in seconds
+        """
+        return self.BASE * 10 ** ((i + 1) / self.STEPS)
+
+    def Record(self, key, t):
+        """ Add a latency sample
+
+            :param key: command key (str)
+            :param t: latency in seconds
+        """
+        if key not in self.hist:
+            self.hist[key] = [0] * self.NBINS
+            self.count[key] = 0
+            self.max[key] = 0.0
+        h = self.hist[key]
+        h[self._Bin(t)] += 1
+        self.count[key] += 1
+        self.max[key] = max(self.max[key], t)
+        if self.maxCount and self.count[key] >= self.maxCount:
+            for i in range(self.NBINS):
+                h[i] //= 2
+            self.count[key] = sum(h)
+
+    def RecordTimeout(self, key, t):
+        """ Record an adaptive timeout, the command is counted at twice the
+            timeout so a command cut short gets more time next time
+
+            :param key: command key (str)
+            :param t: timeout used in seconds
+        """
+        self.timeouts[key] = self.timeouts.get(key, 0) + 1
+        self.Record(key, 2 * t)
+
+    def Quantile(self, key, q=None):
+        """ Latency quantile of a command
+
+            :param key: command key (str)
+            :param q: quantile (float), default the quantile of the object
+            :returns: upper estimate of the quantile in seconds (not above the longest latency) or None if no samples
+        """
+        if self.count.get(key, 0) == 0:
+            return None
+        if q is None:
+            q = self.quantile
+        limit = q * self.count[key]
+        s = 0
+        edge = self._Edge(self.NBINS - 1)
+        for i, c in enumerate(self.hist[key]):
+            s += c
+            if s >= limit and s > 0:
+                edge = self._Edge(i)
+                break
+        # the bin edge may be above all samples
+        longest = self.max.get(key, 0.0)
+        return min(edge, longest) if longest > 0 else edge
+
+    def Buckets(self, key):
+        """ Non-empty bins of a histogram
+
+            :param key: command key (str)
+            :returns: list of (upper edge in seconds, count)
+        """
+        return [(self._Edge(i), c) for i, c in enumerate(self.hist.get(key, ()))
+                if c]
+
+    def GetTimeout(self, key, default):
+        """ Adaptive timeout for a command
+
+            :param key: command key (str)
+            :param default: fixed timeout in seconds, used until enough samples collected and for commands of variable duration
+            :returns: timeout in seconds
+        """
+        if key in self.variable or self.count.get(key, 0) < self.minCount:
+            return default
+        ceiling = self.ceiling if self.ceiling is not None else default
+        t = self.Quantile(key) * self.factor
+        return min(max(t, self.floor), ceiling)
+
+    def Stats(self, default=None):
+        """ Statistics for inspection
+
+            :param default: fixed timeout to calculate adaptive timeouts, default ceiling
+            :returns: dictionary of command keys with count, p50, p99, max, timeouts and timeout values
+        """
+        if default is None:
+            default = self.ceiling
+        res = {}
+        for key in sorted(self.hist):
+            res[key] = {'count': self.count[key],
+                        'p50': self.Quantile(key, 0.5),
+                        'p99': self.Quantile(key, 0.99),
+                        'max': self.max[key],
+                        'timeouts': self.timeouts.get(key, 0)}
+            if default is not None:
+                res[key]['timeout'] = self.GetTimeout(key, default)
+        return res
+
+    def Load(self, fname=None):
+        """ Load statistics from JSON file, missing file is not an error
+
+            :param fname: name of file, default fname of the object
+            :returns: True on success
+        """
+        if fname is None:
+            fname = self.fname
+        try:
+            with open(fname) as f:
+                data = json.load(f)
+        except FileNotFoundError:
+            return False
+        except Exception:
+            logging.error(" cannot load latency statistics from %s", fname)
+            return False
+        for key, s in data.items():
+            h = [0] * self.NBINS
+            for i, c in s['bins'].items():
+                h[min(int(i), self.NBINS - 1)] += c
+            self.hist[key] = h
+            self.count[key] = sum(h)
+            self.max[key] = s.get('max', 0.0)
+            self.timeouts[key] = s.get('timeouts', 0)
+        return True
+
+    def Save(self, fname=None):
+        """ Save statistics to JSON file, only non-empty bins are stored
+
+            :param fname: name of file, default fname of the object
+            :returns: True on success
+        """
+        if fname is None:
+            fname = self.fname
+        data = {}
+        for key, h in self.hist.items():
+            data[key] = {'bins': {str(i): c for i, c in enumerate(h) if c},
+                         'max': self.max[key],
+                         'timeouts': self.timeouts.get(key, 0)}
+        try:
+            with open(fname, 'w') as f:
+                json.dump(data, f, indent=1, sort_keys=True)
+        except Exception:
+            logging.error(" cannot save latency statistics to %s", fname)
+            return False
+        return True
+
+if __name__ == "__main__":
+    # print statistics saved by an application
+    #    argv[1]: JSON file with statistics
+    #    argv[2]: fixed timeout of the interface, default 17 s
+    import sys
+    if len(sys.argv) < 2:
+        print("Usage: latencystats.py stats.json [timeout]")
+        sys.exit(1)
+    st = LatencyStats(sys.argv[1])
+    default = float(sys.argv[2]) if len(sys.argv) > 2 else 17
+    print("{:>8s} {:>6s} {:>8s} {:>8s} {:>8s} {:>8s} {:>4s}".format(
+        'key', 'count', 'p50', 'p99', 'max', 'timeout', 'tout'))
+    for k, v in st.Stats(default).items():
+        print("{:>8s} {:6d} {:8.3f} {:8.3f} {:8.3f} {:8.3f} {:4d}".format(
+            k, v['count'], v['p50'], v['p99'], v['max'], v['timeout'],
+            v['timeouts']))
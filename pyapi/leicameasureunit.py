@@ -11,11 +11,23 @@
 
 """
 
-import re
 import logging
+import itertools
 from measureunit import MeasureUnit
 from angle import Angle
 
+# GeoCOM transaction IDs of all requests in the process, the measure units
+# and the interfaces take them from the same counter so IDs on a link never
+# collide (next() of a counter is atomic)
+_trIds = itertools.count()
+
+def NextTrId():
+    """ Get a new GeoCOM transaction ID
+
+        :returns: transaction ID 1-65535 (int)
+    """
+    return next(_trIds) % 65535 + 1
+
 class LeicaMeasureUnit(MeasureUnit):
     """ This class contains the Leica robotic total station specific functions
         common to all leica robot TS
@@ -68,14 +80,64 @@ class LeicaMeasureUnit(MeasureUnit):
     edmModes = {'STANDARD': 0, 'PRECISE': 1, 'FAST': 2, 'TRACKING': 3,
                 'AVERAGING': 4, 'FASTTRACKING': 5}
 
+    # Constants for serial line speed (COM_BAUD_RATE)
+    baudRates = {38400: 0, 19200: 1, 9600: 2, 4800: 3, 2400: 4,
+                 115200: 5, 57600: 6}
+
     # Constants for EDM programs
     edmProg = {'STOP': 0, 'DEFAULT': 1, 'TRACKING': 2, 'CLEAR': 3}
 
+    # Fields of answers, name of command: (key, index in answer, type), ...
+    resultFields = {
+        'GETMEASURE': (('hz', 4, 'angle'), ('v', 5, 'angle'),
+                       ('distance', 6, 'float')),
+        'MEASUREANGDIST': (('hz', 4, 'angle'), ('v', 5, 'angle'),
+                           ('distance', 6, 'float')),
+        'GETPC': (('pc', 4, 'float'),),
+        'GETPT': (('pt', 4, 'int'),),
+        'GETATR': (('atrStatus', 4, 'int'),),
+        'GETLOCK': (('lockStat', 4, 'int'),),
+        'GETATMCORR': (('lambda', 4, 'str'), ('pressure', 5, 'float'),
+                       ('dryTemp', 6, 'float'), ('wetTemp', 7, 'float')),
+        'GETREFCORR': (('status', 4, 'str'), ('earthRadius', 5, 'float'),
+                       ('refractiveScale', 6, 'float')),
+        'GETSTN': (('east', 4, 'float'), ('north', 5, 'float'),
+                   ('elev', 6, 'float'), ('ih', 7, 'float')),
+        'GETEDMMODE': (('edmMode', 4, 'int'),),
+        'COORDS': (('east', 4, 'float'), ('north', 5, 'float'),
+                   ('elev', 6, 'float')),
+        'GETANGLES': (('hz', 4, 'angle'), ('v', 5, 'angle'),
+                      ('crossincline', 8, 'angle'),
+                      ('lengthincline', 9, 'angle')),
+        'GETSPIRAL': (('hzRange', 4, 'angle'), ('vRange', 5, 'angle')),
+        'INSTRNO': (('instrNo', 4, 'str'),),
+        'INSTRNAME': (('instrName', 4, 'str'),),
+        'INTTEMP': (('intTemp', 4, 'float'),)
+    }
+
+    # Converters of answer fields
+    fieldTypes = {'angle': lambda x: Angle(float(x)), 'float': float,
+                  'int': int, 'str': str}
+
     def __init__(self, name='Leica generic', typ='TPS'):
         """ Constructor to leica generic ts
         """
         # call super class init
         super().__init__(name, typ)
+        self.decoders = self.Decoders()
+
+    def Decoders(self):
+        """ Compile the table of answer decoders for the codes of the
+            instrument, the first command wins if codes are shared
+
+            :returns: dictionary of RPC code: ((key, index, converter), ...)
+        """
+        decoders = {}
+        for name, fields in self.resultFields.items():
+            if name in self.codes:
+                decoders.setdefault(self.codes[name], tuple(
+                    (key, i, self.fieldTypes[typ]) for key, i, typ in fields))
+        return decoders
 
     @staticmethod
     def GetCapabilities():
@@ -92,80 +154,20 @@ class LeicaMeasureUnit(MeasureUnit):
             :param anss: aswers got from instrument
             :returns: dictionary
         """
-        msgList = re.split(r'\|', msgs)
-        ansList = re.split(r'\|', anss)
         res = {}
-        for msg, ans in zip(msgList, ansList):
+        decoders = self.decoders
+        for msg, ans in zip(msgs.split('|'), anss.split('|')):
             # get command id form message
-            msgBufflist = re.split(':|,', msg)
             try:
-                commandID = int(msgBufflist[1])
+                commandID = int(msg.replace(':', ',').split(',', 2)[1])
             except Exception:
                 commandID = -1
             # get error code from answer
-            ansBufflist = re.split(':|,', ans)
+            ansBufflist = ans.replace(':', ',').split(',')
             try:
                 errCode = int(ansBufflist[3])
-                if commandID == self.codes['GETMEASURE']:
-                    res['hz'] = Angle(float(ansBufflist[4]))
-                    res['v'] = Angle(float(ansBufflist[5]))
-                    res['distance'] = float(ansBufflist[6])
-                # MeasureDistAng
-                elif commandID == self.codes['MEASUREANGDIST']:
-                    res['hz'] = Angle(float(ansBufflist[4]))
-                    res['v'] = Angle(float(ansBufflist[5]))
-                    res['distance'] = float(ansBufflist[6])
-                # Prism constant
-                elif commandID == self.codes['GETPC']:
-                    res['pc'] = float(ansBufflist[4])
-                # Prism type
-                elif commandID == self.codes['GETPT']:
-                    res['pt'] = int(ansBufflist[4])
-                # ATR
-                elif commandID == self.codes['GETATR']:
-                    res['atrStatus'] = int(ansBufflist[4])
-                #GetLockStatus()
-                elif commandID == self.codes['GETLOCK']:
-                    res['lockStat'] = int(ansBufflist[4])
-                #GetAtmCorr()
-                elif commandID == self.codes['GETATMCORR']:
-                    res['lambda'] = ansBufflist[4]
-                    res['pressure'] = float(ansBufflist[5])
-                    res['dryTemp'] = float(ansBufflist[6])
-                    res['wetTemp'] = float(ansBufflist[7])
-                #GetRefCorr()
-                elif commandID == self.codes['GETREFCORR']:
-                    res['status'] = ansBufflist[4]
-                    res['earthRadius'] = float(ansBufflist[5])
-                    res['refractiveScale'] = float(ansBufflist[6])
-                elif commandID == self.codes['GETSTN']:
-                    res['east'] = float(ansBufflist[4])
-                    res['north'] = float(ansBufflist[5])
-                    res['elev'] = float(ansBufflist[6])
-                    res['ih'] = float(ansBufflist[7])
-                elif commandID == self.codes['GETEDMMODE']:
-                    res['edmMode'] = int(ansBufflist[4])
-                #Coords()
-                elif commandID == self.codes['COORDS']:
-                    res['east'] = float(ansBufflist[4])
-                    res['north'] = float(ansBufflist[5])
-                    res['elev'] = float(ansBufflist[6])
-                #GetAngles()
-                elif commandID == self.codes['GETANGLES']:
-                    res['hz'] = Angle(float(ansBufflist[4]))
-                    res['v'] = Angle(float(ansBufflist[5]))
-                    res['crossincline'] = Angle(float(ansBufflist[8]))
-                    res['lengthincline'] = Angle(float(ansBufflist[9]))
-                # GetSpiral()
-                elif commandID == self.codes['GETSPIRAL']:
-                    res['hzRange'] = Angle(float(ansBufflist[4]))
-                    res['vRange'] = Angle(float(ansBufflist[5]))
-                elif commandID == self.codes['INSTRNO']:
-                    res['instrNo'] = ansBufflist[4]
-                elif commandID == self.codes['INSTRNAME']:
-                    res['instrName'] = ansBufflist[4]
-                elif commandID == self.codes['INTTEMP']:
-                    res['intTemp'] = float(ansBufflist[4])
+                for key, i, conv in decoders.get(commandID, ()):
+                    res[key] = conv(ansBufflist[i])
             except ValueError:
                 errCode = -1   # invalid answer
             except IndexError:
@@ -177,6 +179,21 @@ class LeicaMeasureUnit(MeasureUnit):
                 # do not stop if accuracy is not perfect
         return res
 
+    def PipelineMsg(self, msgs):
+        """ Tag GeoCOM requests with transaction IDs and join them into a
+            multipart message, the interface can match the answers by ID
+
+            :param msgs: messages to send (list of str)
+            :returns: multipart message
+        """
+        tagged = []
+        for msg in msgs:
+            head, sep, tail = msg.partition(':')
+            if msg.startswith('%R1Q,') and head.count(',') == 1:
+                msg = f"{head},{NextTrId()}{sep}{tail}"
+            tagged.append(msg)
+        return '|'.join(tagged)
+
     def SetPcMsg(self, pc):
         """ Set prism constant
 
@@ -452,9 +469,192 @@ class LeicaMeasureUnit(MeasureUnit):
         """
         return f"%R1Q,{self.codes['INSTRNAME']}:"
 
+    @staticmethod
+    def NullProcMsg():
+        """ Empty request to check the communication
+
+            :returns: null procedure message
+        """
+        return "%R1Q,0:"
+
+    def SetBaudRateMsg(self, baud):
+        """ Change the speed of the instrument's serial port, the RPC code
+            of the instrument must be given in codes as 'SETBAUD'
+
+            :param baud: new baud rate (int)
+            :returns: set baud rate message or None if not supported
+        """
+        if 'SETBAUD' not in self.codes or baud not in self.baudRates:
+            return None
+        return f"%R1Q,{self.codes['SETBAUD']}:{self.baudRates[baud]}"
+
     def GetInternalTemperatureMsg(self):
         """ Get instrument internal temperature
 
             :returns: instrument internal temperature
         """
         return f"%R1Q,{self.codes['INTTEMP']}:"
+
+if __name__ == "__main__":
+    # check the table driven parser against the former regexp/elif parser
+    # and compare their speed
+    #    argv[1]: session log of RecorderIface as answer corpus, optional
+    #             (default: random answers of a simulated instrument)
+    import re
+    import sys
+    import time
+    import random
+    from leicatps1200 import LeicaTPS1200
+
+    def LegacyResult(mu, msgs, anss):
+        """ former parser, reference of the property test
+
+            :param msgs: messages sent to instrument
+            :param anss: aswers got from instrument
+            :returns: dictionary
+        """
+        msgList = re.split(r'\|', msgs)
+        ansList = re.split(r'\|', anss)
+        res = {}
+        for msg, ans in zip(msgList, ansList):
+            # get command id form message
+            msgBufflist = re.split(':|,', msg)
+            try:
+                commandID = int(msgBufflist[1])
+            except Exception:
+                commandID = -1
+            # get error code from answer
+            ansBufflist = re.split(':|,', ans)
+            try:
+                errCode = int(ansBufflist[3])
+                if commandID == mu.codes['GETMEASURE']:
+                    res['hz'] = Angle(float(ansBufflist[4]))
+                    res['v'] = Angle(float(ansBufflist[5]))
+                    res['distance'] = float(ansBufflist[6])
+                # MeasureDistAng
+                elif commandID == mu.codes['MEASUREANGDIST']:
+                    res['hz'] = Angle(float(ansBufflist[4]))
+                    res['v'] = Angle(float(ansBufflist[5]))
+                    res['distance'] = float(ansBufflist[6])
+                # Prism constant
+                elif commandID == mu.codes['GETPC']:
+                    res['pc'] = float(ansBufflist[4])
+                # Prism type
+                elif commandID == mu.codes['GETPT']:
+                    res['pt'] = int(ansBufflist[4])
+                # ATR
+                elif commandID == mu.codes['GETATR']:
+                    res['atrStatus'] = int(ansBufflist[4])
+                #GetLockStatus()
+                elif commandID == mu.codes['GETLOCK']:
+                    res['lockStat'] = int(ansBufflist[4])
+                #GetAtmCorr()
+                elif commandID == mu.codes['GETATMCORR']:
+                    res['lambda'] = ansBufflist[4]
+                    res['pressure'] = float(ansBufflist[5])
+                    res['dryTemp'] = float(ansBufflist[6])
+                    res['wetTemp'] = float(ansBufflist[7])
+                #GetRefCorr()
+                elif commandID == mu.codes['GETREFCORR']:
+                    res['status'] = ansBufflist[4]
+                    res['earthRadius'] = float(ansBufflist[5])
+                    res['refractiveScale'] = float(ansBufflist[6])
+                elif commandID == mu.codes['GETSTN']:
+                    res['east'] = float(ansBufflist[4])
+                    res['north'] = float(ansBufflist[5])
+                    res['elev'] = float(ansBufflist[6])
+                    res['ih'] = float(ansBufflist[7])
+                elif commandID == mu.codes['GETEDMMODE']:
+                    res['edmMode'] = int(ansBufflist[4])
+                #Coords()
+                elif commandID == mu.codes['COORDS']:
+                    res['east'] = float(ansBufflist[4])
+                    res['north'] = float(ansBufflist[5])
+                    res['elev'] = float(ansBufflist[6])
+                #GetAngles()
+                elif commandID == mu.codes['GETANGLES']:
+                    res['hz'] = Angle(float(ansBufflist[4]))
+                    res['v'] = Angle(float(ansBufflist[5]))
+                    res['crossincline'] = Angle(float(ansBufflist[8]))
+                    res['lengthincline'] = Angle(float(ansBufflist[9]))
+                # GetSpiral()
+                elif commandID == mu.codes['GETSPIRAL']:
+                    res['hzRange'] = Angle(float(ansBufflist[4]))
+                    res['vRange'] = Angle(float(ansBufflist[5]))
+                elif commandID == mu.codes['INSTRNO']:
+                    res['instrNo'] = ansBufflist[4]
+                elif commandID == mu.codes['INSTRNAME']:
+                    res['instrName'] = ansBufflist[4]
+                elif commandID == mu.codes['INTTEMP']:
+                    res['intTemp'] = float(ansBufflist[4])
+            except ValueError:
+                errCode = -1   # invalid answer
+            except IndexError:
+                errCode = -2   # instrument off?
+            if errCode != 0:
+                logging.error(" error from instrument: %d (command %d)", errCode, commandID)
+                res['errorCode'] = errCode
+                #if not errCode in (1283, 1284, 1285, 1288):
+                # do not stop if accuracy is not perfect
+        return res
+
+    def Norm(res):
+        """ comparable form of a result """
+        return {k: (v.GetAngle() if isinstance(v, Angle) else v)
+                for k, v in res.items()}
+
+    mu = LeicaTPS1200()
+    rnd = random.Random(1)
+    corpus = []
+    if len(sys.argv) > 1:
+        with open(sys.argv[1]) as f:
+            for line in f:
+                fields = line.rstrip('\n').split('\t')
+                if len(fields) == 5 and fields[2] == 'S':
+                    corpus.append((fields[3], fields[4]))
+    else:
+        from simiface import SimIface
+        sim = SimIface(targets=[{'id': '1', 'east': 100.0, 'north': 50.0,
+                                 'elev': 10.0}], mu=mu, timeScale=0, seed=1)
+        reqs = [mu.GetAnglesMsg(), mu.MeasureMsg(), mu.GetMeasureMsg(),
+                mu.CoordsMsg(), mu.GetPcMsg(), mu.GetPrismTypeMsg(),
+                mu.GetATRMsg(), mu.GetAtmCorrMsg(), mu.GetRefCorrMsg(),
+                mu.GetStationMsg(), mu.GetEDMModeMsg(), mu.GetSpiralMsg(),
+                mu.GetInstrumentNoMsg(), mu.GetInstrumentNameMsg(),
+                mu.GetInternalTemperatureMsg(), mu.SetPcMsg(0.0)]
+        for i in range(100000):
+            msg = rnd.choice(reqs)
+            corpus.append((msg, sim.Send(msg)))
+    # random damage: trailing garbage, truncation, error codes, noise
+    cases = list(corpus)
+    for i in range(20000):
+        msg, ans = rnd.choice(corpus)
+        k = rnd.randrange(5)
+        if k == 0:
+            ans = ans[:rnd.randrange(len(ans) + 1)]
+        elif k == 1:
+            ans = ans.replace(',0,', ',1284,', 1)
+        elif k == 2:
+            # extra/missing field or separator (no huge numbers for Angle)
+            p = rnd.choice([j for j, c in enumerate(ans) if c in ',:'])
+            ans = ans[:p] + rnd.choice(['x', ',', ':', '|', ',x', '']) + \
+                ans[p + rnd.randrange(2):]
+        elif k == 3:
+            msg = msg[:rnd.randrange(len(msg) + 1)]
+        else:
+            msg2, ans2 = rnd.choice(corpus)
+            msg, ans = msg + '|' + msg2, ans + '|' + ans2
+        cases.append((msg, ans))
+    logging.disable(logging.ERROR)
+    diff = 0
+    for msg, ans in cases:
+        if Norm(mu.Result(msg, ans)) != Norm(LegacyResult(mu, msg, ans)):
+            diff += 1
+            print("different result: %s / %s" % (msg, ans))
+    print("%d cases, %d different" % (len(cases), diff))
+    for parser in (lambda m, a: LegacyResult(mu, m, a), mu.Result):
+        t = time.perf_counter()
+        for msg, ans in corpus:
+            parser(msg, ans)
+        t = time.perf_counter() - t
+        print("%.0f answers/s" % (len(corpus) / t))
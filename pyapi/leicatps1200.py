@@ -36,6 +36,7 @@ class LeicaTPS1200(LeicaMeasureUnit):
         'INSTRNO': 5003,
         'INSTRNAME': 5004,
         'INTTEMP': 5011,
+        'SETBAUD': 5039,
         'SETATR': 18005,
         'GETATR': 18006,
         'SETLOCK': 18007,
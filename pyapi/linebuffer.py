@@ -0,0 +1,178 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+"""
+.. module:: linebuffer.py
+   :platform: Unix, Windows
+   :synopsis: Ulyxes - an open source project to drive total stations and
+       publish observation results. GPL v2.0 license Copyright (C)
+       2010- Zoltan Siki <siki.zoltan@epito.bme.hu>.
+
+.. moduleauthor:: Zoltan Siki <siki.zoltan@epito.bme.hu>
+
+Buffered line reader shared by stream like interfaces (serial, bluetooth,
+TCP).
+Bytes are read in chunks into a bytearray and lines are cut at the end of
+message marker, bytes after the marker are kept for the next call.
+"""
+
+class LineBuffer():
+    """ Byte buffer collecting chunks from a stream and splitting them into
+        lines at the end of message marker
+
+        :param bufSize: maximal number of bytes to read in one chunk (int), default 4096
+    """
+
+    def __init__(self, bufSize=4096):
+        """ Constructor
+        """
+        self.bufSize = bufSize
+        self.buf = bytearray()
+        self.scan = 0   # position to continue delimiter search from
+
+    def __len__(self):
+        """ Number of buffered bytes
+
+            :returns: number of bytes not consumed yet
+        """
+        return len(self.buf)
+
+    def Feed(self, data):
+        """ Add a chunk of bytes to the end of the buffer
+
+            :param data: bytes read from the stream (bytes)
+        """
+        self.buf += data
+
+    def NextLine(self, eom):
+        """ Cut the next line from the buffer
+
+            :param eom: end of message marker (str)
+            :returns: line without end of message marker (bytes) or None if there is no complete line in the buffer
+        """
+        eomb = eom.encode('ascii')
+        pos = self.buf.find(eomb, self.scan)
+        if pos < 0:
+            # marker may be split between chunks
+            self.scan = max(0, len(self.buf) - len(eomb) + 1)
+            return None
+        line = bytes(self.buf[:pos])
+        del self.buf[:pos + len(eomb)]
+        self.scan = 0
+        return line
+
+    def Flush(self):
+        """ Get all buffered bytes and empty the buffer (e.g. after timeout)
+
+            :returns: buffered bytes (bytes)
+        """
+        data = bytes(self.buf)
+        self.Clear()
+        return data
+
+    def ReadInto(self, view):
+        """ Move buffered bytes into a preallocated buffer (e.g. binary data
+            following a line)
+
+            :param view: writable buffer (memoryview)
+            :returns: number of bytes moved
+        """
+        n = min(len(view), len(self.buf))
+        view[:n] = self.buf[:n]
+        del self.buf[:n]
+        self.scan = 0
+        return n
+
+    def Clear(self):
+        """ Drop buffered bytes
+        """
+        self.buf = bytearray()
+        self.scan = 0
+
+    def ReadLine(self, read, eom):
+        """ Read from stream until a complete line is available
+
+            :param read: function to call with the maximal number of bytes to read, it returns bytes, empty bytes on timeout/EOF
+            :param eom: end of message marker (str)
+            :returns: tuple of line (bytes) and completion flag, flag is False if the stream timed out before the marker arrived, the partial line is returned in this case
+        """
+        line = self.NextLine(eom)
+        while line is None:
+            chunk = read(self.bufSize)
+            if not chunk:
+                return self.Flush(), False
+            self.Feed(chunk)
+            line = self.NextLine(eom)
+        return line, True
+
+if __name__ == "__main__":
+    # micro benchmark, recorded like traffic through a pseudo terminal
+    #    command line parameters
+    #    argv[1]: number of lines to send, default 20000
+    #    argv[2]: baud rate of the pseudo serial line, default 115200
+    import os
+    import sys
+    import pty
+    import time
+    import threading
+    import serial
+
+    TRAFFIC = [
+        "%R1P,0,0:0,3.14159265358979,1.57079632679490,123.4567",
+        "%R1P,0,0:0,1.23456789012345,1.61234567890123,0.0000123,-0.0000234,0",
+        "%R1P,0,0:0,1",
+        "%R1P,0,0:0,0.0344",
+        "$GPGGA,092750.000,5321.6802,N,00630.3372,W,1,8,1.03,61.7,M,55.2,M,,*76",
+        "$GPRMC,092750.000,A,5321.6802,N,00630.3372,W,0.02,31.66,280511,,,A*43",
+        "$GPGSA,A,3,10,07,05,02,29,04,08,13,,,,,1.72,1.03,1.38*0A"]
+
+    n = int(sys.argv[1]) if len(sys.argv) > 1 else 20000
+    baud = int(sys.argv[2]) if len(sys.argv) > 2 else 115200
+    eom = '\r\n'
+    lines = [TRAFFIC[i % len(TRAFFIC)] for i in range(n)]
+    data = ''.join([l + eom for l in lines]).encode('ascii')
+
+    def feeder(fd, payload):
+        """ write traffic to the master side of the pty in small packets """
+        for i in range(0, len(payload), 64):
+            os.write(fd, payload[i:i+64])
+
+    def legacy(ser):
+        """ original char by char reader """
+        ans = ''
+        w = -1 * len(eom)
+        while ans[w:] != eom:
+            ch = (ser.read(1)).decode('ascii')
+            if ch == '':
+                break
+            ans += ch
+        return ans.strip(eom)
+
+    lb = LineBuffer()
+
+    def buffered(ser):
+        """ chunked reader """
+        line, _ = lb.ReadLine(lambda size: ser.read(max(1, min(size, ser.in_waiting))), eom)
+        return line.decode('ascii')
+
+    for name, reader in (('char by char', legacy), ('buffered', buffered)):
+        master, slave = pty.openpty()
+        ser = serial.Serial(os.ttyname(slave), baud, timeout=2)
+        th = threading.Thread(target=feeder, args=(master, data))
+        start = time.perf_counter()
+        th.start()
+        lat = []
+        for i in range(n):
+            t0 = time.perf_counter()
+            if reader(ser) != lines[i]:
+                print("data mismatch at line %d" % i)
+                break
+            lat.append(time.perf_counter() - t0)
+        elapsed = time.perf_counter() - start
+        th.join()
+        ser.close()
+        os.close(master)
+        os.close(slave)
+        lat.sort()
+        print("%-13s %10.0f bytes/s  mean latency %7.1f us  p99 %7.1f us" %
+              (name, len(data) / elapsed, sum(lat) / len(lat) * 1e6,
+               lat[int(len(lat) * 0.99)] * 1e6))
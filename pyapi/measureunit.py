@@ -46,6 +46,15 @@ class MeasureUnit():
         """
         return None
 
+    @staticmethod
+    def PipelineMsg(msgs):
+        """ Join independent messages into a multipart message
+
+            :param msgs: messages to send (list of str)
+            :returns: multipart message
+        """
+        return '|'.join(msgs)
+
 if __name__ == "__main__":
     a = MeasureUnit("alma", "korte")
     print (a.GetName())
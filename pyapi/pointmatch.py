@@ -0,0 +1,291 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+"""
+.. module:: pointmatch.py
+   :platform: Unix, Windows
+   :synopsis: Ulyxes - an open source project to drive total stations and
+       publish observation results. GPL v2.0 license Copyright (C)
+       2010- Zoltan Siki <siki.zoltan@epito.bme.hu>.
+
+.. moduleauthor:: Zoltan Siki <siki.zoltan@epito.bme.hu>
+
+Match points measured from an unknown station to a catalog of known
+points by geometric hashing. Distances of all catalog point pairs are
+sorted once, a measured pair is looked up by binary search. Each catalog
+pair matching a measured pair gives a station pose (position and
+orientation), poses are voted in a hash grid and the best voted poses are
+verified by the number of measured points falling onto catalog points.
+"""
+
+import math
+import numpy as np
+from geometry import Coords, Distance, MeanDirection, Wrap
+
+class GridIndex(object):
+    """ Spatial hash of points in the horizontal plane for tolerance
+        queries
+
+            :param e, n: coordinates of points
+            :param cell: size of grid cells, at least the query tolerance
+    """
+
+    def __init__(self, e, n, cell):
+        """ Constructor
+        """
+        self.e = np.asarray(e, dtype=float)
+        self.n = np.asarray(n, dtype=float)
+        self.cell = cell
+        self.cells = {}
+        keys = zip(np.floor(self.e / cell).astype(int).tolist(),
+                   np.floor(self.n / cell).astype(int).tolist())
+        for i, k in enumerate(keys):
+            self.cells.setdefault(k, []).append(i)
+
+    def Query(self, e, n, tol):
+        """ Points closer than tolerance, nearest first
+
+            :param e, n: coordinates of query point
+            :param tol: tolerance, not larger than cell size
+            :returns: list of indices of points
+        """
+        ce, cn = int(math.floor(e / self.cell)), int(math.floor(n / self.cell))
+        cand = [i for de in (-1, 0, 1) for dn in (-1, 0, 1)
+                for i in self.cells.get((ce + de, cn + dn), ())]
+        if not cand:
+            return []
+        d = np.hypot(self.e[cand] - e, self.n[cand] - n)
+        order = np.argsort(d, kind='stable')
+        return [cand[k] for k in order if d[k] <= tol]
+
+class PointMatch(object):
+    """ Identify points measured from an unknown station in a catalog
+
+            :param coords: catalog of known points (list of dicts with id, east, north, elev)
+            :param tol: distance tolerance (m), default 0.05
+            :param verify: number of best voted poses to verify, default 10
+    """
+
+    def __init__(self, coords, tol=0.05, verify=10):
+        """ Constructor, pairwise distances of catalog are indexed
+        """
+        self.tol = tol
+        self.verify = verify
+        self.ids, e, n, z = Coords(coords)
+        self.e, self.n, self.z = e, n, z
+        i, j = np.triu_indices(len(e), 1)
+        d = Distance(e[i], n[i], e[j], n[j], z[i], z[j])
+        order = np.argsort(d, kind='stable')
+        self.d = d[order]
+        self.pi = i[order]
+        self.pj = j[order]
+        self.grid = GridIndex(e, n, tol)
+
+    def Pairs(self, d):
+        """ Catalog pairs having distance within tolerance
+
+            :param d: distances (array)
+            :returns: measured pair index and catalog point indices of candidate pairs (arrays)
+        """
+        d = np.atleast_1d(d)
+        lo = np.searchsorted(self.d, d - self.tol, side='left')
+        hi = np.searchsorted(self.d, d + self.tol, side='right')
+        cnt = hi - lo
+        k = np.repeat(np.arange(len(d)), cnt)
+        # indices lo..hi-1 of all ranges
+        idx = np.arange(cnt.sum()) - np.repeat(np.cumsum(cnt) - cnt, cnt) + \
+            np.repeat(lo, cnt)
+        return k, self.pi[idx], self.pj[idx]
+
+    def Match(self, e, n, z):
+        """ Find measured points in catalog
+
+            :param e, n, z: coordinates of measured points in the local system of instrument (station at origin, hz as bearing)
+            :returns: catalog index of measured points (-1 if not found) and station pose dict (east, north, elev, ori) or None
+        """
+        e = np.asarray(e, dtype=float)
+        n = np.asarray(n, dtype=float)
+        z = np.asarray(z, dtype=float)
+        m = len(e)
+        res = [-1] * m
+        if m < 2:
+            return res, None
+        mi, mj = np.triu_indices(m, 1)
+        k, a, b = self.Pairs(Distance(e[mi], n[mi], e[mj], n[mj], z[mi], z[mj]))
+        # both directions of catalog pairs
+        i = np.concatenate((mi[k], mi[k]))
+        j = np.concatenate((mj[k], mj[k]))
+        a, b = np.concatenate((a, b)), np.concatenate((b, a))
+        ok = np.abs((z[j] - z[i]) - (self.z[b] - self.z[a])) <= 2 * self.tol
+        i, j, a, b = i[ok], j[ok], a[ok], b[ok]
+        if len(i) == 0:
+            return res, None
+        # pose from each pair: rotation then translation
+        rot = Wrap(np.arctan2(self.e[b] - self.e[a], self.n[b] - self.n[a]) -
+                   np.arctan2(e[j] - e[i], n[j] - n[i]))
+        c, s = np.cos(rot), np.sin(rot)
+        te = self.e[a] - (e[i] * c + n[i] * s)
+        tn = self.n[a] - (n[i] * c - e[i] * s)
+        tz = self.z[a] - z[i]
+        # vote in pose grid
+        tbin = 4 * self.tol
+        abin = tbin / max(np.median(np.hypot(e, n)), tbin)
+        keys = np.column_stack((np.round(rot / abin), np.round(te / tbin),
+                                np.round(tn / tbin))).astype(np.int64)
+        uniq, inv, votes = np.unique(keys, axis=0, return_inverse=True,
+                                     return_counts=True)
+        inv = inv.ravel()
+        best = None
+        for u in np.argsort(-votes, kind='stable')[:self.verify]:
+            sel = inv == u
+            pose = (MeanDirection(rot[sel]), np.mean(te[sel]),
+                    np.mean(tn[sel]), np.median(tz[sel]))
+            match = self._Verify(e, n, z, pose)
+            score = sum(1 for x in match if x >= 0)
+            if best is None or score > best[0]:
+                best = (score, match, pose)
+        score, match, pose = best
+        if score < 2:
+            return res, None
+        # refine pose on matched points, 2D rigid transformation
+        pose = self._Fit(e, n, z, match, pose)
+        match = self._Verify(e, n, z, pose)
+        return match, {'east': float(pose[1]), 'north': float(pose[2]),
+                       'elev': float(pose[3]),
+                       'ori': float(pose[0] % (2 * math.pi))}
+
+    def _Transform(self, e, n, z, pose):
+        """ Local coordinates to catalog system
+
+            :param e, n, z: local coordinates
+            :param pose: rotation, east, north, elev of station
+            :returns: transformed coordinates
+        """
+        c, s = math.cos(pose[0]), math.sin(pose[0])
+        return pose[1] + e * c + n * s, pose[2] + n * c - e * s, pose[3] + z
+
+    def _Verify(self, e, n, z, pose):
+        """ Nearest catalog points of measured points, one catalog point is
+            assigned to one measured point only
+
+            :returns: catalog index of measured points or -1
+        """
+        te, tn, tz = self._Transform(e, n, z, pose)
+        match = [-1] * len(e)
+        cand = []
+        for k in range(len(e)):
+            for c in self.grid.Query(te[k], tn[k], self.tol):
+                if abs(self.z[c] - tz[k]) <= 2 * self.tol:
+                    cand.append((math.hypot(self.e[c] - te[k],
+                                            self.n[c] - tn[k]), k, c))
+                    break
+        used = set()
+        for _, k, c in sorted(cand):
+            if c not in used:
+                match[k] = c
+                used.add(c)
+        return match
+
+    def _Fit(self, e, n, z, match, pose):
+        """ Least squares rigid transformation on matched points
+
+            :returns: refined pose
+        """
+        k = np.array([x for x in range(len(e)) if match[x] >= 0])
+        c = np.array([match[x] for x in k])
+        loc = n[k] + 1j * e[k]
+        ref = self.n[c] + 1j * self.e[c]
+        dl, dr = loc - loc.mean(), ref - ref.mean()
+        # rotation of local system to catalog (clockwise bearing)
+        rot = np.angle(np.sum(dr * np.conj(dl)))
+        cr, sr = math.cos(rot), math.sin(rot)
+        return (rot, float(np.mean(self.e[c] - (e[k] * cr + n[k] * sr))),
+                float(np.mean(self.n[c] - (n[k] * cr - e[k] * sr))),
+                float(np.mean(self.z[c] - z[k])))
+
+if __name__ == "__main__":
+    # compare to pair frequency voting of AnyStation on catalogs of 10, 100
+    # and 1000 points, 2 measured points are not in catalog
+    #    argv[1]: number of trials, default 10
+    import sys
+    import time
+
+    trials = int(sys.argv[1]) if len(sys.argv) > 1 else 10
+    rng = np.random.default_rng(4)
+    tol = 0.05
+
+    def Frequency(coords, e, n, z, tol):
+        """ previous AnyStation algorithm """
+        _, ce, cn, cz = Coords(coords)
+        d_abs = np.sqrt((ce[:, None] - ce) ** 2 + (cn[:, None] - cn) ** 2 +
+                        (cz[:, None] - cz) ** 2)
+        d_rel = np.sqrt((e[:, None] - e) ** 2 + (n[:, None] - n) ** 2 +
+                        (z[:, None] - z) ** 2)
+        m = len(e)
+        ids = [[] for _ in range(m)]
+        for i in range(m):
+            for j in range(i + 1, m):
+                dist = d_rel[i, j]
+                for p in range(len(coords)):
+                    for q in range(p + 1, len(coords)):
+                        if abs(d_abs[p, q] - dist) <= tol:
+                            ids[i] += [coords[p]['id'], coords[q]['id']]
+                            ids[j] += [coords[p]['id'], coords[q]['id']]
+        res = []
+        for lst in ids:
+            freq = {}
+            for item in lst:
+                freq[item] = freq.get(item, 0) + 1
+            w = sorted(freq.items(), reverse=True, key=lambda x: x[1])
+            if not w or (len(w) > 1 and w[0][1] == w[1][1]) or w[0][1] < 2:
+                res.append(None)
+            else:
+                res.append(w[0][0])
+        return res
+
+    print("catalog  method      correct  wrong  missed  time [s]")
+    for size in (10, 100, 1000):
+        side = 40.0 * math.sqrt(size)   # about the same point density
+        stats = {'frequency': [0, 0, 0, 0.0], 'hashing': [0, 0, 0, 0.0]}
+        for trial in range(trials):
+            coords = [{'id': str(i), 'east': x, 'north': y, 'elev': h}
+                      for i, (x, y, h) in enumerate(zip(
+                          rng.uniform(0, side, size), rng.uniform(0, side, size),
+                          rng.uniform(95, 105, size)))]
+            st = np.array([side / 2, side / 2, 100.0])
+            _, ce, cn, cz = Coords(coords)
+            near = np.argsort(np.hypot(ce - st[0], cn - st[1]))[:8]
+            # measured: 8 nearest catalog points + 2 unknown points, noise
+            pe = np.concatenate((ce[near], st[0] + rng.uniform(-60, 60, 2)))
+            pn = np.concatenate((cn[near], st[1] + rng.uniform(-60, 60, 2)))
+            pz = np.concatenate((cz[near], rng.uniform(95, 105, 2)))
+            truth = [coords[i]['id'] for i in near] + [None, None]
+            ori = rng.uniform(0, 2 * math.pi)
+            de, dn = pe - st[0], pn - st[1]
+            c, s = math.cos(-ori), math.sin(-ori)
+            le = de * c + dn * s + rng.normal(0, 0.003, 10)
+            ln = dn * c - de * s + rng.normal(0, 0.003, 10)
+            lz = pz - st[2] + rng.normal(0, 0.003, 10)
+            methods = [('hashing', None)]
+            if size < 1000 or trial == 0:
+                methods.append(('frequency', None))
+            for name, _ in methods:
+                t = time.perf_counter()
+                if name == 'hashing':
+                    pm = PointMatch(coords, tol)
+                    match, pose = pm.Match(le, ln, lz)
+                    ids = [pm.ids[x] if x >= 0 else None for x in match]
+                else:
+                    ids = Frequency(coords, le, ln, lz, tol)
+                stats[name][3] += time.perf_counter() - t
+                for got, want in zip(ids, truth):
+                    if got == want and want is not None:
+                        stats[name][0] += 1
+                    elif got is not None and got != want:
+                        stats[name][1] += 1
+                    elif got is None and want is not None:
+                        stats[name][2] += 1
+        for name in ('frequency', 'hashing'):
+            n_run = trials if name == 'hashing' or size < 1000 else 1
+            ok, wrong, missed, t = stats[name]
+            print("%7d  %-10s %8d %6d %7d %9.4f" %
+                  (size, name, ok, wrong, missed, t / n_run))
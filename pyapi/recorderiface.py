@@ -0,0 +1,140 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+"""
+.. module:: recorderiface.py
+   :platform: Unix, Windows
+   :synopsis: Ulyxes - an open source project to drive total stations and
+       publish observation results. GPL v2.0 license Copyright (C)
+       2010- Zoltan Siki <siki.zoltan@epito.bme.hu>.
+
+.. moduleauthor:: Zoltan Siki <siki.zoltan@epito.bme.hu>
+
+Session log format, one tab separated record per line::
+
+    start_time  duration  kind  request  answer
+
+times are seconds from the start of the session (monotonic clock), kind is
+S for Send (request and answer), L for GetLine (answer only) or P for
+PutLine (request only). The log can be served by ReplayIface.
+"""
+
+import time
+import logging
+from iface import Iface
+
+class RecorderIface(Iface):
+    """ Record the communication through an interface (SerialIface,
+        TCPIface, BluetoothIface, ...) into a session log
+
+        :param iface: interface to record (Iface)
+        :param fname: name of the log file
+        :param name: name of the interface (str), default name of the wrapped interface
+    """
+
+    def __init__(self, iface, fname, name=None):
+        """ Constructor
+        """
+        self.iface = iface
+        state = iface.state
+        super().__init__(name if name is not None else iface.GetName())
+        self.state = state
+        self.opened = True
+        self.t0 = time.monotonic()
+        self.fp = None
+        try:
+            self.fp = open(fname, 'w', encoding='ascii', errors='replace')
+        except Exception:
+            logging.error(" cannot open session log %s", fname)
+
+    def __del__(self):
+        """ Destructor
+        """
+        self.Close()
+
+    @property
+    def state(self):
+        """ state of the wrapped interface """
+        return self.iface.state
+
+    @state.setter
+    def state(self, value):
+        self.iface.state = value
+
+    @property
+    def eomRead(self):
+        """ end of message marker of the wrapped interface """
+        return getattr(self.iface, 'eomRead', None)
+
+    @eomRead.setter
+    def eomRead(self, value):
+        self.iface.eomRead = value
+
+    def Close(self):
+        """ Close the log file, the wrapped interface is not closed
+        """
+        try:
+            self.fp.close()
+        except Exception:
+            pass
+        self.fp = None
+
+    def _Record(self, start, kind, req, ans):
+        """ Write a record to the log
+
+            :param start: monotonic time of the request
+            :param kind: S/L/P
+            :param req: request (str)
+            :param ans: answer (str)
+        """
+        if self.fp is None:
+            return
+        end = time.monotonic()
+        self.fp.write("%.6f\t%.6f\t%s\t%s\t%s\n" %
+                      (start - self.t0, end - start, kind,
+                       self._Clean(req), self._Clean(ans)))
+
+    @staticmethod
+    def _Clean(txt):
+        """ Make text writable to a single field of a record
+
+            :param txt: text (str or bytes)
+            :returns: text without tabs and new lines
+        """
+        if txt is None:
+            return ''
+        if isinstance(txt, (bytes, bytearray)):
+            txt = txt.decode('ascii', 'replace')
+        return txt.replace('\t', ' ').replace('\r', '').replace('\n', ' ')
+
+    def Send(self, msg):
+        """ Send message through the wrapped interface and record it
+
+            :param msg: message to send (str)
+            :returns: answer from instrument
+        """
+        start = time.monotonic()
+        ans = self.iface.Send(msg)
+        self._Record(start, 'S', msg, ans)
+        return ans
+
+    def GetLine(self, *args):
+        """ Read a line from the wrapped interface and record it
+
+            :returns: line read
+        """
+        start = time.monotonic()
+        ans = self.iface.GetLine(*args)
+        if not args:    # binary data are not recorded
+            self._Record(start, 'L', '', ans)
+        return ans
+
+    def PutLine(self, msg):
+        """ Send a line through the wrapped interface and record it
+
+            :param msg: message to send (str)
+            :returns: result of the wrapped interface
+        """
+        start = time.monotonic()
+        res = self.iface.PutLine(msg)
+        self._Record(start, 'P', msg, '')
+        return res
@@ -12,11 +12,11 @@
 import sys
 import json
 import re
+import time
+import struct
 from measureunit import MeasureUnit
 from angle import Angle
 import logging
-import json
-import io
 import os
 
 
@@ -68,8 +68,6 @@ class RemoteMeasureUnit(MeasureUnit):
         'SETSPIRAL': 9041,
         'SEARCHTARGET': 17020,
         'TAKEPHOTO': 501,
-        #'GETCONTRAST': 502,
-        #'TRIAL': -1
     }
 
     edmModes = {'STANDARD': 0, 'PRECISE': 1, 'FAST': 2, 'TRACKING': 3,
@@ -78,10 +76,224 @@ class RemoteMeasureUnit(MeasureUnit):
 
     edmProg = {'STOP': 0, 'DEFAULT': 1, 'TRACKING': 2, 'CLEAR': 3}
 
-    def __init__(self, name = 'REMOTE STATION', typ = 'VIRTUAL'):
+    # dispatch table of requests, method of instrument and parameters in the
+    # order of binary requests
+    rpc = {
+        'SWITCHON': ('SwitchOn', ('mode',)),
+        'SWITCHOFF': ('SwitchOff', ()),
+        'SETPC': ('SetPc', ('pc',)),
+        'GETPC': ('GetPc', ()),
+        'INSTRNO': ('GetInstrumentNo', ()),
+        'INSTRNAME': ('GetInstrumentName', ()),
+        'INTTEMP': ('GetInternalTemperature', ()),
+        'SETATR': ('SetATR', ('atr',)),
+        'GETATR': ('GetATR', ()),
+        'SETLOCK': ('SetLock', ('lock',)),
+        'GETLOCK': ('GetLock', ()),
+        'LOCKIN': ('LockIn', ()),
+        'SETATMCORR': ('SetAtmCorr', ('valueOfLambda', 'pres', 'dry', 'wet')),
+        'GETATMCORR': ('GetAtmCorr', ()),
+        'SETREFCORR': ('SetRefCorr', ('status', 'earthRadius', 'refracticeScale')),
+        'GETREFCORR': ('GetRefCorr', ()),
+        'GETSTN': ('GetStation', ()),
+        'SETSTN': ('SetStation', ('e', 'n', 'z', 'ih')),
+        'SETEDMMODE': ('SetEDMMode', ('mode',)),
+        'GETEDMMODE': ('GetEDMMode', ()),
+        'SETORI': ('SetOri', ('ori',)),
+        'MOVE': ('Move', ('hz', 'v', 'atr')),
+        'MEASURE': ('Measure', ('prg', 'incl')),
+        'GETMEASURE': ('GetMeasure', ('wait', 'incl')),
+        'MEASUREANGDIST': ('MeasureDistAng', ('prg',)),
+        'COORDS': ('Coords', ('wait', 'incl')),
+        'GETANGLES': ('GetAngles', ()),
+        'CHANGEFACE': ('ChangeFace', ()),
+        'GETPT': ('GetPrismType', ()),
+        'SETPT': ('SetPrismType', ('typ',)),
+        'GETSPIRAL': ('GetSpiral', ()),
+        'SETSPIRAL': ('SetSpiral', ('dRangeHz', 'dRangeV')),
+        'SEARCHTARGET': ('SearchTarget', ()),
+    }
+    angleParams = ('hz', 'v', 'ori')    # sent in radians
+    cmdNames = {code: name for name, code in codes.items()}
+
+    # binary frames, numbers are big endian
+    VERSION = 1
+    reqHead = struct.Struct('!BHHf')    # version, calls, repetitions, period
+    ansHead = struct.Struct('!BHH')     # version, repetition, calls
+    callHead = struct.Struct('!H')      # command code
+    resHead = struct.Struct('!hB')      # error code, number of items
+    # keys of results sent in one byte, others as string after 255
+    keys = ('atrStatus', 'crossincline', 'distance', 'dryTemp',
+            'earthRadius', 'east', 'edmMode', 'elev', 'errorCode', 'hz',
+            'hzRange', 'ih', 'instrName', 'instrNo', 'intTemp', 'lambda',
+            'lengthincline', 'lockStat', 'north', 'pc', 'pressure', 'pt',
+            'refractiveScale', 'status', 'v', 'vRange', 'wetTemp', 'ret',
+            'binsize', 'time')
+    keyIndex = {k: i for i, k in enumerate(keys)}
+    _i = struct.Struct('!i')
+    _q = struct.Struct('!q')
+    _d = struct.Struct('!d')
+    _H = struct.Struct('!H')
+    _I = struct.Struct('!I')
+
+    def __init__(self, name = 'REMOTE STATION', typ = 'VIRTUAL', binary=False):
         """ Constructor to remote total station
+
+            :param binary: use binary requests instead of JSON, default False
         """
         super(RemoteMeasureUnit, self).__init__(name, typ)
+        self.binary = binary
+
+    def _Msg(self, cmd, params):
+        """ Create request
+
+            :param cmd: name of command (str)
+            :param params: parameters of command (dict)
+            :returns: JSON request (str) or binary request (bytes)
+        """
+        if not self.binary or cmd not in self.rpc:
+            # photos are always requested in JSON
+            msg = {'cmd': self.codes[cmd], 'params': params}
+            return json.dumps(msg)
+        buf = bytearray(self.reqHead.pack(self.VERSION, 1, 1, 0.0))
+        buf += self.callHead.pack(self.codes[cmd])
+        for name in self.rpc[cmd][1]:
+            self._Pack(buf, params.get(name))
+        return bytes(buf)
+
+    def BatchMsg(self, msgs):
+        """ Join requests to execute them in one message
+
+            :param msgs: requests (list)
+            :returns: batch request
+        """
+        if not self.binary:
+            return '|'.join(msgs)
+        n = 0
+        body = bytearray()
+        for msg in msgs:
+            n += self.reqHead.unpack_from(msg)[1]
+            body += msg[self.reqHead.size:]
+        return self.reqHead.pack(self.VERSION, n, 1, 0.0) + bytes(body)
+
+    def StreamMsg(self, msg, count, period=0.0):
+        """ Repeat a (batch) request on the server and stream the answers,
+            see Stream
+
+            :param msg: binary request
+            :param count: number of repetitions (max 65535)
+            :param period: minimal seconds between repetitions
+            :returns: streamed request (bytes)
+        """
+        if not self.binary:
+            logging.error(" streaming needs binary requests")
+            return msg
+        n = self.reqHead.unpack_from(msg)[1]
+        return self.reqHead.pack(self.VERSION, n, count, period) + \
+            msg[self.reqHead.size:]
+
+    def Stream(self, iface, msg):
+        """ Send a streamed request and yield the parsed answers
+
+            :param iface: interface with frames (TCPIface)
+            :param msg: streamed request (see StreamMsg)
+            :returns: generator of parsed answers (dict)
+        """
+        if iface.PutFrame(msg) != 0:
+            return
+        for _ in range(self.reqHead.unpack_from(msg)[2]):
+            ans = iface.GetFrame()
+            if ans is None:
+                return
+            yield self.Result(msg, ans)
+
+    @classmethod
+    def _Pack(cls, buf, val):
+        """ Append a tagged value to a binary message
+
+            :param buf: message (bytearray)
+            :param val: None, bool, int, float, Angle, str or bytes
+        """
+        if val is None:
+            buf += b'N'
+        elif val is True or val is False:
+            buf += b'T' if val else b'F'
+        elif isinstance(val, int):
+            if -0x80000000 <= val < 0x80000000:
+                buf += b'i' + cls._i.pack(val)
+            else:
+                buf += b'q' + cls._q.pack(val)
+        elif isinstance(val, float):
+            buf += b'd' + cls._d.pack(val)
+        elif isinstance(val, Angle):
+            buf += b'a' + cls._d.pack(val.GetAngle())
+        elif isinstance(val, (bytes, bytearray)):
+            buf += b'b' + cls._I.pack(len(val)) + val
+        else:
+            val = str(val).encode('utf-8')
+            buf += b's' + cls._H.pack(len(val)) + val
+
+    @classmethod
+    def _Unpack(cls, data, pos):
+        """ Read a tagged value from a binary message
+
+            :param data: message (bytes)
+            :param pos: position of tag
+            :returns: value and position after it
+        """
+        tag = data[pos]
+        pos += 1
+        if tag == 0x64:     # d
+            return cls._d.unpack_from(data, pos)[0], pos + 8
+        if tag == 0x61:     # a
+            return Angle(cls._d.unpack_from(data, pos)[0]), pos + 8
+        if tag == 0x69:     # i
+            return cls._i.unpack_from(data, pos)[0], pos + 4
+        if tag == 0x73:     # s
+            n = cls._H.unpack_from(data, pos)[0]
+            pos += 2
+            return bytes(data[pos:pos+n]).decode('utf-8'), pos + n
+        if tag == 0x4e:     # N
+            return None, pos
+        if tag == 0x54 or tag == 0x46:  # T F
+            return tag == 0x54, pos
+        if tag == 0x71:     # q
+            return cls._q.unpack_from(data, pos)[0], pos + 8
+        if tag == 0x62:     # b
+            n = cls._I.unpack_from(data, pos)[0]
+            pos += 4
+            return bytes(data[pos:pos+n]), pos + n
+        raise ValueError("invalid tag")
+
+    def _ResultFrame(self, ans):
+        """ Parse binary answer
+
+            :param ans: binary answer (bytes)
+            :returns: dictionary of results of all calls
+        """
+        res = {}
+        try:
+            _, _, n = self.ansHead.unpack_from(ans)
+            pos = self.ansHead.size
+            for _ in range(n):
+                err, items = self.resHead.unpack_from(ans, pos)
+                pos += self.resHead.size
+                for _ in range(items):
+                    k = ans[pos]
+                    if k == 255:
+                        key, pos = self._Unpack(ans, pos + 1)
+                    else:
+                        key = self.keys[k]
+                        pos += 1
+                    res[key], pos = self._Unpack(ans, pos)
+                if err != 0:
+                    res['errorCode'] = err
+        except (struct.error, ValueError, IndexError):
+            res['errorCode'] = -1   # invalid answer
+        if 'errorCode' in res:
+            logging.error(" error from instrument: %d", res['errorCode'])
+        return res
+
     def Result(self, msgs, anss):
         """ Parse answer from message
 
@@ -89,6 +301,8 @@ class RemoteMeasureUnit(MeasureUnit):
             :param anss: aswers got from server
             :returns: dictionary
         """
+        if isinstance(msgs, bytes) and isinstance(anss, (bytes, bytearray)):
+            return self._ResultFrame(anss)
         msgList = re.split('\|', msgs)
         if isinstance(anss, str):
             ansList = re.split('\|', anss)
@@ -104,8 +318,9 @@ class RemoteMeasureUnit(MeasureUnit):
 
                     params = ansBufflist['params']
                     for key, val in params.items():
-                        if not isinstance(val, io.BytesIO):
-                            res[key] = eval(val)
+                        # JSON typed values, angles are tagged
+                        if isinstance(val, dict) and 'angle' in val:
+                            res[key] = Angle(val['angle'])
                         else:
                             res[key] = val
                 except ValueError:
@@ -119,6 +334,22 @@ class RemoteMeasureUnit(MeasureUnit):
             return res
         else:
             return anss
+
+    @staticmethod
+    def _Call(ts, name, args):
+        """ Call the method of an instrument from the dispatch table
+
+            :param ts: totalstation what execute the request
+            :param name: name of command (str)
+            :param args: parameters in the order of the dispatch table (list)
+            :returns: result of the method (dict)
+        """
+        method, names = RemoteMeasureUnit.rpc[name]
+        args = [Angle(a) if n in RemoteMeasureUnit.angleParams and
+                not isinstance(a, Angle) else a for n, a in zip(names, args)]
+        res = getattr(ts, method)(*args)
+        return res if isinstance(res, dict) else {}
+
     @staticmethod
     def execCmd(ts, msg):
         """Execute the adopted requests
@@ -132,133 +363,131 @@ class RemoteMeasureUnit(MeasureUnit):
         msgBufflist = json.loads(msg.decode('ascii'))
         cmd = msgBufflist['cmd']
         params = msgBufflist['params']
-        res = {'params': None, 'err': None}
+        res = {'params': {}, 'err': 0}
         file = None
-        #try:
-        res['err'] = 0
-        if cmd == RemoteMeasureUnit.codes['GETMEASURE']:
-            res['params'] = ts.GetMeasure(params['wait'], params['incl'])
-        elif cmd == RemoteMeasureUnit.codes['MEASUREANGDIST']:
-            res['params'] = ts.MeasureDistAng(params['prg'])
-        elif cmd == RemoteMeasureUnit.codes['GETPC']:
-            res['params'] = ts.GetPc(params['prg'])
-        elif cmd == RemoteMeasureUnit.codes['GETPT']:
-            res['params'] = ts.GetPrismType()
-        elif cmd == RemoteMeasureUnit.codes['GETATR']:
-            res['params'] = ts.GetATR()
-        elif cmd == RemoteMeasureUnit.codes['GETLOCK']:
-            res['params'] = ts.GetLock()
-        elif cmd == RemoteMeasureUnit.codes['GETATMCORR']:
-            res['params'] = ts.GetAtmCorr()
-        elif cmd == RemoteMeasureUnit.codes['GETREFCORR']:
-            res['params'] = ts.GetRefCorr()
-        elif cmd == RemoteMeasureUnit.codes['GETSTN']:
-            res['params'] = ts.GetStation()
-        elif cmd == RemoteMeasureUnit.codes['GETEDMMODE']:
-            res['params'] = ts.GetEDMMode()
-        elif cmd == RemoteMeasureUnit.codes['COORDS']:
-            res['params'] = ts.Coords(params['wait'], params['incl'])
-        elif cmd == RemoteMeasureUnit.codes['GETANGLES']:
-            res['params'] = ts.GetAngles()
-        elif cmd == RemoteMeasureUnit.codes['GETSPIRAL']:
-            res['params'] = ts.GetSpiral()
-        elif cmd == RemoteMeasureUnit.codes['SETSPIRAL']:
-            res['params'] = ts.SetSpiral(params['dRangeHz'], params['dRangeV'])
-        elif cmd == RemoteMeasureUnit.codes['INSTRNO']:
-            res['params'] = ts.GetInstrumentNo()
-        elif cmd == RemoteMeasureUnit.codes['INSTRNAME']:
-            res['params'] = ts.GetInstrumentName()
-        elif cmd == RemoteMeasureUnit.codes['INTTEMP']:
-            res['params'] = ts.GetInternalTemperature()
-        elif cmd == RemoteMeasureUnit.codes['SWITCHOFF']:
-            res['params'] = ts.SwitchOff()
-        elif cmd == RemoteMeasureUnit.codes['SWITCHON']:
-            res['params'] = ts.SwitchOn(params['mode'])
-        elif cmd == RemoteMeasureUnit.codes['SEARCHTARGET']:
-            res['params'] = ts.SearchTarget()
-        elif cmd == RemoteMeasureUnit.codes['CHANGEFACE']:
-            res['params'] = ts.ChangeFace()
-        elif cmd == RemoteMeasureUnit.codes['SETORI']:
-            res['params'] = ts.SetOri(params['ori'])
-        elif cmd == RemoteMeasureUnit.codes['SETEDMMODE']:
-            res['params'] = ts.SetEDMMode(str(params['mode']))
-        elif cmd == RemoteMeasureUnit.codes['SETSTN']:
-            res['params'] = ts.SetStation(params['e'], params['n'], params['z'], params['ih'])
-        elif cmd == RemoteMeasureUnit.codes['SETREFCORR']:
-            res['params'] = ts.SetRefCorr(params['status'], params['earthRadius'], params['refracticeScale'])
-        elif cmd == RemoteMeasureUnit.codes['SETATMCORR']:
-            res['params'] = ts.SetAtmCorr(params['valueOfLambda'], params['pres'], params['dry'], params['wet'])
-        elif cmd == RemoteMeasureUnit.codes['LOCKIN']:
-            res['params'] = ts.LockIn()
-        elif cmd == RemoteMeasureUnit.codes['SETLOCK']:
-            res['params'] = ts.SetLock(params['lock'])
-        elif cmd == RemoteMeasureUnit.codes['SETATR']:
-            res['params'] = ts.SetATR(params['atr'])
-        elif cmd == RemoteMeasureUnit.codes['SETPC']:
-            res['params'] = ts.SetPc(params['pc'])
-        elif cmd == RemoteMeasureUnit.codes['SETPT']:
-            res['params'] = ts.SetPrismType(params['typ'])
-        elif cmd == RemoteMeasureUnit.codes['MEASURE']:
-            res['params'] = ts.Measure(params['prg'], params['incl'])
-        elif cmd == RemoteMeasureUnit.codes['GETMEASURE']:
-            res['params'] = ts.GetMeasure()
-        elif cmd == RemoteMeasureUnit.codes['MOVE']:
-            res['params'] = ts.Move(Angle(params['hz']), Angle(params['v']), params['atr'])
-        #elif cmd == RemoteMeasureUnit.codes['AUTOFOCUS']:
-            #res['params'] = ts.AutoFocus(params['dir'])
-        elif cmd == RemoteMeasureUnit.codes['TAKEPHOTO']:
+        name = RemoteMeasureUnit.cmdNames.get(cmd)
+        if name == 'TAKEPHOTO':
             file = open(params['pic'], 'w+b')
             ts.TakePhoto(file, params['resolution'])
-            #file = res2['pic']
             file.seek(0, os.SEEK_END)
-            #print(binaryData)
-
             size = int(file.tell())
             res['params'] = {'ret': 0, 'binsize': size}
-
-        #elif cmd == RemoteMeasureUnit.codes['STARTCAMVIEW']:
-            #res['params'] = ts.StartCameraView()
-        #elif cmd == RemoteMeasureUnit.codes['STOPCAMVIEW']:
-            #res['params'] = ts.StopCameraView()
-        elif cmd == RemoteMeasureUnit.codes['TRIAL']:
-            res['params'] = ts.Trial(params['param1'])
-        #except:
-            #res['err'] = 1
+        elif name in RemoteMeasureUnit.rpc:
+            res['params'] = RemoteMeasureUnit._Call(ts, name,
+                [params[n] for n in RemoteMeasureUnit.rpc[name][1]])
+        else:
+            logging.error(" unknown command %s", cmd)
+            res['err'] = -1
         for key, val in res['params'].items():
-            res['params'][key] = repr(val)
+            if isinstance(val, Angle):
+                res['params'][key] = {'angle': val.GetAngle()}
 
         return json.dumps(res).encode('ascii'), file
 
-    def TakePhotoMsg(self, pic, resolution):
-        """Take photo
+    @staticmethod
+    def parseFrame(frame):
+        """Parse a binary request
+
+            :param frame: binary request without length prefix (bytes)
+            :returns: calls (list of name and arguments), number of repetitions and their period or None if invalid
+        """
+        rmu = RemoteMeasureUnit
+        calls = []
+        try:
+            version, n, count, period = rmu.reqHead.unpack_from(frame)
+            if version != rmu.VERSION:
+                raise ValueError("unsupported version")
+            pos = rmu.reqHead.size
+            for _ in range(n):
+                code = rmu.callHead.unpack_from(frame, pos)[0]
+                pos += rmu.callHead.size
+                name = rmu.cmdNames.get(code)
+                if name not in rmu.rpc:
+                    raise ValueError("unknown command %d" % code)
+                args = []
+                for _ in rmu.rpc[name][1]:
+                    a, pos = rmu._Unpack(frame, pos)
+                    args.append(a)
+                calls.append((name, args))
+        except (struct.error, ValueError, IndexError):
+            logging.error(" invalid binary request")
+            return None
+        return calls, count, period
 
-            :param pic: writable binary file
-            :param resolution: resolution of picture
+    @staticmethod
+    def errorFrame():
+        """Binary answer to an invalid request
 
-            :returns: request msg in json
+            :returns: binary answer (bytes)
         """
+        rmu = RemoteMeasureUnit
+        return rmu.ansHead.pack(rmu.VERSION, 0, 1) + rmu.resHead.pack(-1, 0)
 
-        params = {'pic': pic.name, 'resolution': resolution}
-        msg = {'cmd': self.codes['TAKEPHOTO'], 'params': params}
-        return json.dumps(msg)
+    @staticmethod
+    def execCalls(ts, calls, rep=0):
+        """Execute the calls of a parsed binary request once
 
-    def StartCameraViewMsg(self):
-        """Start camera preview
+            :param ts: totalstation what execute the requests
+            :param calls: calls from parseFrame
+            :param rep: index of repetition, default 0
+            :returns: binary answer (bytes)
+        """
+        rmu = RemoteMeasureUnit
+        buf = bytearray(rmu.ansHead.pack(rmu.VERSION, rep, len(calls)))
+        for name, args in calls:
+            try:
+                res = rmu._Call(ts, name, args)
+            except Exception:
+                logging.error(" command failed %s", name)
+                res = {'errorCode': -1}
+            err = res.get('errorCode', 0)
+            items = [(k, v) for k, v in res.items() if k != 'errorCode']
+            buf += rmu.resHead.pack(err if -0x8000 <= err < 0x8000 else -1,
+                                    len(items))
+            for k, v in items:
+                i = rmu.keyIndex.get(k)
+                if i is None:
+                    buf.append(255)
+                    rmu._Pack(buf, k)
+                else:
+                    buf.append(i)
+                rmu._Pack(buf, v)
+        return bytes(buf)
 
-            :returns: request msg in json
-        """
-        params = {}
-        msg = {'cmd': self.codes['STARTCAMVIEW'], 'params': params}
-        return json.dumps(msg)
+    @staticmethod
+    def execFrame(ts, frame, send):
+        """Execute a binary request, streamed requests are repeated
 
-    def StopCameraViewMsg(self):
-        """Stop camera preview
+            :param ts: totalstation what execute the requests
+            :param frame: binary request without length prefix (bytes)
+            :param send: function called with each binary answer (bytes)
+            :returns: number of answers sent
+        """
+        rmu = RemoteMeasureUnit
+        req = rmu.parseFrame(frame)
+        if req is None:
+            send(rmu.errorFrame())
+            return 1
+        calls, count, period = req
+        for rep in range(max(count, 1)):
+            start = time.monotonic()
+            send(rmu.execCalls(ts, calls, rep))
+            wait = period - (time.monotonic() - start)
+            if rep + 1 < count and wait > 0:
+                time.sleep(wait)
+        return max(count, 1)
+
+    def TakePhotoMsg(self, pic, resolution):
+        """Take photo
+
+            :param pic: writable binary file
+            :param resolution: resolution of picture
 
             :returns: request msg in json
         """
-        params = {}
-        msg = {'cmd': self.codes['STOPCAMVIEW'], 'params': params}
-        return json.dumps(msg)
+
+        params = {'pic': pic.name, 'resolution': resolution}
+        return self._Msg('TAKEPHOTO', params)
 
     #def AutoFocusMsg(dir):
 
@@ -267,16 +496,6 @@ class RemoteMeasureUnit(MeasureUnit):
         #return json.dumps(msg)
 
 
-    def GetContrastMsg(self, mask):
-        """Get contrast
-
-            :param mask: picture mask
-            :returns: request msg in json
-        """
-        params = {'mask': mask}
-        msg = {'cmd': self.codes['GETCONTRAST'], 'params': params}
-        return json.dumps(msg)
-
 
     def SetPcMsg(self, pc):
         """ Set prism constant
@@ -286,8 +505,7 @@ class RemoteMeasureUnit(MeasureUnit):
         """
 
         params = {'pc': pc}
-        msg = {'cmd': self.codes['SETPC'], 'params': params}
-        return json.dumps(msg)
+        return self._Msg('SETPC', params)
 
     def GetPcMsg(self):
         """ Get prism constant
@@ -295,8 +513,7 @@ class RemoteMeasureUnit(MeasureUnit):
             :returns: get prism constant message
         """
         params = {}
-        msg = {'cmd': self.codes['GETPC'], 'params': params}
-        return json.dumps(msg)
+        return self._Msg('GETPC', params)
 
     def SetPrismTypeMsg(self, typ):
         """ Set prism type
@@ -304,8 +521,7 @@ class RemoteMeasureUnit(MeasureUnit):
             :param typ: prism type (0/1/2/3/4/5/6/7 round/mini/tape/360/user1/user2/user3/360 mini)
         """
         params = {'typ': typ}
-        msg = {'cmd': self.codes['SETPT'], 'params': params}
-        return json.dumps(msg)
+        return self._Msg('SETPT', params)
 
     def GetPrismTypeMsg(self):
         """ Get prism type
@@ -313,8 +529,7 @@ class RemoteMeasureUnit(MeasureUnit):
             :returns: prism type (0/1/2/3/4/5/6/7 round/mini/tape/360/user1/user2/user3/360 mini)
         """
         params = {}
-        msg = {'cmd': self.codes['GETPT'], 'params': params}
-        return json.dumps(msg)
+        return self._Msg('GETPT', params)
 
     def SetATRMsg(self, atr):
         """ Set ATR status on/off
@@ -323,8 +538,7 @@ class RemoteMeasureUnit(MeasureUnit):
             :returns: set atr message string
         """
         params = {'atr': atr}
-        msg = {'cmd': self.codes['SETATR'], 'params': params}
-        return json.dumps(msg)
+        return self._Msg('SETATR', params)
 
     def GetATRMsg(self):
         """ Get ATR status
@@ -332,8 +546,7 @@ class RemoteMeasureUnit(MeasureUnit):
             :returns: get atr message
         """
         params = {}
-        msg = {'cmd': self.codes['GETATR'], 'params': params}
-        return json.dumps(msg)
+        return self._Msg('GETATR', params)
 
     def SetLockMsg(self, lock):
         """ Set Lock status
@@ -341,9 +554,8 @@ class RemoteMeasureUnit(MeasureUnit):
             :param lock: 0/1 = off/on
             :returns: set lock status message
         """
-        params = {'lock', lock}
-        msg = {'cmd': self.codes['SETLOCK'], 'params': params}
-        return json.dumps(msg)
+        params = {'lock': lock}
+        return self._Msg('SETLOCK', params)
 
     def GetLockMsg(self):
         """ Get Lock status
@@ -351,8 +563,7 @@ class RemoteMeasureUnit(MeasureUnit):
             :returns: get lock status message
         """
         params = {}
-        msg = {'cmd': self.codes['GETLOCK'], 'params': params}
-        return json.dumps(msg)
+        return self._Msg('GETLOCK', params)
 
     def LockInMsg(self):
         """ Activate lock
@@ -360,8 +571,7 @@ class RemoteMeasureUnit(MeasureUnit):
             :returns: active lock message
         """
         params = {}
-        msg = {'cmd': self.codes['LOCKIN'], 'params': params}
-        return json.dumps(msg)
+        return self._Msg('LOCKIN', params)
 
     def SetAtmCorrMsg(self, valueOfLambda, pres, dry, wet):
         """ Set atmospheric correction settings
@@ -373,8 +583,7 @@ class RemoteMeasureUnit(MeasureUnit):
             :returns: set atmospheric correction message
         """
         params = {'valueOfLambda': valueOfLambda, 'pres': pres, 'dry': dry, 'wet': wet}
-        msg = {'cmd': self.codes['SETATMCORR'], 'params': params}
-        return json.dumps(msg)
+        return self._Msg('SETATMCORR', params)
 
     def GetAtmCorrMsg(self):
         """ Get atmospheric correction settings
@@ -382,8 +591,7 @@ class RemoteMeasureUnit(MeasureUnit):
             :returns: iget atmospheric settings message
         """
         params = {}
-        msg = {'cmd': self.codes['GETATMCORR'], 'params': params}
-        return json.dumps(msg)
+        return self._Msg('GETATMCORR', params)
 
     def SetRefCorrMsg(self, status, earthRadius, refracticeScale):
         """ Set refraction correction settings
@@ -394,8 +602,7 @@ class RemoteMeasureUnit(MeasureUnit):
             :returns: set refraction message
         """
         params = {'status': status, 'earthRadius': earthRadius, 'refracticeScale': refracticeScale}
-        msg = {'cmd': self.codes['SETREFCORR'], 'params': params}
-        return json.dumps(msg)
+        return self._Msg('SETREFCORR', params)
 
     def GetRefCorrMsg(self):
         """ Get refraction correction setting
@@ -404,8 +611,7 @@ class RemoteMeasureUnit(MeasureUnit):
 
         """
         params = {}
-        msg = {'cmd': self.codes['GETREFCORR'], 'params': params}
-        return json.dumps(msg)
+        return self._Msg('GETREFCORR', params)
 
     def SetStationMsg(self, e, n, z, ih=0.0):
         """ Set station coordinates
@@ -417,8 +623,7 @@ class RemoteMeasureUnit(MeasureUnit):
             :returns: set station coordinates message
         """
         params = {'e': e, 'n': n, 'z': z, 'ih': ih}
-        msg = {'cmd': self.codes['SETSTN'], 'params': params}
-        return json.dumps(msg)
+        return self._Msg('SETSTN', params)
 
     def GetStationMsg(self):
         """ Get station coordinates
@@ -427,8 +632,7 @@ class RemoteMeasureUnit(MeasureUnit):
 
         """
         params = {}
-        msg = {'cmd': self.codes['GETSTN'], 'params': params}
-        return json.dumps(msg)
+        return self._Msg('GETSTN', params)
 
     def SetEDMModeMsg(self, mode):
         """ Set EDM mode
@@ -441,8 +645,7 @@ class RemoteMeasureUnit(MeasureUnit):
         #els#e:
             #imode = mode
         params = {'mode': mode}
-        msg = {'cmd': self.codes['SETEDMMODE'], 'params': params}
-        return json.dumps(msg)
+        return self._Msg('SETEDMMODE', params)
 
     def GetEDMModeMsg(self):
         """ Get EDM mode
@@ -450,8 +653,7 @@ class RemoteMeasureUnit(MeasureUnit):
             :returns: get edm mode message
         """
         params = {}
-        msg = {'cmd': self.codes['GETEDMMODE'], 'params': params}
-        return json.dumps(msg)
+        return self._Msg('GETEDMMODE', params)
 
     def SetOriMsg(self, ori):
         """ Set orientation angle
@@ -460,8 +662,7 @@ class RemoteMeasureUnit(MeasureUnit):
             :returns: 0 or error code
         """
         params = {'ori': ori.GetAngle('RAD')}
-        msg = {'cmd': self.codes['SETORI'], 'params': params}
-        return json.dumps(msg)
+        return self._Msg('SETORI', params)
 
     def MoveMsg(self, hz, v, atr = 0):
         """ Rotate instrument to direction with ATR or without ATR
@@ -473,8 +674,7 @@ class RemoteMeasureUnit(MeasureUnit):
 
         """
         params = {'hz': hz.GetAngle('RAD'), 'v': v.GetAngle('RAD'), 'atr': atr}
-        msg = {'cmd': self.codes['MOVE'], 'params': params}
-        return json.dumps(msg)
+        return self._Msg('MOVE', params)
 
     def MeasureMsg(self, prg=1, incl=0):
         """ Measure distance
@@ -485,8 +685,7 @@ class RemoteMeasureUnit(MeasureUnit):
             :returns: measure message
         """
         params = {'prg': prg, 'incl': incl}
-        msg = {'cmd': self.codes['MEASURE'], 'params': params}
-        return json.dumps(msg)
+        return self._Msg('MEASURE', params)
 
     def GetMeasureMsg(self, wait=15000, incl=0):
         """ Get measured distance
@@ -497,8 +696,7 @@ class RemoteMeasureUnit(MeasureUnit):
         """
 
         params = {'wait': wait, 'incl': incl}
-        msg = {'cmd': self.codes['GETMEASURE'], 'params': params}
-        return json.dumps(msg)
+        return self._Msg('GETMEASURE', params)
 
     def MeasureDistAngMsg(self, prg):
         """ Measure angles and distance
@@ -511,8 +709,7 @@ class RemoteMeasureUnit(MeasureUnit):
             prg = self.edmProg[prg]
 
         params = {'prg': prg}
-        msg = {'cmd': self.codes['MEASUREANGDIST'], 'params': params}
-        return json.dumps(msg)
+        return self._Msg('MEASUREANGDIST', params)
 
     def CoordsMsg(self, wait=15000, incl=0):
         """ Get coordinates
@@ -522,8 +719,7 @@ class RemoteMeasureUnit(MeasureUnit):
             :returns: get coordinates message
         """
         params = {'wait': wait, 'incl': incl}
-        msg = {'cmd': self.codes['COORDS'], 'params': params}
-        return json.dumps(msg)
+        return self._Msg('COORDS', params)
 
     def GetAnglesMsg(self):
         """ Get angles
@@ -531,8 +727,7 @@ class RemoteMeasureUnit(MeasureUnit):
             :returns: get angles message
         """
         params = {}
-        msg = {'cmd': self.codes['GETANGLES'], 'params': params}
-        return json.dumps(msg)
+        return self._Msg('GETANGLES', params)
 
     def ClearDistanceMsg(self):
         """ Clearing distance
@@ -547,8 +742,7 @@ class RemoteMeasureUnit(MeasureUnit):
             :returns: change face message
         """
         params = {}
-        msg = {'cmd': self.codes['CHANGEFACE'], 'params': params}
-        return json.dumps(msg)
+        return self._Msg('CHANGEFACE', params)
 
     def GetSpiralMsg(self):
         """ Get search spiral parameters
@@ -556,8 +750,7 @@ class RemoteMeasureUnit(MeasureUnit):
             :returns: get spiral message
         """
         params = {}
-        msg = {'cmd': self.codes['GETSPIRAL'], 'params': params}
-        return json.dumps(msg)
+        return self._Msg('GETSPIRAL', params)
 
     def SetSpiralMsg(self, dRangeHz, dRangeV):
         """ Set search priral parameters
@@ -567,8 +760,7 @@ class RemoteMeasureUnit(MeasureUnit):
             :returns: set search spiral message
         """
         params = {'dRangeHz': dRangeHz, 'dRangeV': dRangeV}
-        msg = {'cmd': self.codes['SETSPIRAL'], 'params': params}
-        return json.dumps(msg)
+        return self._Msg('SETSPIRAL', params)
 
     def SearchTargetMsg(self):
         """ Search target using user spiral
@@ -576,8 +768,7 @@ class RemoteMeasureUnit(MeasureUnit):
             :returns: Search target message
         """
         params = {}
-        msg = {'cmd': self.codes['SEARCHTARGET'], 'params': params}
-        return json.dumps(msg)
+        return self._Msg('SEARCHTARGET', params)
 
     def SwitchOnMsg(self, mode=1):
         """ Switch on instrument or wake up and change to remote mode
@@ -586,8 +777,7 @@ class RemoteMeasureUnit(MeasureUnit):
             :returns: switch on message
         """
         params = {'mode': mode}
-        msg = {'cmd': self.codes['SWITCHON'], 'params': params}
-        return json.dumps(msg)
+        return self._Msg('SWITCHON', params)
 
     def SwitchOffMsg(self):
         """ Switch off instrument
@@ -595,8 +785,7 @@ class RemoteMeasureUnit(MeasureUnit):
             :returns: switch off message
         """
         params = {}
-        msg = {'cmd': self.codes['SWITCHOFF'], 'params': params}
-        return json.dumps(msg)
+        return self._Msg('SWITCHOFF', params)
 
     def GetInstrumentNoMsg(self):
         """ Get instrument factory number
@@ -604,8 +793,7 @@ class RemoteMeasureUnit(MeasureUnit):
             :returns: get instrument factory number message
         """
         params = {}
-        msg = {'cmd': self.codes['INSTRNO'], 'params': params}
-        return json.dumps(msg)
+        return self._Msg('INSTRNO', params)
 
     def GetInstrumentNameMsg(self):
         """ Get instrument name
@@ -613,8 +801,7 @@ class RemoteMeasureUnit(MeasureUnit):
             :returns: get instrument name
         """
         params = {}
-        msg = {'cmd': self.codes['INSTRNAME'], 'params': params}
-        return json.dumps(msg)
+        return self._Msg('INSTRNAME', params)
 
     def GetInternalTemperatureMsg(self):
         """ Get instrument internal temperature
@@ -622,13 +809,7 @@ class RemoteMeasureUnit(MeasureUnit):
             :returns: instrument internal temperature
         """
         params = {}
-        msg = {'cmd': self.codes['INTTEMP'], 'params': params}
-        return json.dumps(msg)
-
-    def TrialMsg(self, param):
-        params = {'param1': param}
-        msg = {'cmd': self.codes['TRIAL'], 'params': params}
-        return json.dumps(msg)
+        return self._Msg('INTTEMP', params)
 
     def __repr__(self):
         """
@@ -636,3 +817,90 @@ class RemoteMeasureUnit(MeasureUnit):
             :returns: RemoteMeasureUnit object string
         """
         return type(self).__name__+'(name="{0:s}", typ="{1:s}", measuerUnit="{2:s}")'.format(str(self.name), str(self.typ), repr(self.measureUnit))
+
+if __name__ == "__main__":
+    # compare JSON and binary requests, payload sizes and per-call overhead
+    # of the format alone, then on loopback through InstrumentGateway with a
+    # simulated instrument
+    #    argv[1]: number of calls, default 2000
+    import asyncio
+    import threading
+    from simiface import SimIface
+    from broker import Broker
+    from tcpiface import TCPIface
+    from totalstation import TotalStation
+    from leicatps1200 import LeicaTPS1200
+    from instrumentgateway import InstrumentGateway
+
+    n = int(sys.argv[1]) if len(sys.argv) > 1 else 2000
+
+    class Fixed(object):
+        """ instrument answering constant observations """
+        def GetAngles(self):
+            return {'hz': Angle(1.2345678901), 'v': Angle(1.5432109876)}
+        def GetMeasure(self, wait, incl):
+            return {'hz': Angle(1.2345678901), 'v': Angle(1.5432109876),
+                    'distance': 123.4567, 'crossincline': Angle(0.0001),
+                    'lengthincline': Angle(-0.0002)}
+
+    def Codec(mu, msg):
+        """ one call without transport, returns sizes and result """
+        if mu.binary:
+            out = []
+            RemoteMeasureUnit.execFrame(fixed, msg, out.append)
+            ans = out[0]
+        else:
+            ans = RemoteMeasureUnit.execCmd(fixed, msg.encode('ascii'))[0].decode('ascii')
+        return len(msg), len(ans), mu.Result(msg, ans)
+
+    fixed = Fixed()
+    print("{:8s} {:>12s} {:>9s} {:>8s} {:>12s}".format(
+        'format', 'command', 'request', 'answer', 'us/call'))
+    for binary in (False, True):
+        mu = RemoteMeasureUnit(binary=binary)
+        for name, msg in (('GetAngles', mu.GetAnglesMsg()),
+                          ('GetMeasure', mu.GetMeasureMsg())):
+            t = time.perf_counter()
+            for _ in range(n):
+                req, ans, res = Codec(mu, msg)
+            t = (time.perf_counter() - t) / n
+            print("{:8s} {:>12s} {:9d} {:8d} {:12.1f}".format(
+                'binary' if binary else 'JSON', name, req, ans, t * 1e6))
+    res = Codec(RemoteMeasureUnit(binary=True), mu.GetAnglesMsg())[2]
+    print("hz error JSON: {:.1e} rad, binary: {:.1e} rad".format(
+        abs(Codec(RemoteMeasureUnit(), RemoteMeasureUnit().GetAnglesMsg())[2]['hz'].GetAngle() - 1.2345678901),
+        abs(res['hz'].GetAngle() - 1.2345678901)))
+
+    # loopback
+    sim = SimIface(targets=[{'id': '1', 'east': 100.0, 'north': 50.0,
+                             'elev': 10.0}], latency=0, baud=0, timeScale=0,
+                   seed=1)
+    broker = Broker(sim)
+    loop = asyncio.new_event_loop()
+    gw = InstrumentGateway(broker, LeicaTPS1200(), port=0)
+    address = loop.run_until_complete(gw.Start())
+    threading.Thread(target=loop.run_forever, daemon=True).start()
+    for binary in (False, True):
+        mu = RemoteMeasureUnit(binary=binary)
+        iface = TCPIface('loopback', address[:2])
+        ts = TotalStation('remote', mu, iface)
+        t = time.perf_counter()
+        for _ in range(n):
+            ts.GetAngles()
+        t1 = (time.perf_counter() - t) / n
+        msg = mu.BatchMsg([mu.GetAnglesMsg(), mu.GetPcMsg(), mu.GetATRMsg()])
+        t = time.perf_counter()
+        for _ in range(n // 3):
+            res = ts._process(msg)
+        t3 = (time.perf_counter() - t) / (n // 3)
+        line = "{:8s} GetAngles {:7.1f} us/call, batch of 3 {:7.1f} us/batch".format(
+            'binary' if binary else 'JSON', t1 * 1e6, t3 * 1e6)
+        if binary:
+            t = time.perf_counter()
+            k = sum(1 for r in mu.Stream(iface, mu.StreamMsg(mu.GetAnglesMsg(), n))
+                    if 'hz' in r)
+            line += ", stream {:7.1f} us/answer ({} answers)".format(
+                (time.perf_counter() - t) / n * 1e6, k)
+        print(line)
+        iface.Close()
+    broker.Stop()
@@ -0,0 +1,271 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+"""
+.. module:: replayiface.py
+   :platform: Unix, Windows
+   :synopsis: Ulyxes - an open source project to drive total stations and
+       publish observation results. GPL v2.0 license Copyright (C)
+       2010- Zoltan Siki <siki.zoltan@epito.bme.hu>.
+
+.. moduleauthor:: Zoltan Siki <siki.zoltan@epito.bme.hu>
+"""
+
+import os
+import re
+import mmap
+import time
+import logging
+from array import array
+from iface import Iface
+
+class ReplayIface(Iface):
+    """ Serve a session log written by RecorderIface. The log is memory
+        mapped and an index of record offsets is built (and cached in
+        fname.idx), so large logs are not loaded into memory. Lines without
+        tabs (e.g. raw NMEA logs) are served by GetLine without timing.
+
+        :param name: name of the interface (str), default 'Replay'
+        :param fname: name of the session log
+        :param speed: 1 for original timing, 2 for double speed, 0 for maximal speed (float)
+        :param mode: seq/key, seq=answers in recorded order, key=answer to the same GeoCOM request code (like LocalIface rand mode)
+    """
+
+    def __init__(self, name='Replay', fname=None, speed=1.0, mode='seq'):
+        """ Constructor
+        """
+        super().__init__(name)
+        self.speed = speed
+        self.mode = mode
+        self.fp = None
+        self.mm = None
+        self.index = array('q')
+        self.pos = {'S': 0, 'L': 0, 'P': 0}     # next record to check by kind
+        self.keys = {}      # records of GeoCOM request codes in key mode
+        self.cursor = {}
+        self.start = None   # monotonic time of replay start
+        try:
+            self.fp = open(fname, 'rb')
+            if os.path.getsize(fname) > 0:
+                self.mm = mmap.mmap(self.fp.fileno(), 0, access=mmap.ACCESS_READ)
+        except Exception:
+            self.state = self.IF_FILE
+            logging.error(" error opening session log")
+            return
+        self.opened = True
+        if self.mm is not None:
+            self._Index(fname)
+        if mode == 'key':
+            for i in range(len(self.index)):
+                rec = self._Record(i)
+                if rec[2] == 'S':
+                    key = self._Key(rec[3])
+                    self.keys.setdefault(key, []).append(i)
+                    self.cursor[key] = 0
+
+    def __del__(self):
+        """ Destructor
+        """
+        try:
+            self.mm.close()
+            self.fp.close()
+        except Exception:
+            pass
+
+    def _Index(self, fname):
+        """ Build or load the offset index of records
+
+            :param fname: name of the session log
+        """
+        iname = fname + '.idx'
+        size = len(self.mm)
+        try:
+            if os.path.getmtime(iname) >= os.path.getmtime(fname):
+                with open(iname, 'rb') as f:
+                    self.index.frombytes(f.read())
+                if self.index and self.index[-1] == size:
+                    self.index.pop()    # size of log stored at end
+                    return
+                self.index = array('q')
+        except OSError:
+            pass
+        pos = 0
+        find = self.mm.find
+        append = self.index.append
+        while pos < size:
+            append(pos)
+            pos = find(b'\n', pos) + 1
+            if pos == 0:
+                break
+        try:
+            with open(iname, 'wb') as f:
+                self.index.tofile(f)
+                array('q', [size]).tofile(f)
+        except OSError:
+            logging.warning(" cannot save index %s", iname)
+
+    def __len__(self):
+        """ Number of records
+
+            :returns: number of records in the log
+        """
+        return len(self.index)
+
+    def _Record(self, i):
+        """ Get a record from the log
+
+            :param i: record number
+            :returns: start, duration, kind, request, answer
+        """
+        end = self.index[i + 1] if i + 1 < len(self.index) else len(self.mm)
+        line = self.mm[self.index[i]:end].decode('ascii', 'replace').rstrip('\r\n')
+        fields = line.split('\t')
+        if len(fields) < 5:
+            return None, 0.0, 'L', '', line     # raw log line
+        return float(fields[0]), float(fields[1]), fields[2], fields[3], \
+            fields[4]
+
+    @staticmethod
+    def _Key(msg):
+        """ Key of a GeoCOM request, RPC codes of parts
+
+            :param msg: request (str)
+            :returns: key (str)
+        """
+        return ','.join([(re.split(':|,', m) + ['', ''])[1]
+                         for m in msg.split('|')])
+
+    def _Wait(self, start, duration):
+        """ Wait until the answer is due
+
+            :param start: recorded time of the request (None for untimed)
+            :param duration: recorded duration of the request
+        """
+        if self.speed <= 0:
+            return
+        now = time.monotonic()
+        if start is None or self.mode == 'key':
+            due = now + duration / self.speed
+        else:
+            if self.start is None:
+                self.start = now - start / self.speed
+            due = self.start + (start + duration) / self.speed
+        if due > now:
+            time.sleep(due - now)
+
+    def _Next(self, kinds):
+        """ Get the next record of the given kinds in sequential mode
+
+            :param kinds: record kinds e.g. 'S'
+            :returns: record or None at the end of the log
+        """
+        i = min(self.pos[k] for k in kinds)
+        while i < len(self.index):
+            rec = self._Record(i)
+            i += 1
+            if rec[2] in kinds:
+                for k in kinds:
+                    self.pos[k] = i
+                return rec
+        for k in kinds:
+            self.pos[k] = i
+        self.state = self.IF_EOF
+        logging.warning('End of session log')
+        return None
+
+    def Send(self, msg):
+        """ Return the recorded answer
+
+            :param msg: message to send
+            :returns: recorded answer
+        """
+        if self.mode == 'key':
+            key = self._Key(msg)
+            if key not in self.keys:
+                logging.error(" no recorded answer for %s", msg)
+                return None
+            recs = self.keys[key]
+            i = self.cursor[key]
+            self.cursor[key] = (i + 1) % len(recs)
+            rec = self._Record(recs[i])
+        else:
+            rec = self._Next('S')
+            if rec is None:
+                return ''
+            if rec[3] != msg:
+                logging.warning(" request differs from log: %s / %s", msg, rec[3])
+        self._Wait(rec[0], rec[1])
+        return rec[4]
+
+    def GetLine(self):
+        """ Return the next recorded line
+
+            :returns: next line
+        """
+        rec = self._Next('L')
+        if rec is None:
+            return ''
+        self._Wait(rec[0], rec[1])
+        return rec[4]
+
+    def PutLine(self, msg):
+        """ Skip the next recorded PutLine
+
+            :param msg: message to send
+            :returns: 0
+        """
+        rec = self._Next('P')
+        if rec is None:
+            return -1
+        self._Wait(rec[0], rec[1])
+        return 0
+
+if __name__ == "__main__":
+    # record a simulated session and replay it, benchmark a large NMEA log
+    #    argv[1]: number of NMEA lines in the benchmark log, default 1000000
+    import sys
+    import tempfile
+    from simiface import SimIface
+    from recorderiface import RecorderIface
+    from totalstation import TotalStation
+    from leicatps1200 import LeicaTPS1200
+    from gnss import Gnss
+    from nmeagnssunit import NmeaGnssUnit
+
+    tmp = tempfile.mkdtemp()
+    log = os.path.join(tmp, 'session.log')
+    pts = [{'id': '1', 'east': 100.0, 'north': 50.0, 'elev': 10.0}]
+    sim = SimIface(targets=pts, timeScale=0.1, seed=1)
+    rec = RecorderIface(sim, log)
+    ts = TotalStation('sim', LeicaTPS1200(), rec)
+    t = time.perf_counter()
+    for _ in range(10):
+        ts.GetAngles()
+        ts.Move(ts.GetAngles()['hz'], ts.GetAngles()['v'])
+    print("recorded in %.3f s" % (time.perf_counter() - t))
+    rec.Close()
+    for spd in (1, 4, 0):
+        ts = TotalStation('replay', LeicaTPS1200(), ReplayIface(fname=log, speed=spd))
+        t = time.perf_counter()
+        for _ in range(10):
+            ts.GetAngles()
+            ts.Move(ts.GetAngles()['hz'], ts.GetAngles()['v'])
+        print("replayed at speed %g in %.3f s" % (spd, time.perf_counter() - t))
+
+    n = int(sys.argv[1]) if len(sys.argv) > 1 else 1000000
+    nmea = os.path.join(tmp, 'nmea.log')
+    with open(nmea, 'w') as f:
+        for i in range(n):
+            f.write("%.6f\t0.000100\tL\t\t$GPGGA,092750.000,5321.6802,N,00630.3372,W,1,8,1.03,61.7,M,55.2,M,,*76\n" % (i * 0.1))
+    print("log size %.1f MB" % (os.path.getsize(nmea) / 1024 / 1024))
+    for i in range(2):
+        t = time.perf_counter()
+        r = ReplayIface(fname=nmea, speed=0)
+        print("index of %d records %s in %.3f s" %
+              (len(r), ('built', 'loaded')[i], time.perf_counter() - t))
+    g = Gnss('replay', NmeaGnssUnit(), r)
+    t = time.perf_counter()
+    k = 0
+    while g.Measure():
+        k += 1
+    t = time.perf_counter() - t
+    print("%d positions parsed in %.3f s, %.0f lines/s" % (k, t, k / t))
@@ -11,9 +11,13 @@
     Daniel Moka <mokadaniel@citromail.hu>
 """
 
+import re
+import time
 import logging
 import serial
 from iface import Iface
+from linebuffer import LineBuffer
+from leicameasureunit import NextTrId
 
 class SerialIface(Iface):
     """ Interface to communicate through serial interface. This class depends
@@ -28,18 +32,29 @@ class SerialIface(Iface):
             :param timeout: communication timeout seconds (int), default 12
             :param eomRead: end of message char from instrument (str), default '\\r\\n'
             :param eomWrite: end of message char from computer (str), default '\\r\\n'
+            :param window: number of GeoCOM requests with transaction ID sent ahead of the answers in multipart messages (int), default 1 (no pipelining)
+            :param stats: latency statistics to learn timeouts per command (LatencyStats), default None (fixed timeout)
     """
+    # GeoCOM request/reply with transaction ID, e.g. %R1Q,2003,5:0 %R1P,0,5:0,...
+    trIdRe = re.compile(r'^%R1[PQ],\d+,(\d+):')
+    # GeoCOM request without transaction ID
+    noTrIdRe = re.compile(r'^(%R1Q,\d+)(:.*)$', re.S)
+
     def __init__(self, name, port, baud=9600, byteSize=8,
                  parity=serial.PARITY_NONE, stop=1, timeout=17, eomRead='\r\n',
-                 eomWrite='\r\n'):
+                 eomWrite='\r\n', window=1, stats=None):
         """ Constructor for serial interface
         """
         super(SerialIface, self).__init__(name)
         # open serial port
         self.ser = None
+        self.buffer = LineBuffer()
         self.Open(port, baud, byteSize, parity, stop, timeout)
         self.eomRead = eomRead
         self.eomWrite = eomWrite
+        self.window = window
+        self.stats = stats
+        self.stale = False  # late answer may arrive after adaptive timeout
 
     def __del__(self):
         """ Destructor for serial interface
@@ -55,6 +70,7 @@ class SerialIface(Iface):
         """
         try:
             self.ser = serial.Serial(port, baud, byteSize, parity, stop, timeout)
+            self.buffer.Clear()
             self.state = self.IF_OK
         except Exception:
             self.state = self.IF_ERROR
@@ -70,6 +86,40 @@ class SerialIface(Iface):
             self.state = self.IF_ERROR
             logging.error(" cannot close serial line")
 
+    def GetBaudRate(self):
+        """ Get the speed of the serial line
+
+            :returns: baud rate (int) or None if the line is not opened
+        """
+        if self.ser is None:
+            return None
+        return self.ser.baudrate
+
+    def SetBaudRate(self, baud):
+        """ Change the speed of the opened serial line, unread data are
+            dropped and the state is cleared
+
+            :param baud: new baud rate (int)
+        """
+        try:
+            self.ser.baudrate = baud
+            self.ser.reset_input_buffer()
+            self.buffer.Clear()
+            self.state = self.IF_OK
+        except Exception:
+            self.state = self.IF_ERROR
+            logging.error(" cannot set baud rate on serial line")
+
+    def SetTimeout(self, timeout):
+        """ Change the read timeout of the serial line
+
+            :param timeout: new timeout in seconds (float)
+            :returns: previous timeout
+        """
+        prev = self.ser.timeout
+        self.ser.timeout = timeout
+        return prev
+
     def GetLine(self):
         """ read from serial interface until end of line
 
@@ -78,27 +128,37 @@ class SerialIface(Iface):
         if self.ser is None or self.state != self.IF_OK:
             logging.error(" serial line not opened")
             return None
-        # read answer till end of message marker
-        ans = ''
-        w = -1 * len(self.eomRead)
-        while ans[w:] != self.eomRead:
-            ch = ''
-            try:
-                ch = (self.ser.read(1)).decode('ascii')
-            except Exception:
-                self.state = self.IF_READ
-                logging.error(" cannot read serial line")
-            if ch == '':
-                # timeout exit loop
-                self.state = self.IF_TIMEOUT
-                logging.error(" timeout on serial line")
-                break
-            ans += ch
-        # remove end of line
+        # read answer till end of message marker, bytes after the marker
+        # are kept in the buffer for the next call
+        try:
+            ans, complete = self.buffer.ReadLine(self._read, self.eomRead)
+        except Exception:
+            ans, complete = self.buffer.Flush(), True
+            self.state = self.IF_READ
+            logging.error(" cannot read serial line")
+        if not complete:
+            # timeout
+            self.state = self.IF_TIMEOUT
+            logging.error(" timeout on serial line")
+        try:
+            ans = ans.decode('ascii')
+        except UnicodeDecodeError:
+            ans = ans.decode('ascii', 'ignore')
+            self.state = self.IF_READ
+            logging.error(" cannot read serial line")
         logging.debug(" message got: %s", ans)
+        # remove end of line
         ans = ans.strip(self.eomRead)
         return ans
 
+    def _read(self, size):
+        """ read available bytes from serial line, wait for one byte at least
+
+            :param size: maximal number of bytes to read
+            :returns: bytes read, empty on timeout
+        """
+        return self.ser.read(max(1, min(size, self.ser.in_waiting)))
+
     def PutLine(self, msg):
         """ send message through the serial line
 
@@ -132,15 +192,154 @@ class SerialIface(Iface):
             :returns: answer from instrument (str)
         """
         msglist = msg.split("|")
+        if self.window > 1 and len(msglist) > 1:
+            return self._SendPipelined(msglist)
         res = ''
         #sending
         for m in msglist:
-            if self.PutLine(m) == 0:
+            if self.stats is not None:
+                ans = self._Exchange(m)
+                if ans is not None:
+                    res += ans + '|'
+            elif self.PutLine(m) == 0:
                 res += self.GetLine() + '|'
         if res.endswith('|'):
             res = res[:-1]
         return res
 
+    def _Exchange(self, msg):
+        """ send a message and read the answer using the adaptive timeout
+            of the command, the latency is added to the statistics.
+            After an adaptive timeout the late answer is still on its way,
+            GeoCOM requests are sent with transaction ID and answers with
+            other ID are dropped, other commands wait for the late answer.
+
+            :param msg: message to send (str)
+            :returns: answer from instrument (str) or None on write error
+        """
+        key = self.stats.Key(msg)
+        fixed = self.ser.timeout
+        trId = None
+        if self.stale:
+            timeout = fixed
+            msg, trId = self._Tag(msg)
+            if trId is None:
+                self._Drain(fixed)
+        else:
+            timeout = self.stats.GetTimeout(key, fixed)
+        self.ser.timeout = timeout
+        try:
+            start = time.monotonic()
+            if self.PutLine(msg) != 0:
+                return None
+            ans = self.GetLine()
+            while trId is not None and self.state == self.IF_OK and \
+                    self._TrId(ans) != trId:
+                logging.warning(" late answer dropped: %s", ans)
+                ans = self.GetLine()
+            if self.state == self.IF_OK:
+                if trId is None:
+                    self.stats.Record(key, time.monotonic() - start)
+                self.stale = False
+            elif self.state == self.IF_TIMEOUT and timeout < fixed:
+                self.stats.RecordTimeout(key, timeout)
+                self.stale = True
+                logging.warning(" adaptive timeout %.3f s on %s", timeout, key)
+        finally:
+            self.ser.timeout = fixed
+        return ans
+
+    def _Tag(self, msg):
+        """ add a new transaction ID to a GeoCOM request
+
+            :param msg: request (str)
+            :returns: request and its transaction ID or None for other commands
+        """
+        trId = self._TrId(msg)
+        if trId is not None:
+            return msg, trId
+        m = self.noTrIdRe.match(msg)
+        if m is None:
+            return msg, None
+        trId = str(NextTrId())  # late answer has other ID
+        return '{},{}{}'.format(m.group(1), trId, m.group(2)), trId
+
+    def _Drain(self, timeout):
+        """ wait for the late answer to a timed out request
+
+            :param timeout: time to wait (float) seconds
+        """
+        self.ser.timeout = timeout
+        ans = self.GetLine()
+        if self.state == self.IF_OK:
+            logging.warning(" late answer dropped: %s", ans)
+        else:
+            logging.warning(" late answer lost")
+            self.state = self.IF_OK
+        self.stale = False
+
+    def _TrId(self, msg):
+        """ get GeoCOM transaction ID from a request or reply
+
+            :param msg: request or reply (str)
+            :returns: transaction ID (str) or None
+        """
+        m = self.trIdRe.match(msg)
+        return m.group(1) if m else None
+
+    def _SendPipelined(self, msglist):
+        """ send requests without waiting for the previous answer, at most
+            window requests are on the wire. Answers are matched to requests by
+            transaction ID, answers without ID (or ID 0) are assigned to the
+            first request without ID, answers of unknown ID are dropped.
+
+            :param msglist: messages to send (list of str)
+            :returns: answers in the order of messages separated by '|' (str)
+        """
+        res = [''] * len(msglist)
+        fixed = self.ser.timeout
+        if self.stats is not None:
+            # no latency per request, use the longest timeout of commands
+            self.ser.timeout = max(self.stats.GetTimeout(self.stats.Key(m),
+                                                         fixed)
+                                   for m in msglist)
+        try:
+            self._Pipeline(msglist, res)
+        finally:
+            self.ser.timeout = fixed
+        return '|'.join(res)
+
+    def _Pipeline(self, msglist, res):
+        """ send requests in a window and store answers
+
+            :param msglist: messages to send (list of str)
+            :param res: list to store answers in (list of str)
+        """
+        pending = []    # (transaction ID, index) of requests on the wire
+        sent = 0
+        while sent < len(msglist) or pending:
+            while sent < len(msglist) and len(pending) < self.window:
+                if self.PutLine(msglist[sent]) != 0:
+                    break
+                pending.append((self._TrId(msglist[sent]), sent))
+                sent += 1
+            if not pending:
+                break   # write error
+            ans = self.GetLine()
+            if self.state != self.IF_OK:
+                break
+            trId = self._TrId(ans)
+            ids = [i for i, _ in pending]
+            if trId is not None and trId in ids:
+                j = ids.index(trId)
+            elif trId in (None, '0') and None in ids:
+                # answers of requests without ID have ID 0, in order
+                j = ids.index(None)
+            else:
+                logging.warning(" unmatched answer dropped: %s", ans)
+                continue
+            res[pending.pop(j)[1]] = ans
+
 if __name__ == "__main__":
     a = SerialIface('test', '/dev/ttyUSB0')
     print(a.GetName())
@@ -0,0 +1,524 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+"""
+.. module:: simiface.py
+   :platform: Unix, Windows
+   :synopsis: Ulyxes - an open source project to drive total stations and
+       publish observation results. GPL v2.0 license Copyright (C)
+       2010- Zoltan Siki <siki.zoltan@epito.bme.hu>.
+
+.. moduleauthor:: Zoltan Siki <siki.zoltan@epito.bme.hu>
+
+Simulated robotic total station answering GeoCOM requests from a coordinate
+model. It can be used as the interface of a TotalStation or served on a
+pseudo terminal (Unix) for applications opening a serial port::
+
+    python simiface.py points.csv S1 1200
+
+"""
+
+import re
+import math
+import time
+import random
+import logging
+from iface import Iface
+from leicatps1200 import LeicaTPS1200
+
+PI2 = 2.0 * math.pi
+
+class SimIface(Iface):
+    """ Simulated GeoCOM total station. Observations are calculated from the
+        true station and target coordinates with random noise, motors turn
+        with finite speed, ATR finds targets near the telescope direction.
+
+        :param name: name of the interface (str), default 'Sim'
+        :param targets: target points, list of dictionaries with id, east, north, elev
+        :param station: true position of the instrument, dictionary with east, north, elev and optional ih
+        :param mu: measure unit the GeoCOM codes are taken from (LeicaMeasureUnit), default LeicaTPS1200
+        :param ori: bearing of the zero direction of horizontal circle (float) radians, default 0
+        :param latency: processing time of a request (float) seconds, default 0.01
+        :param baud: simulated serial line speed of the instrument, 0 for no wire time (int), default 9600, the instrument answers only if the line speed set by SetBaudRate is the same
+        :param speed: motor speed (float) radians/second, default 0.8
+        :param stdAngle: standard deviation of angles (float) radians, default 5e-6 (1")
+        :param stdDist: standard deviation of distances (float) meters, default 0.001, 1.5 ppm is added
+        :param atrRange: ATR field of view (float) radians, default 0.01
+        :param atrFail: probability of ATR failure (float), default 0
+        :param blunder: probability of a blunder in distance (float), default 0
+        :param blunderSize: size of blunders (float) meters, default 0.05
+        :param timeScale: 1 for real time, 0 for no waiting (float), simulated time is summed in simTime
+        :param seed: seed for random numbers, default None
+    """
+    # GeoCOM return codes used
+    RC_OK = 0
+    RC_NOT_IMPL = 5
+    RC_DIST_ERROR = 1292
+    RC_NO_TARGET = 8710
+
+    # prism constants of prism types
+    prismConst = {0: 0.0, 1: 0.0175, 2: 0.0344, 3: 0.0231, 7: 0.030}
+
+    def __init__(self, name='Sim', targets=None, station=None, mu=None,
+                 ori=0.0, latency=0.01, baud=9600, speed=0.8, stdAngle=5e-6,
+                 stdDist=0.001, atrRange=0.01, atrFail=0.0, blunder=0.0,
+                 blunderSize=0.05, timeScale=1.0, seed=None):
+        """ Constructor
+        """
+        super().__init__(name)
+        self.targets = [t for t in (targets or [])
+                        if 'east' in t and 'north' in t and 'elev' in t]
+        if station is None:
+            station = {'east': 0.0, 'north': 0.0, 'elev': 0.0}
+        self.station = (station['east'], station['north'],
+                        station['elev'] + station.get('ih', 0.0))
+        if mu is None:
+            mu = LeicaTPS1200()
+        self.names = {str(code): name for name, code in mu.codes.items()}
+        self.names['0'] = 'NULLPROC'
+        self.baudRates = {str(v): k for k, v in mu.baudRates.items()}
+        self.ori = ori
+        self.latency = latency
+        self.baud = baud
+        self.lineBaud = baud    # speed of the computer side
+        self.timeout = 12
+        self.speed = speed
+        self.stdAngle = stdAngle
+        self.stdDist = stdDist
+        self.atrRange = atrRange
+        self.atrFail = atrFail
+        self.blunder = blunder
+        self.blunderSize = blunderSize
+        self.timeScale = timeScale
+        self.rnd = random.Random(seed)
+        self.hz = 0.0       # telescope direction, horizontal circle reading
+        self.v = math.pi / 2.0
+        self.dist = None    # last measured distance
+        self.simTime = 0.0  # simulated time spent
+        self.requests = 0   # number of requests answered
+        self.settings = {'ATR': ['0'], 'LOCK': ['0'], 'PT': ['0'],
+                         'PC': ['0.0'], 'EDMMODE': ['2'], 'REDLASER': ['0'],
+                         'ATMCORR': ['0.0000006', '1013.25', '12.0', '12.0'],
+                         'REFCORR': ['0', '6378000', '0.13'],
+                         'STN': ['0.0', '0.0', '0.0', '0.0'],
+                         'SPIRAL': ['0.1', '0.1'],
+                         'SEARCHAREA': ['0', '1.57', '6.28', '1.66', '1']}
+        self.opened = True
+
+    def Send(self, msg):
+        """ Answer GeoCOM requests
+
+            :param msg: message to send, it can be multipart message separated by '|' (str)
+            :returns: answer of the simulated instrument (str)
+        """
+        if self.baud and self.lineBaud != self.baud:
+            # no answer at different speeds
+            self._Wait(self.timeout)
+            self.state = self.IF_TIMEOUT
+            return ''
+        return '|'.join([self.Answer(m) for m in msg.split('|')])
+
+    def GetBaudRate(self):
+        """ Get the speed of the computer side of the line
+
+            :returns: baud rate (int)
+        """
+        return self.lineBaud
+
+    def SetBaudRate(self, baud):
+        """ Change the speed of the computer side of the line
+
+            :param baud: new baud rate (int)
+        """
+        self.lineBaud = baud
+        self.state = self.IF_OK
+
+    def SetTimeout(self, timeout):
+        """ Change the read timeout
+
+            :param timeout: new timeout in seconds (float)
+            :returns: previous timeout
+        """
+        prev = self.timeout
+        self.timeout = timeout
+        return prev
+
+    def Answer(self, msg):
+        """ Answer a single GeoCOM request
+
+            :param msg: request e.g. %R1Q,2003:0 or %R1Q,2003,5:0 (str)
+            :returns: answer e.g. %R1P,0,5:0,... (str)
+        """
+        self.requests += 1
+        m = re.match(r'^%R1Q,(\d+)(?:,(\d+))?:(.*)$', msg.strip())
+        if m is None:
+            logging.error(" invalid GeoCOM request: %s", msg)
+            return '%R1P,1,0:'
+        code, trId, par = m.group(1), m.group(2) or '0', m.group(3)
+        params = par.split(',') if par else []
+        name = self.names.get(code, '')
+        handler = getattr(self, '_' + name.title().replace('_', ''), None)
+        if handler is not None:
+            rc, values = handler(params)
+        elif name.startswith('SET') and name[3:] in self.settings:
+            self.settings[name[3:]] = params
+            rc, values = self.RC_OK, []
+        elif name.startswith('GET') and name[3:] in self.settings:
+            rc, values = self.RC_OK, self.settings[name[3:]]
+        else:
+            rc, values = self.RC_NOT_IMPL, []
+        ans = '%R1P,0,{}:{}'.format(trId, ','.join([str(rc)] + [str(v) for v in values]))
+        delay = self.latency
+        if self.baud:
+            delay += (len(msg) + len(ans) + 4) * 10.0 / self.baud
+        self._Wait(delay)
+        return ans
+
+    def Serve(self, fd):
+        """ Answer requests read from a file descriptor (e.g. master side
+            of a pty) until it is closed
+
+            :param fd: file descriptor
+        """
+        import os
+        buf = b''
+        while True:
+            try:
+                data = os.read(fd, 1024)
+            except OSError:
+                break
+            if not data:
+                break
+            buf += data
+            while b'\n' in buf:
+                line, buf = buf.split(b'\n', 1)
+                line = line.strip().decode('ascii', 'ignore')
+                if line:
+                    os.write(fd, (self.Answer(line) + '\r\n').encode('ascii'))
+
+    def _Wait(self, t):
+        """ Spend time
+
+            :param t: simulated time (float) seconds
+        """
+        self.simTime += t
+        if self.timeScale > 0 and t > 0:
+            time.sleep(t * self.timeScale)
+
+    def _Polar(self, target):
+        """ Calculate bearing, zenith angle and slope distance to a target
+
+            :param target: target point (dict)
+            :returns: bearing, zenith angle, slope distance
+        """
+        de = target['east'] - self.station[0]
+        dn = target['north'] - self.station[1]
+        dz = target['elev'] - self.station[2]
+        hd = math.hypot(de, dn)
+        return math.atan2(de, dn) % PI2, math.atan2(hd, dz), \
+            math.sqrt(hd * hd + dz * dz)
+
+    def _Direction(self):
+        """ Bearing and zenith angle of the telescope
+
+            :returns: bearing, zenith angle
+        """
+        if self.v > math.pi:    # face right
+            return (self.hz - math.pi + self.ori) % PI2, PI2 - self.v
+        return (self.hz + self.ori) % PI2, self.v
+
+    @staticmethod
+    def _Separation(b1, z1, b2, z2):
+        """ Angle between two directions
+
+            :returns: angle in radians
+        """
+        c = math.sin(z1) * math.sin(z2) * math.cos(b1 - b2) + \
+            math.cos(z1) * math.cos(z2)
+        return math.acos(max(-1.0, min(1.0, c)))
+
+    def _Nearest(self, limit):
+        """ Find the target nearest to the telescope direction
+
+            :param limit: maximal angle from the telescope direction
+            :returns: target and its polar coordinates or None
+        """
+        b, z = self._Direction()
+        best = None
+        for t in self.targets:
+            pb, pz, pd = self._Polar(t)
+            sep = self._Separation(b, z, pb, pz)
+            if sep < limit and (best is None or sep < best[0]):
+                best = (sep, t, pb, pz, pd)
+        return best
+
+    def _Point(self, bearing, zenith):
+        """ Set telescope to a direction in the actual face
+
+            :param bearing: bearing (float)
+            :param zenith: zenith angle (float)
+        """
+        if self.v > math.pi:
+            self.hz = (bearing - self.ori + math.pi) % PI2
+            self.v = PI2 - zenith
+        else:
+            self.hz = (bearing - self.ori) % PI2
+            self.v = zenith
+
+    def _Slew(self, hz, v):
+        """ Turn the telescope, time depends on the angle
+
+            :param hz: horizontal circle reading (float)
+            :param v: zenith angle reading (float)
+        """
+        dhz = abs((hz - self.hz + math.pi) % PI2 - math.pi)
+        self._Wait(max(dhz, abs(v - self.v)) / self.speed)
+        self.hz = hz % PI2
+        self.v = v
+        self.dist = None
+
+    def _Atr(self):
+        """ Fine adjustment to the nearest target
+
+            :returns: return code
+        """
+        best = self._Nearest(self.atrRange)
+        self._Wait(0.5)
+        if best is None or self.rnd.random() < self.atrFail:
+            return self.RC_NO_TARGET
+        self._Point(best[2], best[3])
+        return self.RC_OK
+
+    def _Angles(self):
+        """ Noisy angle readings
+
+            :returns: hz, v
+        """
+        return (self.hz + self.rnd.gauss(0, self.stdAngle)) % PI2, \
+            self.v + self.rnd.gauss(0, self.stdAngle)
+
+    def _Measure(self, params):
+        """ Measure distance, params: program, inclination
+        """
+        if params and params[0] == '3':     # clear distance
+            self.dist = None
+            return self.RC_OK, []
+        self._Wait(1.0)
+        best = self._Nearest(0.001)
+        if best is None:
+            self.dist = None
+            return self.RC_DIST_ERROR, []
+        d = best[4] + self.rnd.gauss(0, self.stdDist + best[4] * 1.5e-6)
+        if self.rnd.random() < self.blunder:
+            d += self.rnd.choice((-1, 1)) * self.blunderSize
+        self.dist = d
+        return self.RC_OK, []
+
+    def _Getmeasure(self, params):
+        """ Angles and last measured distance
+        """
+        hz, v = self._Angles()
+        if self.dist is None:
+            return self.RC_DIST_ERROR, [hz, v, 0.0]
+        return self.RC_OK, [hz, v, self.dist]
+
+    def _Measureangdist(self, params):
+        """ Measure distance and get angles
+        """
+        rc, _ = self._Measure(params)
+        _, res = self._Getmeasure(params)
+        return rc, res
+
+    def _Getangles(self, params):
+        """ Angles and inclinations
+        """
+        hz, v = self._Angles()
+        face = 1 if self.v > math.pi else 0
+        return self.RC_OK, [hz, v, 0.0, 0, self.rnd.gauss(0, 5e-6),
+                            self.rnd.gauss(0, 5e-6), 0.0, 0, face]
+
+    def _Coords(self, params):
+        """ Coordinates from the station set, the orientation and the last
+            measured distance
+        """
+        if self.dist is None:
+            return self.RC_DIST_ERROR, [0.0, 0.0, 0.0]
+        hz, v = self._Angles()
+        e, n, z, ih = [float(x) for x in self.settings['STN']]
+        hd = self.dist * math.sin(v)
+        return self.RC_OK, [e + hd * math.sin(hz), n + hd * math.cos(hz),
+                            z + ih + self.dist * math.cos(v)]
+
+    def _Move(self, params):
+        """ Rotate telescope, params: hz, v, mode, atr, 0
+        """
+        try:
+            hz, v = float(params[0]), float(params[1])
+        except (IndexError, ValueError):
+            return 2, []    # invalid parameter
+        self._Slew(hz, v)
+        if len(params) > 3 and params[3] == '1':
+            return self._Atr(), []
+        return self.RC_OK, []
+
+    def _Changeface(self, params):
+        """ Rotate telescope to the other face
+        """
+        self._Slew(self.hz + math.pi, PI2 - self.v)
+        if self.settings['ATR'][0] == '1':
+            return self._Atr(), []
+        return self.RC_OK, []
+
+    def _Fineadj(self, params):
+        """ ATR fine adjustment
+        """
+        return self._Atr(), []
+
+    def _Lockin(self, params):
+        """ Lock on the nearest target
+        """
+        if self.settings['LOCK'][0] != '1':
+            return 8716, []     # lock not enabled
+        return self._Atr(), []
+
+    def _Searchtarget(self, params):
+        """ Search target in the spiral range
+        """
+        self._Wait(2.0)
+        best = self._Nearest(max(float(x) for x in self.settings['SPIRAL']))
+        if best is None:
+            return self.RC_NO_TARGET, []
+        self._Point(best[2], best[3])
+        return self.RC_OK, []
+
+    def _Powersearch(self, params):
+        """ Find the next target in the given direction within the search area
+        """
+        direction = -1 if params and params[0] == '-1' else 1
+        b, _ = self._Direction()
+        vRange = float(self.settings['SEARCHAREA'][3]) / 2.0
+        best = None
+        for t in self.targets:
+            pb, pz, pd = self._Polar(t)
+            if abs(pz - math.pi / 2.0) > vRange:
+                continue
+            turn = ((pb - b) * direction) % PI2
+            if turn > 1e-4 and (best is None or turn < best[0]):
+                best = (turn, pb, pz)
+        if best is None:
+            self._Wait(PI2 / self.speed)
+            return self.RC_NO_TARGET, []
+        self._Wait(best[0] / self.speed)
+        self._Point(best[1], best[2])
+        self.dist = None
+        return self.RC_OK, []
+
+    _Searchnext = _Powersearch
+
+    def _Setbaud(self, params):
+        """ Change the speed of the instrument, the answer is sent at the
+            previous speed, params: COM_BAUD_RATE
+        """
+        if not params or params[0] not in self.baudRates:
+            return 2, []    # invalid parameter
+        if self.baud:
+            self.baud = self.baudRates[params[0]]
+        return self.RC_OK, []
+
+    def _Setpt(self, params):
+        """ Set prism type, prism constant changes
+        """
+        self.settings['PT'] = params
+        try:
+            self.settings['PC'] = [str(self.prismConst.get(int(params[0]), 0.0))]
+        except (IndexError, ValueError):
+            return 2, []
+        return self.RC_OK, []
+
+    def _Setori(self, params):
+        """ Set orientation, actual direction gets the given reading
+        """
+        try:
+            o = float(params[0])
+        except (IndexError, ValueError):
+            return 2, []
+        b, _ = self._Direction()
+        self.ori = (b - o) % PI2
+        if self.v > math.pi:
+            self.hz = (o + math.pi) % PI2
+        else:
+            self.hz = o % PI2
+        return self.RC_OK, []
+
+    def _Instrno(self, params):
+        """ Serial number
+        """
+        return self.RC_OK, [123456]
+
+    def _Instrname(self, params):
+        """ Instrument name
+        """
+        return self.RC_OK, ['"TS-SIM"']
+
+    def _Inttemp(self, params):
+        """ Internal temperature
+        """
+        return self.RC_OK, [25.0]
+
+    def _Nullproc(self, params):
+        """ Communication check
+        """
+        return self.RC_OK, []
+
+    def _Switchon(self, params):
+        """ Switch on
+        """
+        return self.RC_OK, []
+
+    def _Switchoff(self, params):
+        """ Switch off
+        """
+        return self.RC_OK, []
+
+if __name__ == "__main__":
+    # serve the simulator on a pseudo terminal
+    #    argv[1]: coordinate file (.csv or .coo)
+    #    argv[2]: station id in coordinate file
+    #    argv[3]: instrument type 1100/1200/1800, default 1200
+    #    argv[4]: time scale 1 real time/0 no wait, default 1
+    import os
+    import sys
+    import pty
+    from csvreader import CsvReader
+    from georeader import GeoReader
+
+    if len(sys.argv) < 3:
+        print("Usage: simiface.py coordinate_file station_id [1100|1200|1800] [time_scale]")
+        sys.exit(1)
+    if sys.argv[1][-4:] == '.coo':
+        points = GeoReader(fname=sys.argv[1]).Load()
+    else:
+        points = CsvReader(fname=sys.argv[1], fields=['id', 'east', 'north', 'elev'],
+                           numeric=['east', 'north', 'elev']).Load()
+    st = [p for p in points if p['id'] == sys.argv[2]]
+    if not st:
+        print("Station not found: " + sys.argv[2])
+        sys.exit(1)
+    instr = sys.argv[3] if len(sys.argv) > 3 else '1200'
+    if instr.startswith('110'):
+        from leicatcra1100 import LeicaTCRA1100
+        unit = LeicaTCRA1100()
+    elif instr.startswith('180'):
+        from leicatca1800 import LeicaTCA1800
+        unit = LeicaTCA1800()
+    else:
+        unit = LeicaTPS1200()
+    scale = float(sys.argv[4]) if len(sys.argv) > 4 else 1.0
+    sim = SimIface('Sim', [p for p in points if p['id'] != sys.argv[2]],
+                   st[0], unit, ori=1.0, timeScale=scale)
+    master, slave = pty.openpty()
+    print("Simulated instrument on " + os.ttyname(slave))
+    try:
+        sim.Serve(master)
+    except KeyboardInterrupt:
+        pass
+    print("%d requests, simulated time %.1f s" % (sim.requests, sim.simTime))
@@ -0,0 +1,315 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+"""
+.. module:: sparseadjust.py
+   :platform: Unix, Windows
+   :synopsis: Ulyxes - an open source project to drive total stations and
+       publish observation results. GPL v2.0 license Copyright (C)
+       2010- Zoltan Siki <siki.zoltan@epito.bme.hu>.
+
+.. moduleauthor:: Zoltan Siki <siki.zoltan@epito.bme.hu>
+
+Least squares adjustment of large networks observed from a few stations,
+e.g. monitoring prisms observed by several robotic total stations. The
+coordinates of a point which is not a station are connected only to the
+stations observing it, so the normal equation is sparse: a small block for
+each point and a border of station coordinates and orientations. The
+design matrix is stored by rows (at most seven non-zero elements), the
+point blocks are eliminated one by one and only the reduced normal
+equation of the stations is solved. The cofactors of points and of the
+adjusted observations are computed from the blocks, the dense inverse of
+the normal equation is never built.
+"""
+
+import logging
+import numpy as np
+from lsqadjust import LsqAdjust
+
+class SparseAdjust(LsqAdjust):
+    """ Least squares adjustment of observations from many stations and
+        epochs in one network, points and observations are added the same
+        way as to LsqAdjust or GamaIface. Each station record (setup) has
+        its own orientation unknown like an obs cluster of GNU Gama, so
+        setups of a station in several epochs may have different zero
+        directions. Networks without fixed points are adjusted by
+        LsqAdjust.
+
+            :param dimension: dimension of network (int), 1/2/3
+            :param probability: probability for statistical tests (0.9/0.95/0.997) (float)
+            :param stdev_angle: standard deviation for directions in arc seconds (float)
+            :param stdev_dist: base standard deviation for distances mm (float)
+            :param stdev_dist1: standard deviation for distances mm/km (float)
+            :param maxIter: maximal number of iterations, default 10
+            :param tol: iteration stops if coordinate corrections are smaller (m), default 1e-6
+    """
+
+    def _Prepare(self):
+        """ Collect observations and order unknowns, coordinates of stations
+            and orientations first, then the blocks of other points
+
+            :returns: True on success
+        """
+        if not super()._Prepare():
+            return False
+        self._perm = None
+        if self._fix == 0:
+            return True     # free network, dense solution
+        dims = [2] if self.dimension == 1 else \
+            [0, 1] if self.dimension == 2 else [0, 1, 2]
+        stations = set(np.unique(self._obs[1]).tolist())
+        sp = np.array([i for i in self._adj if i in stations], dtype=int)
+        tp = np.array([i for i in self._adj if i not in stations], dtype=int)
+        scols = np.concatenate((self._pcol[np.ix_(sp, dims)].ravel(),
+                                np.arange(self._nc, self._n)))
+        tcols = self._pcol[np.ix_(tp, dims)].ravel()
+        # column of unknown -> position in the new order, -1 fixed
+        perm = np.full(self._n + 1, -1)
+        perm[scols] = np.arange(len(scols))
+        perm[tcols] = len(scols) + np.arange(len(tcols))
+        self._perm = perm
+        self._ns = len(scols)
+        self._nt = len(tp)
+        self._k = len(dims)
+        return True
+
+    def _Linear(self):
+        """ Observation equations of active observations at actual values
+
+            :returns: observations, design matrix by rows (columns and values), observed - computed, weights
+        """
+        if self._perm is None:
+            return super()._Linear()
+        obs = tuple(a[self._active] for a in self._obs)
+        typ, st, tg = obs[:3]
+        pe, pn, pz, l = self._Partials(self._xyz, self._ori, obs)
+        cols = self._perm[np.column_stack(
+            (self._pcol[tg], self._pcol[st], self._ocol[obs[7]]))]
+        vals = np.column_stack((pe, pn, pz, -pe, -pn, -pz,
+                                np.where(typ == 0, -1.0, 0.0)))
+        vals[cols < 0] = 0.0
+        return obs, (cols, vals), l, 1.0 / obs[4] ** 2
+
+    def _Split(self, cols):
+        """ Classify columns of unknowns in the new order
+
+            :param cols: positions of unknowns
+            :returns: station and point masks, point block and index in block
+        """
+        s = (cols >= 0) & (cols < self._ns)
+        t = cols >= self._ns
+        blk = np.where(t, (cols - self._ns) // self._k, 0)
+        loc = np.where(t, (cols - self._ns) % self._k, 0)
+        return s, t, blk, loc
+
+    def _Normal(self, a, l, w):
+        """ Blocks of the normal equation
+
+            :param a: design matrix by rows
+            :param l: observed - computed values
+            :param w: weights
+            :returns: station block, point blocks, point-station blocks and right hand sides
+        """
+        cols, vals = a
+        ns, nt, k = self._ns, self._nt, self._k
+        s, t, blk, loc = self._Split(cols)
+        wv = vals * w[:, None]
+        wl = wv * l[:, None]
+        bs = np.bincount(cols[s], wl[s], ns)
+        bt = np.bincount(blk[t] * k + loc[t], wl[t], nt * k).reshape(nt, k)
+        nss = np.zeros(ns * ns)
+        ntt = np.zeros(nt * k * k)
+        nts = np.zeros(nt * k * ns)
+        for i in range(cols.shape[1]):
+            for j in range(cols.shape[1]):
+                x = wv[:, i] * vals[:, j]
+                m = s[:, i] & s[:, j]
+                nss += np.bincount(cols[m, i] * ns + cols[m, j], x[m], ns * ns)
+                m = t[:, i] & t[:, j]
+                ntt += np.bincount((blk[m, i] * k + loc[m, i]) * k + loc[m, j],
+                                   x[m], nt * k * k)
+                m = t[:, i] & s[:, j]
+                nts += np.bincount((blk[m, i] * k + loc[m, i]) * ns +
+                                   cols[m, j], x[m], nt * k * ns)
+        return (nss.reshape(ns, ns), ntt.reshape(nt, k, k),
+                nts.reshape(nt, k, ns), bs, bt)
+
+    def _Factor(self, nss, ntt, nts, bs, bt):
+        """ Eliminate point blocks, solve the reduced normal equation and
+            store the cofactor blocks
+
+            :returns: corrections of unknowns in original order or None if singular
+        """
+        if self._nt and np.max(np.linalg.cond(ntt)) > 1e14:
+            logging.error(" adjustment point not determined")
+            return None
+        tinv = np.linalg.inv(ntt) if self._nt else ntt
+        y = tinv @ nts
+        red = nss - np.tensordot(nts, y, axes=([0, 1], [0, 1]))
+        rs = bs - np.tensordot(y, bt, axes=([0, 1], [0, 1]))
+        if self._ns and np.linalg.cond(red) > 1e14:
+            logging.error(" adjustment singular normal equation")
+            return None
+        qss = np.linalg.inv(red) if self._ns else red
+        xs = qss @ rs
+        xt = np.einsum('tij,tj->ti', tinv, bt) - y @ xs
+        yq = y @ qss
+        self._qss = qss
+        self._qts = -yq
+        self._qtt = tinv + yq @ y.transpose(0, 2, 1)
+        return np.concatenate((xs, xt.ravel()))[self._perm[:self._n]]
+
+    def _Solve(self):
+        """ Gauss-Newton iteration from actual values of unknowns
+
+            :returns: True on success
+        """
+        if self._perm is None:
+            return super()._Solve()
+        self._g = None
+        for _ in range(self.maxIter):
+            _, a, l, w = self._Linear()
+            dx = self._Factor(*self._Normal(a, l, w))
+            if dx is None:
+                return False
+            if self._Update(dx) < self.tol:
+                return True
+        logging.warning(" adjustment did not converge")
+        return True
+
+    def _Qll(self, a):
+        """ Cofactors of adjusted observations
+
+            :param a: design matrix by rows
+            :returns: diagonal of cofactor matrix
+        """
+        if self._perm is None:
+            return super()._Qll(a)
+        cols, vals = a
+        s, t, blk, loc = self._Split(cols)
+        q = np.zeros(len(cols))
+        for i in range(cols.shape[1]):
+            for j in range(cols.shape[1]):
+                x = vals[:, i] * vals[:, j]
+                m = s[:, i] & s[:, j]
+                q[m] += x[m] * self._qss[cols[m, i], cols[m, j]]
+                # a row has one point block, the target
+                m = t[:, i] & t[:, j]
+                q[m] += x[m] * self._qtt[blk[m, i], loc[m, i], loc[m, j]]
+                m = t[:, i] & s[:, j]
+                q[m] += x[m] * self._qts[blk[m, i], loc[m, i], cols[m, j]]
+                m = s[:, i] & t[:, j]
+                q[m] += x[m] * self._qts[blk[m, j], loc[m, j], cols[m, i]]
+        return q
+
+    def _Cofactor(self, cols):
+        """ Cofactor matrix of the unknowns of a point
+
+            :param cols: columns of unknowns
+            :returns: cofactor matrix
+        """
+        if self._perm is None:
+            return super()._Cofactor(cols)
+        c = self._perm[cols]
+        s, t, blk, loc = self._Split(c)
+        res = np.zeros((len(c), len(c)))
+        for i in range(len(c)):
+            for j in range(len(c)):
+                if s[i] and s[j]:
+                    res[i, j] = self._qss[c[i], c[j]]
+                elif t[i] and t[j]:
+                    res[i, j] = self._qtt[blk[i], loc[i], loc[j]]
+                elif t[i] and s[j]:
+                    res[i, j] = self._qts[blk[i], loc[i], c[j]]
+                elif s[i] and t[j]:
+                    res[i, j] = self._qts[blk[j], loc[j], c[i]]
+        return res
+
+    def snooping(self):
+        """ Adjust the network and remove blunders one by one like calling
+            adjust and remove_observation repeatedly
+
+            :returns: adjusted point, blunder (std-residual under the critical value) and the list of removed observations (from, to)
+        """
+        removed = []
+        res = self.adjust()
+        last = None
+        while res[0] is not None and res[1]['std-residual'] > self.krit:
+            b = (res[1]['from'], res[1]['to'])
+            self.remove_observation(b[0], b[1])
+            removed.append(b)
+            last = res
+            res = self.adjust()
+        if res[0] is None and last is not None:
+            logging.warning(" adjustment failed after removing %s - %s",
+                            removed[-1][0], removed[-1][1])
+            res = last
+        return res + (removed,)
+
+if __name__ == "__main__":
+    # compare to dense adjustment on simulated monitoring networks
+    import time
+    from angle import Angle
+    from geometry import Inverse, PI2
+    from lsqadjust import RO
+
+    rng = np.random.default_rng(5)
+    ih = 0.2
+
+    def Network(nst, npt, nref, radius, epochs):
+        """ stations in a row along monitoring points, reference points
+            observed from all stations """
+        pts = [{'id': 'P%d' % i, 'east': e, 'north': n, 'elev': z}
+               for i, (e, n, z) in enumerate(zip(
+                   rng.uniform(0, 100 * nst, npt), rng.uniform(-50, 50, npt),
+                   rng.uniform(90, 110, npt)))]
+        refs = [{'id': 'R%d' % i, 'east': e, 'north': 200.0, 'elev': 100.0}
+                for i, e in enumerate(np.linspace(0, 100 * nst, nref))]
+        sts = [{'id': 'S%d' % i, 'east': 100.0 * i + 50, 'north': 80.0,
+                'elev': 105.0} for i in range(nst)]
+        obs = []
+        for _ in range(epochs):
+            for s in sts:
+                vis = refs + [p for p in pts if abs(p['east'] - s['east']) <
+                              radius]
+                hz, v, d = Inverse(s['east'], s['north'], s['elev'],
+                                   *(np.array([p[k] for p in vis])
+                                     for k in ('east', 'north', 'elev')), ih)
+                hz = hz - 0.5 + rng.normal(0, 1 / RO, len(vis))
+                v = v + rng.normal(0, 1 / RO, len(vis))
+                d = d + rng.normal(0, 0.001, len(vis))
+                obs += [{'station': s['id'], 'ih': ih}] + \
+                    [{'id': p['id'], 'hz': Angle(hz[i] % PI2),
+                      'v': Angle(v[i]), 'distance': d[i]}
+                     for i, p in enumerate(vis)]
+        points = [[{'id': s['id']}, 'ADJ'] for s in sts] + \
+            [[r, 'FIX'] for r in refs] + [[{'id': p['id']}, 'ADJ'] for p in pts]
+        return obs, points
+
+    def Run(g, obs, points):
+        """ load network and adjust """
+        for p, s in points:
+            g.add_point(p, s)
+        for o in obs:
+            g.add_observation(o)
+        t = time.perf_counter()
+        g.adjust()
+        return time.perf_counter() - t
+
+    print("stations points observations  dense [s] sparse [s]  max diff coord [mm] std [mm] m0")
+    for nst, npt, dense in ((3, 200, True), (5, 600, True), (10, 3000, False)):
+        obs, points = Network(nst, npt, 8, 120, 2)
+        gs = SparseAdjust(3)
+        ts = Run(gs, obs, points)
+        nobs = len(gs.residuals)
+        if dense:
+            gd = LsqAdjust(3)
+            td = Run(gd, obs, points)
+            dc = max(abs(a[k] - b[k]) for a, b in zip(gs.adjusted, gd.adjusted)
+                     for k in ('east', 'north', 'elev'))
+            ds = max(abs(a[k] - b[k]) for a, b in zip(gs.adjusted, gd.adjusted)
+                     for k in ('std_east', 'std_north', 'std_elev', 'ell_a'))
+            dm = abs(gs.m0 - gd.m0)
+            print("%8d %6d %12d %10.2f %10.2f %20.1e %8.1e %.1e" %
+                  (nst, npt, nobs, td, ts, dc * 1000, ds, dm))
+        else:
+            print("%8d %6d %12d %10s %10.2f" % (nst, npt, nobs, '-', ts))
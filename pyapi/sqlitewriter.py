@@ -50,10 +50,19 @@ class SqLiteWriter(Writer):
         self.table = table
 
     def __del__(self):
-        try:
-            self.conn.close()
-        except Exception:
-            pass
+        """ Destructor
+        """
+        self.Close()
+
+    def Close(self):
+        """ Close the database connection
+        """
+        if getattr(self, 'conn', None) is not None:
+            try:
+                self.conn.close()
+            except Exception:
+                pass
+            self.conn = None
 
     def WriteData(self, data):
         """ Write observation data to db
@@ -91,6 +100,29 @@ class SqLiteWriter(Writer):
             return -1
         return res
 
+    def DeleteData(self, ids, dt):
+        """ Delete records of points at a time, e.g. before an epoch is
+            written again
+
+            :param ids: point ids (list)
+            :param dt: date/time of records (datetime or str)
+            :returns: number of deleted records or -1 on error
+        """
+        if not ids:
+            return 0
+        sqlstr = 'DELETE FROM ' + self.table + " WHERE datetime = '" + \
+            self.StrVal(dt) + "' AND id IN (" + \
+            ','.join(["'" + str(i) + "'" for i in ids]) + ');'
+        try:
+            c = self.conn.cursor()
+            c.execute(sqlstr)
+            res = c.rowcount
+            self.conn.commit()
+        except Exception as e:
+            logging.error(str(e))
+            return -1
+        return res
+
 if __name__ == "__main__":
     myfile = SqLiteWriter(db="test.sqlite", table='monitoring_obs')
     data = {'id': '1', 'hz': Angle(0.12345), 'v': Angle(100.2365, 'GON'), \
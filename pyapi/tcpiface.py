@@ -10,19 +10,24 @@
 .. moduleauthor:: Bence Turak <bence.turak@gmail.com>
 """
 
-import sys
 import socket
+import struct
 import logging
 import re
 from iface import Iface
+from linebuffer import LineBuffer
 
 class TCPIface(Iface):
     """Interface to communicate on TCP/IP protocol. This class requires socket.
 
         :param name: name of tcp interface (str)
         :param address: address of server (tuple) (ip(str), port(int))
-        :param bufSize: size of buffer in case of file (int)
+        :param bufSize: size of chunks read from the socket (int)
         :param timeout: communication timeout seconds (int), default 15
+
+        Binary data are transferred with a known length, either announced in
+        the previous answer (e.g. binsize of a photo) or in a 4 byte big endian
+        length prefix (PutFrame/GetFrame).
     """
 
     def __init__(self, name, address, bufSize = 1024, timeout=15):
@@ -31,6 +36,7 @@ class TCPIface(Iface):
         super(TCPIface, self).__init__(name)
         self.sock = None
         self.bufSize = None
+        self.buffer = LineBuffer(bufSize)
 
         # open socket
         self.Open(address, bufSize, timeout)
@@ -48,6 +54,7 @@ class TCPIface(Iface):
             self.sock.connect(address)
             self.sock.settimeout(timeout)
             self.bufSize = bufSize
+            self.buffer = LineBuffer(bufSize)
             self.opened = True
             self.state = self.IF_OK
         except Exception:
@@ -67,46 +74,95 @@ class TCPIface(Iface):
             logging.error(" cannot close TCP socet")
 
     def GetLine(self, fileSize = None):
-        """ read from TCP interface until end of line
+        """ read from TCP interface until end of line or a given number of
+            bytes in case of binary data
 
             :param fileSize: the size of the expected file (int)
 
-            :returns: line read from TCP (str) or empty string on timeout or error, state is set also
+            :returns: line read from TCP (bytes) or binary data (bytearray) or empty string on timeout or error, state is set also
         """
         if self.sock is None or not self.opened or self.state != self.IF_OK:
             logging.error(" TCP socket not opened")
             return None
-        # read answer till end of line
-
-        ans = b''
-        a = b''
+        if fileSize is not None:
+            return self._ReadExact(fileSize)
+        # read answer till end of line, bytes after it are kept in the buffer
         try:
-            if fileSize != None:
-                a = self.sock.recv(self.bufSize)
-                ans += a
-                while sys.getsizeof(ans) < fileSize + 17:
-                    l = sys.getsizeof(ans)
-                    a = self.sock.recv(self.bufSize)
-                    ans += a
-            else:
-                a = self.sock.recv(1)
-                ans += a
-                while a != b'\n':
-                    a = self.sock.recv(1)
-                    ans += a
-
-        except Exception as e:
-            #self.state = self.IF_READ
+            ans, complete = self.buffer.ReadLine(self.sock.recv, '\n')
+        except Exception:
+            ans, complete = self.buffer.Flush(), False
             logging.error(" cannot read TCP socket")
-        if ans == b'':
-            # timeout exit loop
-            #self.state = self.IF_TIMEOUT
+        if not complete:
             logging.error(" timeout on TCP socket")
         # remove end of line
         logging.debug(" message got: %s", ans)
         ans = ans.strip(b'\n')
         return ans
 
+    def _ReadExact(self, size):
+        """ read a given number of bytes into a preallocated buffer,
+            buffered bytes are used first
+
+            :param size: number of bytes to read (int)
+            :returns: bytes read (bytearray), shorter on timeout or error
+        """
+        data = bytearray(size)
+        view = memoryview(data)
+        n = self.buffer.ReadInto(view)
+        try:
+            while n < size:
+                k = self.sock.recv_into(view[n:])
+                if k == 0:
+                    break   # connection closed
+                n += k
+        except Exception:
+            logging.error(" cannot read TCP socket")
+        view.release()
+        if n < size:
+            logging.error(" incomplete binary data on TCP socket %d/%d", n, size)
+            del data[n:]
+        return data
+
+    def GetFrame(self):
+        """ read length prefixed binary data
+
+            :returns: binary data (bytearray) or None on error
+        """
+        if self.sock is None or not self.opened or self.state != self.IF_OK:
+            logging.error(" TCP socket not opened")
+            return None
+        head = self._ReadExact(4)
+        if len(head) < 4:
+            return None
+        size = struct.unpack('!I', head)[0]
+        data = self._ReadExact(size)
+        if len(data) < size:
+            return None
+        return data
+
+    def PutFrame(self, data):
+        """ send binary data with a length prefix
+
+            :param data: data to send (bytes like)
+            :returns: 0 - on OK, -1 on error or interface is in error state
+        """
+        if self.sock is None or not self.opened or self.state != self.IF_OK:
+            logging.error(" TCP socket not opened or in error state")
+            return -1
+        try:
+            head = struct.pack('!I', len(data))
+            if len(data) < 65536:
+                # one segment, small requests are not delayed by Nagle
+                self.sock.sendall(head + bytes(data))
+            else:
+                self.sock.sendall(head)
+                self.sock.sendall(data)
+        except Exception:
+            self.state = self.IF_WRITE
+            logging.error(" cannot write tcp")
+            return -1
+        return 0
+
     def PutLine(self, msg):
         """ send message through the TCP socket
 
@@ -125,7 +181,7 @@ class TCPIface(Iface):
         # send message to socket
         logging.debug(" message sent: %s", msg)
         try:
-            self.sock.send(msg)
+            self.sock.sendall(msg)
         except Exception:
             self.state = self.IF_WRITE
             logging.error(" cannot write tcp")
@@ -135,9 +191,16 @@ class TCPIface(Iface):
     def Send(self, msg):
         """ send message to TCP socket and read answer
 
-            :param msg: message to send, it can be multipart message separated by '|' (str)
-            :returns: answer from server (str)
+            :param msg: message to send, it can be multipart message separated by '|' (str) or binary request sent in a frame (bytes)
+            :returns: answer from server (str) or binary answer (bytearray)
         """
+        if isinstance(msg, (bytes, bytearray)):
+            if self.PutFrame(msg) != 0:
+                return None
+            ans = self.GetFrame()
+            if ans is None:
+                self.state = self.IF_READ
+            return ans
         msglist = re.split("\|", msg)
         res = b''
         # sending
@@ -150,7 +213,79 @@ class TCPIface(Iface):
         return res
 
 if __name__ == "__main__":
-    a = TCPIface('test', ('127.0.0.1', 80), 1024, 15)
-    print (a.GetName())
-    print (a.GetState())
-    print (a.Send('GET /index.html HTTP/1.1'))
+    # loopback benchmark of binary transfers and lines
+    #    command line parameters
+    #    argv[1]: size of binary data in MB, default 8
+    #    argv[2]: number of transfers, default 5
+    import sys
+    import time
+    import threading
+
+    size = int(float(sys.argv[1]) * 1024 * 1024) if len(sys.argv) > 1 else 8 * 1024 * 1024
+    n = int(sys.argv[2]) if len(sys.argv) > 2 else 5
+    payload = bytes(range(256)) * (size // 256)
+    size = len(payload)
+    nlines = 20000
+
+    def server(srv):
+        """ answer each request with a line followed by binary data """
+        conn, _ = srv.accept()
+        f = conn.makefile('rb')
+        for line in f:
+            if line.startswith(b'lines'):
+                conn.sendall(b'%R1P,0,0:0,1.2345,1.5432,0,0,0.0001,-0.0002,0\n' * nlines)
+            elif line.startswith(b'frame'):
+                conn.sendall(struct.pack('!I', size))
+                conn.sendall(payload)
+            else:
+                conn.sendall(b'{"ret": 0, "binsize": %d}\n' % size)
+                conn.sendall(payload)
+        conn.close()
+
+    def legacy_bin(iface):
+        """ original chunk concatenation """
+        legacy_line(iface)
+        ans = b''
+        while len(ans) < size:
+            ans += iface.sock.recv(iface.bufSize)
+        return ans
+
+    def legacy_line(iface):
+        """ original byte by byte line reader """
+        ans = b''
+        a = b''
+        while a != b'\n':
+            a = iface.sock.recv(1)
+            ans += a
+        return ans.strip(b'\n')
+
+    srv = socket.socket(socket.AF_INET, socket.SOCK_STREAM)
+    srv.bind(('127.0.0.1', 0))
+    srv.listen(1)
+    threading.Thread(target=server, args=(srv,), daemon=True).start()
+    a = TCPIface('test', srv.getsockname(), 1024, 15)
+    for name, func in (('concatenation', legacy_bin),
+                       ('recv_into', lambda iface: iface.GetLine() and iface.GetLine(size))):
+        t = time.perf_counter()
+        for _ in range(n):
+            a.PutLine('photo')
+            if func(a) != payload:
+                print("data mismatch")
+        t = time.perf_counter() - t
+        print("%-14s %8.1f MB/s" % (name, n * size / t / 1024 / 1024))
+    t = time.perf_counter()
+    for _ in range(n):
+        a.PutLine('frame')
+        if a.GetFrame() != payload:
+            print("data mismatch")
+    t = time.perf_counter() - t
+    print("%-14s %8.1f MB/s" % ('frame', n * size / t / 1024 / 1024))
+    for name, func in (('byte by byte', legacy_line),
+                       ('buffered', lambda iface: iface.GetLine())):
+        a.PutLine('lines')
+        t = time.perf_counter()
+        for _ in range(nlines):
+            func(a)
+        t = time.perf_counter() - t
+        print("%-14s %8.0f lines/s" % (name, nlines / t))
+    a.Close()
@@ -0,0 +1,273 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+"""
+.. module:: telemetry.py
+   :platform: Unix, Windows
+   :synopsis: Ulyxes - an open source project to drive total stations and
+       publish observation results. GPL v2.0 license Copyright (C)
+       2010- Zoltan Siki <siki.zoltan@epito.bme.hu>.
+
+.. moduleauthor:: Zoltan Siki <siki.zoltan@epito.bme.hu>
+
+Time spent in the stages of instrument communication and error counters.
+Instruments collect send (wire and instrument time) and result (parsing)
+times per command and writer times if a Telemetry object is assigned::
+
+    tel = Telemetry()
+    ts.SetTelemetry(tel)
+    tel.TimeWriter(wrt, 'obs')
+    ...
+    print(tel.Profile())
+"""
+
+import time
+import json
+import logging
+import threading
+from contextlib import contextmanager
+from latencystats import LatencyStats
+
+class Telemetry(object):
+    """ Latency histograms and error counters of instruments
+
+            :param name: name used as prefix of metrics (str), default 'ulyxes'
+    """
+
+    def __init__(self, name='ulyxes'):
+        """ Constructor
+        """
+        self.name = name
+        self.lock = threading.Lock()
+        self.hist = {}      # stage -> LatencyStats
+        self.total = {}     # (stage, key) -> [count, seconds]
+        self.errors = {}    # (kind, key) -> count
+        self.mark = time.monotonic()    # start of cycle
+        self.last = {}      # totals at start of cycle
+        self.server = None
+        self.stateNames = {}
+
+    def Add(self, stage, key, t):
+        """ Add the duration of a stage
+
+            :param stage: name of stage e.g. send/result/write (str)
+            :param key: command key e.g. GeoCOM RPC code (str)
+            :param t: duration in seconds
+        """
+        with self.lock:
+            if stage not in self.hist:
+                self.hist[stage] = LatencyStats(maxCount=None)
+            self.hist[stage].Record(key, t)
+            tot = self.total.setdefault((stage, key), [0, 0.0])
+            tot[0] += 1
+            tot[1] += t
+
+    def Error(self, kind, key):
+        """ Count an error
+
+            :param kind: iface/instrument (str)
+            :param key: e.g. IF_TIMEOUT or command:error code (str)
+        """
+        with self.lock:
+            self.errors[(kind, key)] = self.errors.get((kind, key), 0) + 1
+
+    def IfaceError(self, iface):
+        """ Count the error state of an interface
+
+            :param iface: interface in error state (Iface)
+        """
+        cls = type(iface)
+        if cls not in self.stateNames:
+            self.stateNames[cls] = {getattr(iface, n): n for n in dir(iface)
+                                    if n.startswith('IF_')}
+        self.Error('iface', self.stateNames[cls].get(iface.state,
+                                                     str(iface.state)))
+
+    @contextmanager
+    def Timer(self, stage, key):
+        """ Context manager to time a stage
+
+            :param stage: name of stage (str)
+            :param key: command key (str)
+        """
+        start = time.monotonic()
+        try:
+            yield
+        finally:
+            self.Add(stage, key, time.monotonic() - start)
+
+    def TimeWriter(self, writer, key=None):
+        """ Time the WriteData calls of a writer
+
+            :param writer: writer to time (Writer)
+            :param key: key of the writer in the statistics, default class name of the writer
+            :returns: the writer
+        """
+        if key is None:
+            key = type(writer).__name__
+        write = writer.WriteData
+
+        def WriteData(data):
+            """ timed WriteData """
+            with self.Timer('write', key):
+                return write(data)
+        writer.WriteData = WriteData
+        return writer
+
+    def Snapshot(self):
+        """ Statistics for inspection or export
+
+            :returns: dictionary of stages and errors
+        """
+        with self.lock:
+            stages = {}
+            for (stage, key), (n, t) in self.total.items():
+                h = self.hist[stage]
+                stages.setdefault(stage, {})[key] = {
+                    'count': n, 'time': t,
+                    'p50': h.Quantile(key, 0.5), 'p99': h.Quantile(key, 0.99),
+                    'max': h.max[key]}
+            errors = {}
+            for (kind, key), n in self.errors.items():
+                errors.setdefault(kind, {})[key] = n
+        return {'stages': stages, 'errors': errors}
+
+    def Cycle(self):
+        """ Time spent in stages since the previous call (or creation)
+
+            :returns: wall time of cycle and dictionary of stage: (count, seconds)
+        """
+        now = time.monotonic()
+        with self.lock:
+            res = {}
+            for (stage, key), (n, t) in self.total.items():
+                n0, t0 = self.last.get((stage, key), (0, 0.0))
+                if n > n0:
+                    s = res.setdefault(stage, [0, 0.0])
+                    s[0] += n - n0
+                    s[1] += t - t0
+            self.last = {k: tuple(v) for k, v in self.total.items()}
+        wall = now - self.mark
+        self.mark = now
+        return wall, res
+
+    def Profile(self):
+        """ Profile of the cycle since the previous call as text
+
+            :returns: lines of profile (str)
+        """
+        wall, stages = self.Cycle()
+        lines = ["cycle {:.3f} s".format(wall)]
+        other = wall
+        for stage in sorted(stages):
+            n, t = stages[stage]
+            other -= t
+            lines.append("{:>8s} {:6d} calls {:9.3f} s {:5.1f}%".format(
+                stage, n, t, 100.0 * t / wall if wall > 0 else 0))
+        lines.append("{:>8s} {:>12s} {:9.3f} s {:5.1f}%".format(
+            'other', '', other, 100.0 * other / wall if wall > 0 else 0))
+        with self.lock:
+            for (kind, key), n in sorted(self.errors.items()):
+                lines.append("{:>8s} {} errors: {}".format(kind, key, n))
+        return '\n'.join(lines)
+
+    def Save(self, fname):
+        """ Save statistics to JSON file
+
+            :param fname: name of file
+            :returns: True on success
+        """
+        try:
+            with open(fname, 'w') as f:
+                json.dump(self.Snapshot(), f, indent=1, sort_keys=True)
+        except Exception:
+            logging.error(" cannot save telemetry to %s", fname)
+            return False
+        return True
+
+    def Prometheus(self):
+        """ Statistics in Prometheus text exposition format
+
+            :returns: metrics (str)
+        """
+        lines = []
+        n = self.name
+        with self.lock:
+            lines.append('# TYPE {}_seconds histogram'.format(n))
+            for stage, h in sorted(self.hist.items()):
+                for key in sorted(h.hist):
+                    lbl = 'stage="{}",key="{}"'.format(stage, key)
+                    cum = 0
+                    for edge, c in h.Buckets(key):
+                        cum += c
+                        lines.append('{}_seconds_bucket{{{},le="{:.6g}"}} {}'.format(
+                            n, lbl, edge, cum))
+                    lines.append('{}_seconds_bucket{{{},le="+Inf"}} {}'.format(
+                        n, lbl, cum))
+                    cnt, tot = self.total[(stage, key)]
+                    lines.append('{}_seconds_sum{{{}}} {:.6f}'.format(n, lbl, tot))
+                    lines.append('{}_seconds_count{{{}}} {}'.format(n, lbl, cnt))
+            lines.append('# TYPE {}_errors_total counter'.format(n))
+            for (kind, key), c in sorted(self.errors.items()):
+                lines.append('{}_errors_total{{kind="{}",key="{}"}} {}'.format(
+                    n, kind, key, c))
+        return '\n'.join(lines) + '\n'
+
+    def Serve(self, port=9100, host='127.0.0.1'):
+        """ Start a HTTP endpoint for Prometheus in a background thread
+
+            :param port: TCP port (int), default 9100
+            :param host: address to listen on, default localhost only
+            :returns: True on success
+        """
+        from http.server import HTTPServer, BaseHTTPRequestHandler
+        tel = self
+
+        class Handler(BaseHTTPRequestHandler):
+            """ answer metrics to any GET request """
+            def do_GET(self):
+                """ send metrics """
+                body = tel.Prometheus().encode('ascii', 'replace')
+                self.send_response(200)
+                self.send_header('Content-Type', 'text/plain; version=0.0.4')
+                self.send_header('Content-Length', str(len(body)))
+                self.end_headers()
+                self.wfile.write(body)
+
+            def log_message(self, *args):
+                """ no access log """
+
+        try:
+            self.server = HTTPServer((host, port), Handler)
+        except Exception:
+            logging.error(" cannot start telemetry endpoint on port %d", port)
+            return False
+        threading.Thread(target=self.server.serve_forever, daemon=True).start()
+        return True
+
+if __name__ == "__main__":
+    # profile a simulated measurement cycle
+    from simiface import SimIface
+    from totalstation import TotalStation
+    from leicatps1200 import LeicaTPS1200
+    from csvwriter import CsvWriter
+    import math
+    from angle import Angle
+
+    tel = Telemetry()
+    pts = [{'id': str(i), 'east': 100.0 + 10 * i, 'north': 50.0 - 5 * i,
+            'elev': 10.0} for i in range(5)]
+    ts = TotalStation('sim', LeicaTPS1200(),
+                      SimIface(targets=pts, timeScale=0.05, seed=1))
+    ts.SetTelemetry(tel)
+    wrt = tel.TimeWriter(CsvWriter(fname='stdout', filt=['id', 'hz', 'v', 'distance']))
+    ts.SetATR(1)
+    for p in pts:
+        d = math.hypot(p['east'], p['north'])
+        ts.Move(Angle(math.atan2(p['east'], p['north'])),
+                Angle(math.atan2(d, p['elev'])), 1)
+        ts.Measure()
+        obs = ts.GetMeasure()
+        obs['id'] = p['id']
+        wrt.WriteData(obs)
+    print(tel.Profile())
+    print(tel.Prometheus())
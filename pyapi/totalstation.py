@@ -25,16 +25,24 @@ class TotalStation(Instrument):
             :param measureUnit: measure unit part of instrument
             :param measureIface: interface to physical unit
             :param writerUnit: store data, default None
+            :param shadow: skip Set* commands if the instrument has the value already, default False
     """
     FACE_LEFT = 0
     FACE_RIGHT = 1
     FACE_AVG = 2
 
-    def __init__(self, name, measureUnit, measureIface, writerUnit=None):
+    # settings changed by the instrument together with a setting
+    shadowDeps = {'pt': ('pc',), 'pc': ('pt',), 'atr': ('lock',),
+                  'lock': ('atr',)}
+
+    def __init__(self, name, measureUnit, measureIface, writerUnit=None,
+                 shadow=False):
         """ Constructor
         """
         # call super class init
         super().__init__(name, measureUnit, measureIface, writerUnit)
+        self.shadow = {} if shadow else None   # last confirmed settings
+        self.savedTrips = 0     # Set* commands not sent
         if isinstance(measureUnit, Trimble5500):
             # change default eol marker for read
             measureIface.eomRead = '>'
@@ -52,6 +60,71 @@ class TotalStation(Instrument):
         return "{}('{}',{},'{}')".format(type(self).__name__, self.name,
                                          muString, self.measureIface.GetName())
 
+    def _process(self, msg, pic=None):
+        """ Send message to measure unit and process answer, the settings
+            are forgotten after communication errors (instrument restarted?)
+
+            :param msg: message to send
+            :param pic: when using a camera you have tive give writable binary file
+            :returns: parsed answer (dictionary)
+        """
+        res = super()._process(msg, pic)
+        if self.measureIface.state != self.measureIface.IF_OK:
+            self.ClearShadow()
+        return res
+
+    def _Set(self, key, value, msg):
+        """ Send a setting unless the instrument has the same value
+
+            :param key: name of the setting
+            :param value: value of the setting (comparable)
+            :param msg: message to send
+            :returns: processed answer from instrument or empty dictionary if not sent
+        """
+        if self.shadow is not None and key in self.shadow and \
+           self.shadow[key] == value:
+            self.savedTrips += 1
+            return {}
+        res = self._process(msg)
+        self._Confirm(key, value, res)
+        return res
+
+    def _Confirm(self, key, value, res):
+        """ Store a setting confirmed by the instrument
+
+            :param key: name of the setting
+            :param value: value of the setting
+            :param res: processed answer from instrument
+        """
+        if self.shadow is None:
+            return
+        for k in self.shadowDeps.get(key, ()):
+            self.shadow.pop(k, None)
+        if self.measureIface.state == self.measureIface.IF_OK and \
+           isinstance(res, dict) and 'errorCode' not in res:
+            self.shadow[key] = value
+        else:
+            self.shadow.pop(key, None)
+
+    def ClearShadow(self):
+        """ Forget the settings of the instrument, the next Set* commands are
+            sent (e.g. the instrument was set manually)
+        """
+        if self.shadow is not None:
+            self.shadow.clear()
+
+    def GetSavedTrips(self, reset=False):
+        """ Get the number of Set* commands not sent because the instrument
+            had the value already
+
+            :param reset: start counting again
+            :returns: number of saved round trips
+        """
+        n = self.savedTrips
+        if reset:
+            self.savedTrips = 0
+        return n
+
     def SetPc(self, pc):
         """ Set prism constant
 
@@ -59,7 +132,7 @@ class TotalStation(Instrument):
             :returns: processed answer from instrument
         """
         msg = self.measureUnit.SetPcMsg(pc)
-        return self._process(msg)
+        return self._Set('pc', pc, msg)
 
     def GetPc(self):
         """ Get prism constant
@@ -76,7 +149,7 @@ class TotalStation(Instrument):
             :returns: processed answer from instrument
         """
         msg = self.measureUnit.SetATRMsg(atr)
-        return self._process(msg)
+        return self._Set('atr', atr, msg)
 
     def GetATR(self):
         """ Get ATR status of instrument
@@ -91,7 +164,7 @@ class TotalStation(Instrument):
             :param typ: prizm type
         """
         msg = self.measureUnit.SetPrismTypeMsg(typ)
-        return self._process(msg)
+        return self._Set('pt', typ, msg)
 
     def GetPrismType(self):
         """ Get prism type
@@ -106,7 +179,7 @@ class TotalStation(Instrument):
             :returns: processed answer from instrument
         """
         msg = self.measureUnit.SetLockMsg(lock)
-        return self._process(msg)
+        return self._Set('lock', lock, msg)
 
     def GetLock(self):
         """ Get lock status
@@ -136,7 +209,8 @@ class TotalStation(Instrument):
             wetTemp = dryTemp - 5.0
         msg = self.measureUnit.SetAtmCorrMsg(valueOfLambda, pres, dryTemp,
                                              wetTemp)
-        return self._process(msg)
+        return self._Set('atmCorr', (valueOfLambda, pres, dryTemp, wetTemp),
+                         msg)
 
     def GetAtmCorr(self):
         """ Get atmospheric correction
@@ -155,7 +229,8 @@ class TotalStation(Instrument):
         """
         msg = self.measureUnit.SetRefCorrMsg(status, earthRadius,
                                              refracticeScale)
-        return self._process(msg)
+        return self._Set('refCorr', (status, earthRadius, refracticeScale),
+                         msg)
 
     def GetRefCorr(self):
         """ Get refraction correction
@@ -175,7 +250,7 @@ class TotalStation(Instrument):
             :returns: ???
         """
         msg = self.measureUnit.SetStationMsg(easting, northing, elevation, ih)
-        return self._process(msg)
+        return self._Set('station', (easting, northing, elevation, ih), msg)
 
     def GetStation(self):
         """ Get station coordinates
@@ -192,7 +267,7 @@ class TotalStation(Instrument):
             :returns: empty dictionary
         """
         msg = self.measureUnit.SetEDMModeMsg(mode)
-        return self._process(msg)
+        return self._Set('edmMode', mode, msg)
 
     def GetEDMMode(self):
         """ Get EDM mode
@@ -316,7 +391,7 @@ class TotalStation(Instrument):
             :returns: empty dictionary or error
         """
         msg = self.measureUnit.SetRedLaserMsg(on)
-        return self._process(msg)
+        return self._Set('redLaser', on, msg)
 
     def SetSearchArea(self, hzCenter=None, vCenter=None, \
                       hzRange=None, vRange=None, on=1):
@@ -366,7 +441,8 @@ class TotalStation(Instrument):
             :param dRangeV: vertical range (Angle)
         """
         msg = self.measureUnit.SetSpiralMsg(dRangeHz, dRangeV)
-        return self._process(msg)
+        return self._Set('spiral', (dRangeHz.GetAngle(), dRangeV.GetAngle()),
+                         msg)
 
     def SearchTarget(self):
         """ Search target
@@ -382,6 +458,7 @@ class TotalStation(Instrument):
             :param mode: 0/1 local/remote mode
             :returns: empty list if successful, timeout may occure
         """
+        self.ClearShadow()
         msg = self.measureUnit.SwitchOnMsg(mode)
         return self._process(msg)
 
@@ -391,6 +468,7 @@ class TotalStation(Instrument):
             :param mode: 0/1 power down/sleep state
             :returns: processed answer from instrument
         """
+        self.ClearShadow()
         msg = self.measureUnit.SwitchOffMsg()
         return self._process(msg)
 
@@ -418,6 +496,94 @@ class TotalStation(Instrument):
         msg = self.measureUnit.GetInternalTemperatureMsg()
         return self._process(msg)
 
+    def Pipeline(self, *queries):
+        """ Send several independent queries in a single multipart message,
+            e.g. Pipeline('GetAngles', 'GetATR', 'GetPc'). GeoCOM requests are
+            tagged with transaction IDs so a SerialIface with window > 1 sends
+            them back-to-back.
+
+            :param queries: names of query methods without parameters (str)
+            :returns: merged processed answers from instrument
+        """
+        msgs = [getattr(self.measureUnit, q + 'Msg')() for q in queries]
+        msg = self.measureUnit.PipelineMsg(msgs)
+        return self._process(msg)
+
+    def _Probe(self, tries=1):
+        """ Check communication with the instrument
+
+            :param tries: number of attempts
+            :returns: True if the instrument answered
+        """
+        for _ in range(tries):
+            res = self._process(self.measureUnit.NullProcMsg())
+            if self.measureIface.state == self.measureIface.IF_OK and \
+               'errorCode' not in res:
+                return True
+            self.measureIface.ClearState()
+        return False
+
+    def _ScanBaudRate(self, rates):
+        """ Find the first baud rate the instrument answers at
+
+            :param rates: baud rates to try
+            :returns: baud rate or None, the line is left at this rate
+        """
+        for r in rates:
+            self.measureIface.SetBaudRate(r)
+            if self._Probe():
+                return r
+        return None
+
+    def NegotiateBaudRate(self, rates=(115200, 57600, 38400, 19200, 9600),
+                          timeout=0.5):
+        """ Find the speed the instrument answers at on the serial line and
+            switch to the highest rate if the measure unit supports it. The
+            line falls back to the working rate if the switch fails.
+
+            :param rates: baud rates to try in decreasing order
+            :param timeout: read timeout during probing (seconds)
+            :returns: baud rate in use or None if the instrument does not answer
+        """
+        iface = self.measureIface
+        if not hasattr(iface, 'SetBaudRate') or \
+           not hasattr(self.measureUnit, 'NullProcMsg'):
+            logging.error(" baud rate negotiation is not supported")
+            return None
+        orig = iface.GetBaudRate()
+        prevTimeout = iface.SetTimeout(timeout)
+        # probe the current rate first, then the others
+        baud = self._ScanBaudRate([orig] + [r for r in rates if r != orig])
+        if baud is None:
+            logging.error(" instrument does not answer at any baud rate")
+            iface.SetBaudRate(orig)
+            iface.SetTimeout(prevTimeout)
+            return None
+        for r in rates:
+            if r <= baud:
+                break
+            msg = self.measureUnit.SetBaudRateMsg(r)
+            if msg is None:
+                continue
+            res = self._process(msg)
+            if iface.state != iface.IF_OK or 'errorCode' in res:
+                iface.ClearState()
+                continue
+            iface.SetBaudRate(r)
+            time.sleep(0.2)    # instrument reopens its port
+            if self._Probe(3):
+                baud = r
+                break
+            # fall back to the working rate, scan if the instrument is lost
+            logging.warning(" switch to %d baud failed", r)
+            baud = self._ScanBaudRate([baud, r] + list(rates))
+            if baud is None:
+                logging.error(" instrument lost during baud rate negotiation")
+                iface.SetBaudRate(orig)
+                break
+        iface.SetTimeout(prevTimeout)
+        return baud
+
     def GetFace(self):
         """ Get face left or face right
 
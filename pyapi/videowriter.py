@@ -42,10 +42,17 @@ class VideoWriter(Writer):
     def __del__(self):
         """ Destructor
         """
-        try:
-            self.wp.release()
-        except Exception:
-            pass
+        self.Close()
+
+    def Close(self):
+        """ Release the video file
+        """
+        if getattr(self, 'wp', None) is not None:
+            try:
+                self.wp.release()
+            except Exception:
+                pass
+            self.wp = None
 
     def WriteData(self, data):
         """ write image to video file
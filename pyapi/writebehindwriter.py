@@ -0,0 +1,217 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+"""
+.. module:: writebehindwriter.py
+   :platform: Unix, Windows
+   :synopsis: Ulyxes - an open source project to drive total stations and
+           publish observation results.
+           GPL v2.0 license
+           Copyright (C) 2010- Zoltan Siki <siki.zoltan@epito.bme.hu>
+
+.. moduleauthor:: Zoltan Siki <siki.zoltan@epito.bme.hu>
+"""
+
+import os
+import time
+import queue
+import pickle
+import logging
+import datetime
+import threading
+from writer import Writer
+
+class WriteBehindWriter(Writer):
+    """ Write data through another writer from a background thread, so the
+        instrument does not wait for slow targets (e.g. HttpWriter). The
+        time stamp is added when data are queued. Writers bound to the
+        creating thread (SqLiteWriter) cannot be wrapped. Records left in
+        the spill file by a previous run are written first.
+
+            :param writer: writer to send data to (Writer)
+            :param size: maximal number of queued records (int), default 1000
+            :param policy: what to do if the queue is full 'block'/'drop'/'spill', default 'block'
+            :param spill: file name to spill records to with 'spill' policy (str)
+            :param name: name of writer (str), default None
+    """
+    POLICIES = ('block', 'drop', 'spill')
+
+    def __init__(self, writer, size=1000, policy='block', spill=None,
+                 name=None):
+        """ Constructor
+        """
+        super().__init__(name)
+        if policy not in self.POLICIES:
+            raise ValueError('invalid policy: ' + str(policy))
+        if policy == 'spill' and spill is None:
+            raise ValueError('spill file name missing')
+        self.writer = writer
+        self.policy = policy
+        self.spill = spill
+        self.q = queue.Queue(size)
+        self.lock = threading.Lock()
+        self.spillFp = None     # spill file opened for append
+        self.dropped = 0        # number of records dropped
+        self.stopping = False
+        if policy == 'spill' and os.path.isfile(spill) and \
+                os.path.getsize(spill) > 0:
+            # records spilled before a crash, replayed before new ones
+            self.spillFp = open(spill, 'ab')
+            logging.warning(" replaying records from %s", spill)
+        self.thread = threading.Thread(target=self._Run, daemon=True)
+        self.thread.start()
+
+    def __del__(self):
+        """ Destructor
+        """
+        try:
+            self.Close()
+        except Exception:
+            pass
+
+    def WriteData(self, data):
+        """ Queue observation data
+
+            :param data: dictionary with observation data
+            :returns: 0/-1/-3 OK/queue error or closed/empty not written
+        """
+        if data is None or self.DropData(data):
+            logging.warning(" empty or inappropiate data not written")
+            return -3
+        if self.stopping:
+            logging.error(" write behind writer closed")
+            return -1
+        # time of observation, not the time of writing
+        data = dict(data)
+        if 'datetime' not in data:
+            data['datetime'] = datetime.datetime.now()
+        try:
+            if self.policy == 'block':
+                self.q.put(data)
+            elif self.policy == 'drop':
+                while True:
+                    try:
+                        self.q.put_nowait(data)
+                        break
+                    except queue.Full:
+                        try:
+                            self.q.get_nowait()     # drop oldest
+                            self.q.task_done()
+                            self.dropped += 1
+                            logging.warning(" write queue full, record dropped")
+                        except queue.Empty:
+                            pass
+            else:
+                with self.lock:
+                    # keep order, spill while spilled records are pending
+                    if self.spillFp is None:
+                        try:
+                            self.q.put_nowait(data)
+                            return 0
+                        except queue.Full:
+                            self.spillFp = open(self.spill, 'ab')
+                            logging.warning(" write queue full, spilling to %s",
+                                            self.spill)
+                    pickle.dump(data, self.spillFp)
+                    self.spillFp.flush()
+        except Exception:
+            self.state = self.WR_WRITE
+            logging.error(" cannot queue data")
+            return -1
+        return 0
+
+    def Flush(self):
+        """ Wait until all queued and spilled records are written
+        """
+        self.q.join()
+        while self.spillFp is not None and self.thread.is_alive():
+            self.q.join()
+            time.sleep(0.05)
+
+    def Close(self):
+        """ Write pending records, stop the background thread and close
+            the wrapped writer
+        """
+        if self.stopping:
+            return
+        self.stopping = True
+        self.thread.join()
+        self.writer.Close()
+
+    def _Write(self, data):
+        """ Write a record through the wrapped writer
+
+            :param data: dictionary with observation data
+        """
+        try:
+            res = self.writer.WriteData(data)
+            if isinstance(res, int) and res < 0:
+                logging.error(" write behind: writer error %d", res)
+        except Exception:
+            logging.error(" write behind: writer failed")
+
+    def _Replay(self):
+        """ Write spilled records in order, new records are spilled until
+            the spill file is consumed
+        """
+        with open(self.spill, 'rb') as fp:
+            while True:
+                with self.lock:
+                    try:
+                        data = pickle.load(fp)
+                    except Exception as e:
+                        if not isinstance(e, EOFError):
+                            # record cut by a crash, rest is lost
+                            logging.error(" broken spill file %s", self.spill)
+                        self.spillFp.close()
+                        self.spillFp = None
+                        os.remove(self.spill)
+                        return
+                self._Write(data)
+
+    def _Run(self):
+        """ Background thread writing queued records
+        """
+        while True:
+            try:
+                data = self.q.get(timeout=0.2)
+            except queue.Empty:
+                if self.spillFp is not None:
+                    self._Replay()
+                elif self.stopping:
+                    break
+                continue
+            self._Write(data)
+            self.q.task_done()
+
+if __name__ == "__main__":
+    from angle import Angle
+
+    class SlowWriter(Writer):
+        """ writer simulating a slow server """
+        def WriteData(self, data):
+            time.sleep(0.05)
+            data = self.ExtendData(data)
+            print(data['id'], data['datetime'].strftime('%H:%M:%S.%f'))
+            return 0
+
+    for pol in WriteBehindWriter.POLICIES:
+        print(pol)
+        wr = WriteBehindWriter(SlowWriter(), 5, pol, 'spill.tmp')
+        t = time.perf_counter()
+        for i in range(10):
+            wr.WriteData({'id': i, 'hz': Angle(i, 'GON')})
+            time.sleep(0.01)
+        print("queued in %.3f s" % (time.perf_counter() - t))
+        wr.Close()
+        print("dropped: %d" % wr.dropped)
+
+    # records spilled before a crash are written first
+    print('crash')
+    with open('spill.tmp', 'wb') as f:
+        for i in (100, 101):
+            pickle.dump({'id': i, 'datetime': datetime.datetime.now()}, f)
+    wr = WriteBehindWriter(SlowWriter(), 5, 'spill', 'spill.tmp')
+    for i in range(3):
+        wr.WriteData({'id': i, 'hz': Angle(i, 'GON')})
+    wr.Close()
+    print("spill file removed: %s" % (not os.path.exists('spill.tmp')))
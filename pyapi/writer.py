@@ -58,6 +58,12 @@ class Writer():
         """
         self.state = self.WR_OK
 
+    def Close(self):
+        """ Release the file or connection of the writer, nothing to do
+            in the base class
+        """
+        pass
+
     def StrVal(self, val):
         """ Get string representation of value
 
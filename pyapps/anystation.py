@@ -12,9 +12,11 @@ Get coordinates of station using known prisms nearby
     OBSERVATIONS MADE IN FACE LEFT ONLY
 """
 
-from math import pi, sin, cos, hypot
-import numpy as np
+from math import pi
 from angle import Angle
+from anglearray import AngleArray
+from geometry import Polar
+from pointmatch import PointMatch
 from filegen import ObsGen
 from freestation import Freestation
 
@@ -35,6 +37,8 @@ class AnyStation(object):
         self.gama = gama
         self.ih = ih
         self.dist_tol = dist_tol
+        # catalog distances are indexed once for repeated runs
+        self.matcher = PointMatch(coords, dist_tol)
 
     def get_obs(self):
         """ search prism and collect observations
@@ -68,67 +72,15 @@ class AnyStation(object):
     def get_coords(self, obs):
         """ calculate relative coordinates from station at the origin
 
-            :param obs: observations to points
+            :param obs: observations to points, all with distance
+            :returns: list of coordinates in the order of observations
         """
-        rel_coords = []
-        for o in obs:
-            if 'distance' in o:
-                coo = {}
-                coo['east'] = o['distance'] * sin(o['v'].GetAngle()) * sin(o['hz'].GetAngle())
-                coo['north'] = o['distance'] * sin(o['v'].GetAngle()) * cos(o['hz'].GetAngle())
-                coo['elev'] = o['distance'] * cos(o['v'].GetAngle()) + self.ih
-                rel_coords.append(coo)
-        return rel_coords
-
-    def dist_matrix(self, coords):
-        """ calculate distances among points in all combination
-
-            :param coords: input coordinates
-            :returns: numpy array with distances
-        """
-        n = len(coords)
-        dm = np.zeros((n, n))
-        for i, i_item in enumerate(coords):
-            for j, j_item in enumerate(coords):
-                if i < j:
-                    dm[i, j] = hypot(hypot(i_item['east'] - j_item['east'],
-                                           i_item['north'] - j_item['north']),
-                                     i_item['elev'] - j_item['elev'])
-                else:
-                    dm[i, j] = dm[j, i]
-        return dm
-
-    def find_dist(self, d, d_mat):
-        """ find distances in matrix close to given
-
-            :param d: given distance
-            :param d_mat: distance matrix
-            :returns: indices of close distances
-        """
-        n, m = d_mat.shape
-        res = []
-        for i in range(n):
-            for j in range(i+1, m):
-                if abs(d_mat[i, j] - d) <= self.dist_tol:
-                    res.append((i,j))
-        return res
-
-    def highest_freq(self, lst):
-        """ find highest frequency item in list
-
-            :param lst: list to find higest frequency item
-            :returns: tuple higest frequency item and number occurency
-        """
-        freq = {}
-        for item in lst:
-            freq[item] = freq.get(item, 0) + 1
-        w = sorted(zip(freq.keys(), freq.values()), reverse=True,
-                   key=lambda x: x[1])
-        # if more then one item have the same highest frequency
-        # return false value
-        if len(w) > 1 and w[0][1] == w[1][1]:
-            return None, 0
-        return w[0]
+        hz = AngleArray.FromAngles([o['hz'] for o in obs])
+        v = AngleArray.FromAngles([o['v'] for o in obs])
+        e, n, z = Polar(0.0, 0.0, 0.0, hz, v, [o['distance'] for o in obs],
+                        self.ih)
+        return [{'east': ee, 'north': nn, 'elev': zz}
+                for ee, nn, zz in zip(e.tolist(), n.tolist(), z.tolist())]
 
     def run(self):
         """ power search for prism clockwise and calculate
@@ -143,37 +95,23 @@ class AnyStation(object):
         #og = ObsGen(stn + w, '103', self.ih)
         #obs = og.run()[1:]
         # --------------------- END FOR TESTING ------------
+        obs = [o for o in obs if 'distance' in o]
         rel_coords = self.get_coords(obs)   # calculate relative coordinates to station
-        d_abs = self.dist_matrix(self.coords)
-        d_rel = self.dist_matrix(rel_coords)
-        # compare distances to find point ids to observations
-        n, m = d_rel.shape
-        ids = [[] for i in range(n)]    # empty lists to posible point ids
-        for i in range(n):
-            for j in range(i+1, m):
-                dist = d_rel[i, j]
-                indices = self.find_dist(dist, d_abs)
-                for ind in indices:
-                    ids[i].append(self.coords[ind[0]]['id'])
-                    ids[i].append(self.coords[ind[1]]['id'])
-                    ids[j].append(self.coords[ind[0]]['id'])
-                    ids[j].append(self.coords[ind[1]]['id'])
-        # get point id by highest frequency in ids lists
-        target_ids = []
-        for i in ids:
-            fr_id, fr_num = self.highest_freq(i)
-            if fr_num > 1:
-                target_ids.append(fr_id)
-            else:
-                target_ids.append(None)
-        for i, o in enumerate(obs):
-            if target_ids is not None:
-                o['id'] = target_ids[i]
+        # find catalog points by pairwise distances and station pose
+        match, pose = self.matcher.Match([c['east'] for c in rel_coords],
+                                         [c['north'] for c in rel_coords],
+                                         [c['elev'] for c in rel_coords])
+        if pose is None:
+            return None
+        for i, o in zip(match, obs):
+            if i >= 0:
+                o['id'] = self.matcher.ids[i]
         obs = [o for o in obs if 'id' in o]
         # add station to obs
         obs = [{'station': 'STATION', 'ih': self.ih}] + obs
         # add station to coords
-        coords = [{'id': 'STATION'}] + self.coords
+        coords = [{'id': 'STATION', 'east': pose['east'],
+                   'north': pose['north'], 'elev': pose['elev']}] + self.coords
         fs = Freestation(obs, coords, self.gama, 3)
         return fs.Adjustment()
 
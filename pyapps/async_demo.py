@@ -0,0 +1,143 @@
+#!/usr/bin/env python3
+# -*- coding: UTF-8 -*-
+"""
+.. module:: async_demo.py
+  :platform: Unix
+
+.. moduleauthor:: dr. Zoltan Siki <siki.zoltan@epito.bme.hu>
+
+Drive several instruments from a single asyncio event loop. Without
+parameters stand-in instruments are started: two GeoCOM total stations on
+pseudo terminals and a 10 Hz NMEA stream on a local TCP socket. Latency
+statistics are printed for each instrument at the end.
+
+Usage:
+
+* python async_demo.py [duration_sec]
+* python async_demo.py duration_sec /dev/ttyUSB0 /dev/ttyUSB1 host:port
+"""
+import sys
+import os
+import pty
+import time
+import socket
+import asyncio
+import logging
+import threading
+
+# check PYTHONPATH
+if len([p for p in sys.path if 'pyapi' in p]) == 0:
+    if os.path.isdir('../pyapi/'):
+        sys.path.append('../pyapi/')
+    else:
+        print("pyapi not found")
+        print("Add pyapi directory to the Python path or start your application from ulyxes/pyapps folder")
+        sys.exit(1)
+
+from asyncserialiface import AsyncSerialIface
+from asynctcpiface import AsyncTCPIface
+from asynctotalstation import AsyncTotalStation
+from asyncgnss import AsyncGnss
+from leicatps1200 import LeicaTPS1200
+from nmeagnssunit import NmeaGnssUnit
+
+def geocom_standin(fd, delay=0.02):
+    """ answer GetAngles requests on the master side of a pty
+
+        :param fd: master file descriptor
+        :param delay: instrument think time in seconds
+    """
+    buf = b''
+    while True:
+        try:
+            data = os.read(fd, 1024)
+        except OSError:
+            break
+        if not data:
+            break
+        buf += data
+        while b'\r\n' in buf:
+            _, buf = buf.split(b'\r\n', 1)
+            time.sleep(delay)
+            os.write(fd, b'%R1P,0,0:0,1.2345,1.5432,0,0,0.0001,-0.0002,0\r\n')
+
+def nmea_standin(srv, rate=10):
+    """ send GGA sentences to the first client at the given rate
+
+        :param srv: listening socket
+        :param rate: sentences per second
+    """
+    conn, _ = srv.accept()
+    gga = b'$GPGGA,092750.000,5321.6802,N,00630.3372,W,1,8,1.03,61.7,M,55.2,M,,*76\r\n'
+    try:
+        while True:
+            conn.sendall(gga)
+            time.sleep(1.0 / rate)
+    except OSError:
+        pass
+
+async def poll(name, func, stop, stats):
+    """ call an instrument coroutine repeatedly and collect latencies
+
+        :param name: name for statistics
+        :param func: coroutine function to call
+        :param stop: loop time of end
+        :param stats: dictionary to collect latencies
+    """
+    loop = asyncio.get_running_loop()
+    stats[name] = []
+    while loop.time() < stop:
+        t0 = loop.time()
+        res = await func()
+        if not res:
+            logging.error("%s: no answer", name)
+            break
+        stats[name].append(loop.time() - t0)
+
+async def main(duration, ports, address):
+    """ poll two total stations and a gnss receiver concurrently """
+    ifaces = [AsyncSerialIface("ts%d" % i, port, 115200, timeout=2)
+              for i, port in enumerate(ports)]
+    ifaces.append(AsyncTCPIface("gnss", address, timeout=2, eomRead='\r\n'))
+    for iface in ifaces:
+        await iface.Open()
+        if iface.GetState() != iface.IF_OK:
+            print("cannot open %s" % iface.GetName())
+            return
+    instruments = [AsyncTotalStation(iface.GetName(), LeicaTPS1200(), iface)
+                   for iface in ifaces[:-1]]
+    gnss = AsyncGnss("gnss", NmeaGnssUnit(), ifaces[-1])
+    stop = asyncio.get_running_loop().time() + duration
+    stats = {}
+    await asyncio.gather(*[poll(ts.GetName(), ts.GetAngles, stop, stats)
+                           for ts in instruments],
+                         poll("gnss", gnss.Measure, stop, stats))
+    for iface in ifaces:
+        await iface.Close()
+    for name, lat in stats.items():
+        if lat:
+            lat.sort()
+            print("%-6s %5d answers  mean %6.1f ms  max %6.1f ms" %
+                  (name, len(lat), sum(lat) / len(lat) * 1000, lat[-1] * 1000))
+
+if __name__ == "__main__":
+    logging.basicConfig(level=logging.ERROR)
+    dur = float(sys.argv[1]) if len(sys.argv) > 1 else 5
+    if len(sys.argv) > 4:
+        tty_ports = sys.argv[2:4]
+        host, port = sys.argv[4].split(':')
+        addr = (host, int(port))
+    else:
+        # stand-in instruments
+        tty_ports = []
+        for _ in range(2):
+            master, slave = pty.openpty()
+            tty_ports.append(os.ttyname(slave))
+            threading.Thread(target=geocom_standin, args=(master,),
+                             daemon=True).start()
+        s = socket.socket(socket.AF_INET, socket.SOCK_STREAM)
+        s.bind(('127.0.0.1', 0))
+        s.listen(1)
+        addr = s.getsockname()
+        threading.Thread(target=nmea_standin, args=(s,), daemon=True).start()
+    asyncio.run(main(dur, tty_ports, addr))
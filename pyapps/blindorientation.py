@@ -30,6 +30,7 @@ if len([p for p in sys.path if 'pyapi' in p]) == 0:
 
 from angle import Angle, PI2
 from totalstation import TotalStation
+from kdtree import KDTree
 
 class Orientation(object):
     """ find prism and orientation from coordinate list
@@ -46,6 +47,24 @@ class Orientation(object):
         self.step = 3.0 / 180.0 * math.pi   # 3 arc deg
         self.observations = observations
         self.ts = ts
+        # index of slope distances and height differences to known points
+        self.targets = [o for o in observations if 'distance' in o and 'v' in o]
+        self.index = KDTree([[o['distance'],
+                              o['distance'] * math.cos(o['v'].GetAngle())]
+                             for o in self.targets])
+
+    def Candidates(self, obs):
+        """ Find points from observation (distance and zenith) having
+            slope distance and heigth difference within tolerance
+
+            :param obs: observation data
+            :returns: list of observations to candidate points, nearest first
+        """
+        if 'distance' not in obs or 'v' not in obs:
+            return []
+        d_elev = obs['distance'] * math.cos(obs['v'].GetAngle())
+        return [self.targets[i] for i in
+                self.index.Query([obs['distance'], d_elev], self.dist_tol)]
 
     def FindPoint(self, obs):
         """ Find point from observation (distance and zenith)
@@ -54,24 +73,11 @@ class Orientation(object):
             :param obs: observation data
             :returns: bearing to actual instrument direction
         """
-        if 'distance' not in obs or 'v' not in obs:
-            return None
-        d_elev = obs['distance'] * math.cos(obs['v'].GetAngle())
-        min_o = None
-        mind = 1e10
-        # find nearest point
-        for o in self.observations:
-            if 'distance' in o and 'v' in o:
-                d_elev1 = o['distance'] * math.cos(o['v'].GetAngle())
-                dd = abs(o['distance'] - obs['distance'])
-                de = abs(d_elev1 - d_elev)
-                if dd < self.dist_tol and de < self.dist_tol:
-                    ddd = math.sqrt(dd * dd + de * de)
-                    if mind > ddd:
-                        mind = ddd
-                        min_o = o
-        if min_o:
-            return min_o['hz']
+        cand = self.Candidates(obs)
+        if len(cand) > 1:
+            logging.info("%d candidate points found", len(cand))
+        if cand:
+            return cand[0]['hz']
         return None
 
     def Search(self):
@@ -214,6 +220,6 @@ if __name__ == '__main__':
         mu = Trimble5500()
 
     iface = SerialIface("rs-232", port)
-    ts = TotalStation(stationtype, mu, iface)
+    ts = TotalStation(stationtype, mu, iface, shadow=True)
     o = Orientation(obs, ts)
     print(o.Search())
@@ -0,0 +1,87 @@
+#!/usr/bin/env python
+# -*- coding: UTF-8 -*-
+"""
+.. module:: brokerserver.py
+
+.. moduleauthor:: Zoltan Siki
+
+Share a total station among local processes. The serial line is opened by
+this process, other applications (e.g. robotplus.py with port
+broker:127.0.0.1:5001) send their requests through the broker, tracking
+requests are served first, then monitoring and housekeeping ones. The
+internal temperature and atmospheric settings of the instrument are polled
+periodically with housekeeping priority and logged.
+
+    :param argv[1] (sensor): 110n/180n/120n, default 1200
+    :param argv[2] (port): serial port, default /dev/ttyUSB0
+    :param argv[3] (address): TCP port for the local processes, default 5001
+    :param argv[4] (poll): seconds between housekeeping polls, 0 for no polling, default 300
+    :param argv[5] (key file): file to write the authentication key to for the clients (readable by the owner only), default broker.key
+
+The authentication key is taken from the ULYXES_BROKER_KEY environment
+variable (hex string) if it is set, otherwise a random key is generated.
+Clients can execute code in this process, keep the key secret.
+"""
+import re
+import sys
+import time
+import logging
+import os.path
+
+# check PYTHONPATH
+if len([p for p in sys.path if 'pyapi' in p]) == 0:
+    if os.path.isdir('../pyapi/'):
+        sys.path.append('../pyapi/')
+    else:
+        print("pyapi not found")
+        print("Add pyapi directory to the Python path or start your application from ulyxes/pyapps folder")
+        sys.exit(1)
+
+from serialiface import SerialIface
+from totalstation import TotalStation
+from broker import Broker
+from brokeriface import BrokerIface
+from leicatcra1100 import LeicaTCRA1100
+from leicatca1800 import LeicaTCA1800
+from leicatps1200 import LeicaTPS1200
+
+if __name__ == "__main__":
+    logging.getLogger().setLevel(logging.INFO)
+    stationtype = sys.argv[1] if len(sys.argv) > 1 else '1200'
+    port = sys.argv[2] if len(sys.argv) > 2 else '/dev/ttyUSB0'
+    address = int(sys.argv[3]) if len(sys.argv) > 3 else 5001
+    poll = float(sys.argv[4]) if len(sys.argv) > 4 else 300
+    keyFile = sys.argv[5] if len(sys.argv) > 5 else 'broker.key'
+    if re.search('120[0-9]$', stationtype):
+        mu = LeicaTPS1200()
+    elif re.search('110[0-9]$', stationtype):
+        mu = LeicaTCRA1100()
+    elif re.search('180[0-9]$', stationtype):
+        mu = LeicaTCA1800()
+    else:
+        print("unsupported instrument type")
+        sys.exit(1)
+    iface = SerialIface("rs-232", port)
+    if iface.GetState() != iface.IF_OK:
+        print("serial port not opened")
+        sys.exit(1)
+    broker = Broker(iface, aging=10)
+    broker.Serve(('127.0.0.1', address), Broker.AuthKey())
+    Broker.SaveKey(broker.authkey, keyFile)
+    print("broker listening on 127.0.0.1:%d, key in %s" % (address, keyFile))
+    ts = TotalStation(stationtype, mu,
+                      BrokerIface('housekeeping', broker, Broker.HOUSEKEEPING))
+    try:
+        while True:
+            if poll > 0:
+                temp = ts.GetInternalTemperature()
+                atm = ts.GetAtmCorr()
+                ts.measureIface.ClearState()
+                logging.info("internal temperature: %s, atmospheric settings: %s",
+                             temp.get('intTemp'), atm)
+                logging.info("queueing latency: %s", broker.Stats())
+                time.sleep(poll)
+            else:
+                time.sleep(60)
+    except KeyboardInterrupt:
+        broker.Stop()
@@ -26,13 +26,18 @@ Parameters are stored in config file using JSON format::
     st_only: 1/0 calculate monitoring point only in the same round with freestation
     avg_wr: calculate averages from more faces if value 1, no average calculation if value is zero, optional (default: 1) OBSOLATE average always calculated
     decimals: number of decimals in output, optional (default: 4)
-    gama_path: path to GNU Gama executable, optional (default: empty, no adjustment)
+    gama_path: path to GNU Gama executable or native for the in process adjustment, optional (default: empty, no adjustment)
     stdev_angle: standard deviation of angle measurement (arc seconds), optional (default: 1)
     stdev_dist: additive tag for standard deviation of distance measurement (mm), optional (default: 1)
     stdev_dist1: multiplicative tag for standard deviation of distance measurement (mm), optional (default: 1.5)
     dimension: dimension of stored points (1D/2D/3D), optional (default: 3)
     probability: probability for data snooping, optional (default: 0.95)
     blunders: data snooping on/off 1/0, optional (default: 1)
+    obs_rd_start: process observations from this time (YYYY-MM-DD HH:MM:SS), optional (default: first)
+    obs_rd_end: process observations until this time, optional (default: last)
+    workers: number of processes to adjust epochs, optional (default: 1)
+    checkpoint: file to store processed epochs, only new or changed epochs are processed again, optional (default: no checkpoint)
+    chunk: number of observations read at once, optional (default: 10000)
 """
 
 import sys
@@ -40,7 +45,7 @@ import re
 import logging
 import math
 import os
-import datetime
+from concurrent.futures import ProcessPoolExecutor
 
 # check PYTHONPATH
 if len([p for p in sys.path if 'pyapi' in p]) == 0:
@@ -60,6 +65,21 @@ from sqlitereader import SqLiteReader
 from sqlitewriter import SqLiteWriter
 from confreader import ConfReader
 from freestation import Freestation
+from epochs import Stream, ParseTimes, Split, ToDatetime, Key, Checkpoint
+
+def adjust_epoch(task):
+    """ Free station adjustment of an epoch, it runs in worker processes
+
+        :param task: observations to fix points, coordinates of station and fix points and config parameters
+        :returns: adjusted station coordinates or None
+    """
+    fix_obs, coords, par = task
+    fs = Freestation([{'station': par['station_id']}] + fix_obs, coords,
+                     par['gama_path'], par['dimension'], par['probability'],
+                     par['stdev_angle'], par['stdev_dist'], par['stdev_dist1'],
+                     par['blunders'])
+    w = fs.Adjustment()
+    return w[0] if w else None
 
 if __name__ == "__main__":
     config_pars = {
@@ -82,13 +102,19 @@ if __name__ == "__main__":
         'st_only':{'required': False, 'type': 'int', 'default': 0},
         'obs_wr': {'required': False},
         'decimals': {'required': False, 'type': 'int', 'default': 4},
-        'gama_path': {'required': False, 'type': 'file'},
+        'gama_path': {'required': False, 'type': 'file',
+                      'keywords': ['native']},
         'stdev_angle': {'required': False, 'type': 'float', 'default': 1},
         'stdev_dist': {'required': False, 'type': 'float', 'default': 1},
         'stdev_dist1': {'required': False, 'type': 'float', 'default': 1.5},
         'dimension': {'required': False, 'type': 'int', 'default': 3},
         'probability': {'required': False, 'type': 'float', 'default': 0.95},
         'blunders': {'required': False, 'type': 'int', 'default': 1},
+        'obs_rd_start': {'required': False, 'type': 'str'},
+        'obs_rd_end': {'required': False, 'type': 'str'},
+        'workers': {'required': False, 'type': 'int', 'default': 1},
+        'checkpoint': {'required': False, 'type': 'str'},
+        'chunk': {'required': False, 'type': 'int', 'default': 10000},
         '__comment__': {'required': False, 'type': 'str'}
     }
     # check command line param
@@ -100,7 +126,7 @@ if __name__ == "__main__":
             except:
                 logging.fatal("Error in config file: " + sys.argv[1])
                 sys.exit(-1)
-            state, msg_lst = not cr.Check()
+            state, msg_lst = cr.Check()
             if state == "FATAL":
                 logging.fatal("Config check failed")
                 for msg in msg_lst:
@@ -181,6 +207,7 @@ if __name__ == "__main__":
     else:
         mon_coords = []
     # observation writer
+    wrt1 = None
     if 'obs_wr' in cr.json:
         if re.search('^http[s]?://', cr.json['obs_wr']):
             wrt1 = HttpWriter(url=cr.json['obs_wr'], mode='POST', dist=fmt)
@@ -191,90 +218,140 @@ if __name__ == "__main__":
                                 'crossincline', 'lengthincline', 'datetime'])
         else:
             wrt1 = GeoWriter(fname=cr.json['obs_wr'], mode='a', dist=fmt)
-    # load observations recorded by robotplus
+    # stream observations recorded by robotplus
+    start = cr.json.get('obs_rd_start')
+    end = cr.json.get('obs_rd_end')
     if re.search('^sqlite:', cr.json['obs_rd']):
-        rd_obs = SqLiteReader(db=cr.json['obs_rd'][7:], \
-            sql=cr.json['obs_rd_sql'])
+        sql = cr.json.get('obs_rd_sql')
+        if sql is None:
+            where = []
+            if start is not None:
+                where.append("datetime >= '%s'" % start)
+            if end is not None:
+                where.append("datetime <= '%s'" % end)
+            sql = "SELECT * FROM monitoring_obs" + \
+                (" WHERE " + " AND ".join(where) if where else "") + \
+                " ORDER BY datetime"
+        rd_obs = SqLiteReader(db=cr.json['obs_rd'][7:], sql=sql)
     else:
-        obs_rd = GeoReader(fname=cr.json['obs_rd'])
-    obs = rd_obs.Load()
-    n = len(obs)
-    # change data types
-    for o in obs:
-        o['hz'] = Angle(o['hz'], 'GON')
-        o['v'] = Angle(o['v'], 'GON')
-        o['datetime'] = datetime.datetime.strptime(o['datetime'], '%Y-%m-%d %H:%M:%S')
-    i = 0
-    delta = datetime.timedelta(seconds=20)
-    while i < n:
-        # collect observations with  timestamp
-        d = obs[i]['datetime']
-        j = i
-        while j < n and obs[j]['datetime'] - d <= delta:
-            # correct time
-            obs[j]['datetime'] = d
-            j += 1
-        #obs_avg = avg_obs(obs[i:j])
-        obs_avg = obs[i:j]
-        fix_obs = []
-        if 'fix_list' in cr.json and cr.json['fix_list'] is not None:
-            fix_obs = [o for o in obs_avg if o['id'] in cr.json['fix_list']]
-        mon_obs = []
-        if 'mon_list' in cr.json and cr.json['mon_list'] is not None:
-            mon_obs = [o for o in obs_avg if o['id'] in cr.json['mon_list']]
-        print("obs fix:%d all:%d" % (len(fix_obs), len(obs_avg)))
-        # process observations i..j-1
-        n_fix = len(fix_obs)
-        n_all = len(obs_avg)
-        n_mon = len(mon_obs)
-        station = False
-        if n_fix > 1 and (cr.json['strict'] == 0 or \
-            (cr.json['strict'] == 1 and n_fix == n_all)):
-            # calculate station coordinates as freestation if gama_path set
-            if 'gama_path' in cr.json and cr.json['gama_path'] is not None:
-                #print("Freestation...")
-                obs1 = [{'station': cr.json['station_id']}] + fix_obs
-                fs = Freestation(obs1, st_coord + fix_coords,
-                                 cr.json['gama_path'], cr.json['dimension'],
-                                 cr.json['probability'], cr.json['stdev_angle'],
-                                 cr.json['stdev_dist'], cr.json['stdev_dist1'],
-                                 cr.json['blunders'])
-                w = fs.Adjustment()
-                if w is None:
-                    logging.fatal("No adjusted coordinates for station %s" % cr.json['station_id'])
+        rd_obs = GeoReader(fname=cr.json['obs_rd'])
+    fix_list = cr.json.get('fix_list') or []
+    mon_list = cr.json.get('mon_list') or []
+    gama = cr.json.get('gama_path') is not None
+    # epochs processed before with the same parameters are skipped
+    par = {k: v for k, v in cr.json.items()
+           if not k.startswith('log_') and k not in ('workers', 'chunk')}
+    cp = Checkpoint(cr.json.get('checkpoint'),
+                    Key(sorted(par.items()), st_coord, fix_coords))
+    st_coord0 = [dict(st_coord[0])]    # approximate station for all epochs
+    pool = ProcessPoolExecutor(cr.json['workers']) \
+        if cr.json['workers'] > 1 else None
+
+    def process(rows, t, epochs):
+        """ process epochs of observations, free stations are adjusted in
+            parallel, output is written in time order
+        """
+        global st_coord
+        todo = []
+        for i, j in epochs:
+            ep = str(t[i]).replace('T', ' ')
+            d = ToDatetime(t[i])
+            obs_avg = rows[i:j]
+            for o in obs_avg:
+                # change data types, correct time
+                for k in ('hz', 'v'):
+                    if not isinstance(o[k], Angle):
+                        o[k] = Angle(o[k], 'GON')
+                o['datetime'] = d
+            key = Key(ep, [(o['id'], o['hz'].GetAngle(), o['v'].GetAngle(),
+                            o.get('distance')) for o in obs_avg])
+            fix_obs = [o for o in obs_avg if o['id'] in fix_list]
+            mon_obs = [o for o in obs_avg if o['id'] in mon_list]
+            logging.info("%s obs fix:%d all:%d", ep, len(fix_obs),
+                         len(obs_avg))
+            station = gama and len(fix_obs) > 1 and \
+                (cr.json['strict'] == 0 or len(fix_obs) == len(obs_avg))
+            done, res = cp.Get(ep, key)
+            todo.append((ep, key, obs_avg, fix_obs, mon_obs, station, done,
+                         res))
+        # free station adjustments not in checkpoint
+        tasks = [(e[3], st_coord0 + fix_coords, cr.json) for e in todo
+                 if e[5] and not e[6]]
+        results = iter(pool.map(adjust_epoch, tasks, chunksize=4)
+                       if pool is not None else map(adjust_epoch, tasks))
+        for ep, key, obs_avg, fix_obs, mon_obs, station, done, res in todo:
+            if station:
+                st = res['station'] if done else next(results)
+                if st is None or 'east' not in st:
+                    logging.fatal("No adjusted coordinates for station %s",
+                                  cr.json['station_id'])
                     sys.exit(-1)
                 # update station coordinates
-                st_coord = w
-                # upload station coords to server
-                #print("Uploading station coords...")
-                # datetime from observations
+                st_coord = [dict(st)]
+            xyz = [st_coord[0].get(k) for k in ('east', 'north', 'elev')]
+            if done and res['st'] == xyz:
+                continue    # same inputs and station, output written before
+            # rows of a reprocessed epoch are replaced
+            ok = True
+            d = obs_avg[0]['datetime']
+            if isinstance(wrt, SqLiteWriter) and \
+               wrt.DeleteData([cr.json['station_id']] +
+                              [o['id'] for o in mon_obs], d) < 0:
+                ok = False
+            if isinstance(wrt1, SqLiteWriter) and \
+               wrt1.DeleteData([o['id'] for o in fix_obs + mon_obs], d) < 0:
+                ok = False
+            if station:
                 st_coord[0]['datetime'] = fix_obs[0]['datetime']
                 # add number of known points
                 st_coord[0]['n'] = len(fix_obs)
                 # save observations with corrected time
-                if wrt.WriteData(st_coord[0]) != 0:
+                if wrt.WriteData(st_coord[0]) < 0:
                     logging.fatal("Cannot write station coordinates")
+                    ok = False
                 for o in fix_obs:
-                    if wrt1.WriteData(o) != 0:
+                    if wrt1 is not None and wrt1.WriteData(o) < 0:
                         logging.fatal("Cannot write observations")
-                station = True
-        #print("Saving calculated coords...")
-        # TODO orientation????
-        if n_mon > 0 and \
-            (cr.json['st_only'] == 0 or station) and \
-            (cr.json['mon_only'] == 0 or \
-            cr.json['mon_only'] == 1 and n_all == n_mon):
-            for o in mon_obs:       # process monitoring points
-                v = o['v'].GetAngle()
-                hd = o['distance'] * math.sin(v)
-                a = (o['hz']).GetAngle()
-                east = st_coord[0]['east'] + math.sin(a) * hd
-                north = st_coord[0]['north'] + math.cos(a) * hd
-                elev = st_coord[0]['elev'] + hd / math.tan(v)
-                c = {'id': o['id'], 'east': east, 'north': north, \
-                     'elev': elev, 'datetime': o['datetime']}
-                if wrt.WriteData(c) != 0:
-                    logging.fatal("Cannot write mon coordinates")
-                if wrt1.WriteData(o) != 0:
-                    logging.fatal("Cannot write mon observations")
-        i = j
+                        ok = False
+                del st_coord[0]['datetime']
+            # TODO orientation????
+            n_all = len(obs_avg)
+            n_mon = len(mon_obs)
+            if n_mon > 0 and \
+                (cr.json['st_only'] == 0 or station) and \
+                (cr.json['mon_only'] == 0 or \
+                cr.json['mon_only'] == 1 and n_all == n_mon):
+                for o in mon_obs:       # process monitoring points
+                    v = o['v'].GetAngle()
+                    hd = o['distance'] * math.sin(v)
+                    a = (o['hz']).GetAngle()
+                    east = st_coord[0]['east'] + math.sin(a) * hd
+                    north = st_coord[0]['north'] + math.cos(a) * hd
+                    elev = st_coord[0]['elev'] + hd / math.tan(v)
+                    c = {'id': o['id'], 'east': east, 'north': north, \
+                         'elev': elev, 'datetime': o['datetime']}
+                    if wrt.WriteData(c) < 0:
+                        logging.fatal("Cannot write mon coordinates")
+                        ok = False
+                    if wrt1 is not None and wrt1.WriteData(o) < 0:
+                        logging.fatal("Cannot write mon observations")
+                        ok = False
+            if ok:
+                # epoch is processed again in the next run on write error
+                cp.Set(ep, key, {'station': st if station else None,
+                                 'st': xyz})
+        cp.Save()
+
+    # the last epoch of a chunk may continue in the next chunk
+    rows = []
+    for chunk in Stream(rd_obs, start, end, cr.json['chunk']):
+        rows += chunk
+        t = ParseTimes([o['datetime'] for o in rows])
+        epochs = Split(t, 20)
+        process(rows, t, epochs[:-1])
+        rows = rows[epochs[-1][0]:]
+    if rows:
+        process(rows, ParseTimes([o['datetime'] for o in rows]),
+                [(0, len(rows))])
+    if pool is not None:
+        pool.shutdown()
@@ -15,11 +15,11 @@ the station if no station id given.
 """
 
 import sys
-import math
 
 sys.path.append('../pyapi/')
 
 from angle import Angle
+from geometry import Coords, Inverse
 from georeader import GeoReader
 from geowriter import GeoWriter
 from csvreader import CsvReader
@@ -62,22 +62,19 @@ class ObsGen(object):
             :returns: list of observation dicts ordered by hz
         """
         observations = []
-        for coo in self.coords:
-            if self.station_id == coo['id']:
-                #skip station
-                continue
+        # all targets at once
+        coords = [coo for coo in self.coords if coo['id'] != self.station_id]
+        _, e, n, z = Coords(coords)
+        hz, v, dist = Inverse(self.station_east, self.station_north,
+                              self.station_elev, e, n, z, self.station_ih)
+        for coo, bearing, zenith, d in zip(coords, hz.tolist(), v.tolist(),
+                                           dist.tolist()):
             obs = {}
-            d_north = coo['north'] - self.station_north
-            d_east = coo['east'] - self.station_east
-            d_elev = coo['elev'] - self.station_elev - self.station_ih
-            bearing = math.atan2(d_east, d_north)
-            dist = math.hypot(d_east, d_north)
-            zenith = math.atan2(dist, d_elev)
             obs['id'] = coo['id']
             obs['ih'] = self.station_ih
-            obs['hz'] = Angle(bearing).Positive()
-            obs['v'] = Angle(zenith).Positive()
-            obs['distance'] = math.hypot(dist, d_elev)
+            obs['hz'] = Angle(bearing)
+            obs['v'] = Angle(zenith)
+            obs['distance'] = d
             if 'code' in coo:
                 obs['code'] = coo['code']
             else:
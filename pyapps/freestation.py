@@ -11,7 +11,7 @@
     free starion, blunders are eliminated
 
     :param argv[1]: input geo/coo or dmp/csv file
-    :param argv[2]: gama-local path
+    :param argv[2]: gama-local path or native
 """
 
 import sys
@@ -30,13 +30,14 @@ if len([p for p in sys.path if 'pyapi' in p]) == 0:
 from georeader import GeoReader
 from csvreader import CsvReader
 from gamaiface import GamaIface
+from lsqadjust import LsqAdjust
 
 class Freestation(object):
     """ Calculate freestation and remove blunders
 
         :param obs: list of observations
         :param coords: coordinates of points
-        :param gama_path: path to gama-local
+        :param gama_path: path to gama-local or 'native' for the in process adjustment
         :param dimiension: dimension of adjustment 1/2/3, optional default 3
         :param probability: probability level, optional, default 0.95
         :param stdev_angle: angle measurement standard deviation (seconds), optional, default 1"
@@ -49,9 +50,13 @@ class Freestation(object):
                  stdev_angle=1, stdev_dist=1, stdev_dist1=1.5, blunders=False):
         """ initialize
         """
-        # create gama interface
-        self.g = GamaIface(gama_path, dimension, probability, stdev_angle,
-                           stdev_dist, stdev_dist1)
+        # create gama interface or in process adjustment
+        if gama_path == 'native':
+            self.g = LsqAdjust(dimension, probability, stdev_angle,
+                               stdev_dist, stdev_dist1)
+        else:
+            self.g = GamaIface(gama_path, dimension, probability, stdev_angle,
+                               stdev_dist, stdev_dist1)
         self.blunders = blunders
         ns = 0    # number of stations
         no = 0    # number of observations
@@ -77,6 +82,16 @@ class Freestation(object):
 
             :returns: adjusted coordinates or None
         """
+        if self.blunders and isinstance(self.g, LsqAdjust):
+            # in process data snooping without rebuilding the network
+            res, blunder, removed = self.g.snooping()
+            for fr, to in removed:
+                logging.info("%s - %s observation removed", fr, to)
+            if res is None:
+                logging.error("adjustment failed")
+            else:
+                logging.info("%d blunders removed", len(removed))
+            return [res]
         # adjustment loop
         last_res = None
         n = 0   # number of blunders removed
@@ -118,7 +133,7 @@ if __name__ == "__main__":
             print("File not found: " + fname)
             sys.exit(-1)
     else:
-        print("Usage: freestation.py input_file gama_path")
+        print("Usage: freestation.py input_file [gama_path|native]")
         sys.exit(-1)
     if fname[-4:] not in ['.geo', '.coo', '.dmp', '.csv']:
         fname += '.geo'
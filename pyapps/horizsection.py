@@ -388,7 +388,7 @@ def cmd_params():
         parser.add_argument('--radius_top', type=float, default=None,
                             help='Radius of section at top section, default: None')
         parser.add_argument('--gama', type=str, default=def_gama,
-                            help=f'Path to gama-local, default: {def_gama}')
+                            help=f'Path to gama-local or native, default: {def_gama}')
         args = parser.parse_args()
 
         if args.log == "stdout":
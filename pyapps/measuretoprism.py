@@ -20,6 +20,7 @@ Sample application of Ulyxes PyAPI to measure to a moving prism/object.
     :param argv[3] (edm): edm mode STANDARD/FAST, default FAST
     :param argv[4] (port): serial port, use a filename for local iface, default COM7
     :param argv[5] (file): output file, data are appended to the end of the file
+    :param argv[6] (baud): highest baud rate to negotiate with the instrument, default no negotiation
 """
 import re
 import sys
@@ -58,7 +59,7 @@ if __name__ == "__main__":
     logging.getLogger().setLevel(logging.ERROR)
     # Process command line parameters
     if len(sys.argv) == 1:
-        print('Usage: {} instrument [mode [EDM_mode [serial [output_csv]]]]'.format(sys.argv[0]))
+        print('Usage: {} instrument [mode [EDM_mode [serial [output_csv [baud]]]]]'.format(sys.argv[0]))
         exit()
     # Instrument type
     if len(sys.argv) > 1:
@@ -70,7 +71,7 @@ if __name__ == "__main__":
             mu = LeicaTPS1200()
         elif re.search('550[0-9]$', sys.argv[1]):
             mu = Trimble5500()
-        elif sys.argv[1]lower() == "axis10":
+        elif sys.argv[1].lower() == "axis10":
             mu = Axis10()
         else:
             mu = LeicaTPS1200()
@@ -109,6 +110,12 @@ if __name__ == "__main__":
                          filt=['id', 'datetime', 'hz', 'v', 'distance', 'east', 'north', 'elev'])
     signal.signal(signal.SIGINT, exit_on_ctrl_c)    # catch Ctrl/C
     ts = TotalStation("Leica", mu, iface)
+    if len(sys.argv) > 6 and isinstance(iface, SerialIface):
+        # faster line, shorter wire time for each observation
+        maxBaud = int(sys.argv[6])
+        rates = [r for r in (115200, 57600, 38400, 19200, 9600) if r <= maxBaud]
+        if ts.NegotiateBaudRate(rates) is None:
+            sys.exit(1)
     slopeDist = 0
     if edm not in mu.edmModes:
         edm = 'FAST'
@@ -0,0 +1,121 @@
+#!/usr/bin/env python3
+# -*- coding: UTF-8 -*-
+"""
+.. module:: pipeline_demo.py
+  :platform: Unix
+
+.. moduleauthor:: dr. Zoltan Siki <siki.zoltan@epito.bme.hu>
+
+Compare sequential and pipelined GeoCOM queries in a monitoring cycle. A
+stand-in instrument on a pseudo terminal simulates the wire time of a 9600
+baud line and a fixed processing time for each request. The instrument idle
+time (waiting for the next request) is reported for each cycle.
+
+Usage:
+
+* python pipeline_demo.py [cycles]
+"""
+import sys
+import os
+import pty
+import time
+import queue
+import logging
+import threading
+
+# check PYTHONPATH
+if len([p for p in sys.path if 'pyapi' in p]) == 0:
+    if os.path.isdir('../pyapi/'):
+        sys.path.append('../pyapi/')
+    else:
+        print("pyapi not found")
+        print("Add pyapi directory to the Python path or start your application from ulyxes/pyapps folder")
+        sys.exit(1)
+
+from serialiface import SerialIface
+from leicatps1200 import LeicaTPS1200
+from totalstation import TotalStation
+
+BYTE_TIME = 10.0 / 9600     # start + 8 data + stop bits
+PROC_TIME = 0.005           # instrument processing time for a request
+ANSWERS = {'2003': '0,1.2345,1.5432,0,0,0.0001,-0.0002,0',
+           '18006': '0,1', '2023': '0,-0.0344', '5011': '0,24.5',
+           '2029': '0,0.000658,1013.25,12.0,12.0'}
+
+class StandIn():
+    """ GeoCOM instrument simulator on the master side of a pty
+
+        :param fd: master file descriptor
+    """
+    def __init__(self, fd):
+        """ Constructor
+        """
+        self.fd = fd
+        self.requests = queue.Queue()
+        self.idle = 0.0     # time spent waiting for requests
+        threading.Thread(target=self.receiver, daemon=True).start()
+        threading.Thread(target=self.worker, daemon=True).start()
+
+    def receiver(self):
+        """ collect requests, a request is available after its wire time
+        """
+        buf = b''
+        while True:
+            try:
+                buf += os.read(self.fd, 1024)
+            except OSError:
+                break
+            while b'\r\n' in buf:
+                line, buf = buf.split(b'\r\n', 1)
+                time.sleep((len(line) + 2) * BYTE_TIME)
+                self.requests.put(line.decode('ascii'))
+
+    def worker(self):
+        """ answer requests one by one like the instrument does
+        """
+        while True:
+            t0 = time.perf_counter()
+            req = self.requests.get()
+            self.idle += time.perf_counter() - t0
+            head = req.split(':')[0].split(',')
+            trId = head[2] if len(head) > 2 else '0'
+            time.sleep(PROC_TIME)
+            ans = f"%R1P,0,{trId}:{ANSWERS.get(head[1], '0')}\r\n"
+            time.sleep(len(ans) * BYTE_TIME)
+            os.write(self.fd, ans.encode('ascii'))
+
+def cycle(ts, pipelined):
+    """ one monitoring cycle of independent queries
+
+        :param ts: total station
+        :param pipelined: send the queries back-to-back
+        :returns: merged results
+    """
+    queries = ('GetAngles', 'GetATR', 'GetPc', 'GetInternalTemperature',
+               'GetAtmCorr')
+    if pipelined:
+        return ts.Pipeline(*queries)
+    res = {}
+    for q in queries:
+        res.update(getattr(ts, q)())
+    return res
+
+if __name__ == "__main__":
+    logging.basicConfig(level=logging.ERROR)
+    n = int(sys.argv[1]) if len(sys.argv) > 1 else 20
+    for window in (1, 3, 5):
+        master, slave = pty.openpty()
+        standin = StandIn(master)
+        iface = SerialIface('pty', os.ttyname(slave), timeout=2, window=window)
+        ts = TotalStation('sim', LeicaTPS1200(), iface)
+        t = time.perf_counter()
+        for _ in range(n):
+            r = cycle(ts, window > 1)
+            if 'errorCode' in r or len(r) != 11:
+                print("unexpected answer", r)
+                break
+        t = time.perf_counter() - t
+        print("window %d: %6.1f ms/cycle, instrument idle %5.1f ms/cycle" %
+              (window, t / n * 1000, standin.idle / n * 1000))
+        iface.Close()
+        os.close(master)
@@ -74,6 +74,7 @@ if sys.version_info[0] > 2: # Python 3 compatibility
     raw_input = input
 
 from angle import Angle, PI2
+from geometry import Polar
 from serialiface import SerialIface
 from csvwriter import CsvWriter
 from georeader import GeoReader
@@ -81,6 +82,7 @@ from geowriter import GeoWriter
 from csvreader import CsvReader
 from httpwriter import HttpWriter
 from totalstation import TotalStation
+from brokeriface import BrokerIface
 
 class Robot(object):
     """ manage robotic observations
@@ -140,14 +142,28 @@ class Robot(object):
             :param obs: observed angles and distance
             :returns: (east, north, elev)
         """
-        east = self.station_east + obs['distance'] * \
-            math.sin(obs['v'].GetAngle()) * math.sin(obs['hz'].GetAngle())
-        north = self.station_north + obs['distance'] * \
-            math.sin(obs['v'].GetAngle()) * math.cos(obs['hz'].GetAngle())
-        elev = self.station_elev + self.ih + obs['distance'] * \
-            math.cos(obs['v'].GetAngle())
+        east, north, elev = Polar(self.station_east, self.station_north,
+                                  self.station_elev, obs['hz'].GetAngle(),
+                                  obs['v'].GetAngle(), obs['distance'],
+                                  self.ih)
         return (east, north, elev)
 
+    def prompt(self, msg, session):
+        """ wait for the operator, the instrument shared by a broker is
+            unlocked while waiting
+
+            :param msg: message to the operator
+            :param session: instrument is locked through a broker
+            :returns: answer of the operator or None if the instrument cannot be locked again
+        """
+        if session:
+            self.ts.measureIface.Unlock()
+        ww = raw_input(msg)
+        if session and not self.ts.measureIface.Lock():
+            logging.error("Cannot lock instrument")
+            return None
+        return ww
+
     def run(self):
         """ run an observation serie
 
@@ -159,6 +175,8 @@ class Robot(object):
         n = 0  # number of faces measured fo far
         obs_out = []
         coo_out = []
+        # instrument shared by a broker is locked while a point is measured
+        session = isinstance(self.ts.measureIface, BrokerIface)
         # write station record to output
         obs = {'station': self.directions[0]['station'], 'ih': self.ih}
         obs_out.append(obs)
@@ -187,99 +205,118 @@ class Robot(object):
                             hz = hz - math.pi if hz > math.pi else hz + math.pi
                             v = PI2 - v
                         j = 0   # try count
-                        while j < self.maxtry:
-                            ww = ''
-                            res = {}
-                            code = self.directions[i]['code']
-                            if code[0:3] == 'ATR':
-                                if j == 0: # first try set target
-                                    self.ts.SetATR(1)
-                                    self.ts.SetEDMMode('STANDARD')
-                                    if code[3:4] == '-':
-                                        if k == 0:  #wait only in first face left
-                                            wait = True
-                                        code = code[0:3] + code[4:]
-                                    if len(code) > 3:
-                                        self.ts.SetPrismType(int(code[3:]))
-                                    elif 'pc' in self.directions[i]:
-                                        self.ts.SetPc(self.directions[i]['pc'])
-                                res = self.ts.Move(Angle(hz), Angle(v), 1)
-                                if 'errorCode' not in res:
-                                    if wait:
-                                        ww = raw_input(target_msg1.format(pn, self.directions[i]['code'], (n + k) % 2 + 1))
-                                        if ww in ['b', 's']:
+                        if session and not self.ts.measureIface.Lock():
+                            logging.error("Cannot lock instrument for point %s", pn)
+                            j = self.maxtry
+                        try:
+                            while j < self.maxtry:
+                                ww = ''
+                                res = {}
+                                code = self.directions[i]['code']
+                                if code[0:3] == 'ATR':
+                                    if j == 0: # first try set target
+                                        self.ts.SetATR(1)
+                                        self.ts.SetEDMMode('STANDARD')
+                                        if code[3:4] == '-':
+                                            if k == 0:  #wait only in first face left
+                                                wait = True
+                                            code = code[0:3] + code[4:]
+                                        if len(code) > 3:
+                                            self.ts.SetPrismType(int(code[3:]))
+                                        elif 'pc' in self.directions[i]:
+                                            self.ts.SetPc(self.directions[i]['pc'])
+                                    res = self.ts.Move(Angle(hz), Angle(v), 1)
+                                    if 'errorCode' not in res:
+                                        if wait:
+                                            ww = self.prompt(target_msg1.format(pn, self.directions[i]['code'], (n + k) % 2 + 1), session)
+                                            if ww is None:
+                                                j = self.maxtry   # lock not granted again
+                                                break
+                                            if ww in ['b', 's']:
+                                                break
+                                        res = self.ts.Measure()
+                                elif self.directions[i]['code'][0:2] == 'PR':
+                                    if j == 0:
+                                        # prism type: 0/1/2/3/4/5/6/7
+                                        # round/mini/tape/360/user1/user2/user3/360 mini
+                                        self.ts.SetATR(0)
+                                        self.ts.SetEDMMode('STANDARD')
+                                        if len(self.directions[i]['code']) > 2:
+                                            self.ts.SetPrismType(int(self.directions[i]['code'][2:]))
+                                    res = self.ts.Move(Angle(hz), Angle(v), 0)
+                                    if 'errorCode' not in res:
+                                        # wait for user to target on point
+                                        ww = self.prompt(target_msg.format(pn, self.directions[i]['code'], (n + k) % 2 + 1), session)
+                                        if ww is None:
+                                            j = self.maxtry   # lock not granted again
                                             break
-                                    res = self.ts.Measure()
-                            elif self.directions[i]['code'][0:2] == 'PR':
-                                if j == 0:
-                                    # prism type: 0/1/2/3/4/5/6/7
-                                    # round/mini/tape/360/user1/user2/user3/360 mini
-                                    self.ts.SetATR(0)
-                                    self.ts.SetEDMMode('STANDARD')
-                                    if len(self.directions[i]['code']) > 2:
-                                        self.ts.SetPrismType(int(self.directions[i]['code'][2:]))
-                                res = self.ts.Move(Angle(hz), Angle(v), 0)
-                                if 'errorCode' not in res:
-                                    # wait for user to target on point
-                                    ww = raw_input(target_msg.format(pn, self.directions[i]['code'], (n + k) % 2 + 1))
-                                    if ww == 's':
-                                        break
-                                    res = self.ts.Measure()
-                            elif self.directions[i]['code'] == 'RL':
-                                self.ts.SetATR(0)
-                                self.ts.SetEDMMode('RLSTANDARD')
-                                self.ts.Move(Angle(hz), Angle(v), 0)
-                                if 'errorCode' not in res:
-                                    # wait for user to target on point
-                                    ww = raw_input(target_msg.format(pn, self.directions[i]['code'], (n + k) % 2 + 1))
-                                    if ww == 's':
-                                        break
-                                    res = self.ts.Measure()
-                            elif self.directions[i]['code'] == 'RLA':
-                                if j == 0:
+                                        if ww == 's':
+                                            break
+                                        res = self.ts.Measure()
+                                elif self.directions[i]['code'] == 'RL':
                                     self.ts.SetATR(0)
                                     self.ts.SetEDMMode('RLSTANDARD')
-                                res = self.ts.Move(Angle(hz), Angle(v), 0)
-                                if 'errorCode' not in res:
-                                    res = self.ts.Measure()
-                            elif self.directions[i]['code'] == 'OR':
-                                res = self.ts.Move(Angle(hz), Angle(v), 0)
-                                if 'errorCode' not in res:
-                                    # wait for user to target on point
-                                    ww = raw_input(target_msg.format(pn, self.directions[i]['code'], (n + k) % 2 + 1))
-                                    if ww == 's':
-                                        break
-                            else:
-                                # unknown code skip
-                                logging.warning("Invalid code %s(%s)", pn, self.directions[i]['code'])
-                                break
-                            if 'errorCode' in res:
-                                j += 1
-                                time.sleep(self.delaytry)
-                                continue
-                            if self.directions[i]['code'] == 'OR':
-                                obs = self.ts.GetAngles()
-                            else:
-                                obs = self.ts.GetMeasure()
-                                # add inclination data to obs
-                                w = self.ts.GetAngles()
-                                if 'crossincline' in w and 'lengthincline' in w:
-                                    obs['crossincline'] = w['crossincline']
-                                    obs['lengthincline'] = w['lengthincline']
-                            if self.ts.measureIface.state != self.ts.measureIface.IF_OK or 'errorCode' in obs:
-                                self.ts.measureIface.state = self.ts.measureIface.IF_OK
-                                j += 1
-                                continue
-                            else:
-                                # check false direction
-                                if abs(hz - obs['hz'].GetAngle()) > self.dirLimit or \
-                                   abs(v - obs['v'].GetAngle()) > self.dirLimit or \
-                                   'distance' in obs and distance is not None and \
-                                   abs(obs['distance'] - distance) > self.distLimit:
+                                    self.ts.Move(Angle(hz), Angle(v), 0)
+                                    if 'errorCode' not in res:
+                                        # wait for user to target on point
+                                        ww = self.prompt(target_msg.format(pn, self.directions[i]['code'], (n + k) % 2 + 1), session)
+                                        if ww is None:
+                                            j = self.maxtry   # lock not granted again
+                                            break
+                                        if ww == 's':
+                                            break
+                                        res = self.ts.Measure()
+                                elif self.directions[i]['code'] == 'RLA':
+                                    if j == 0:
+                                        self.ts.SetATR(0)
+                                        self.ts.SetEDMMode('RLSTANDARD')
+                                    res = self.ts.Move(Angle(hz), Angle(v), 0)
+                                    if 'errorCode' not in res:
+                                        res = self.ts.Measure()
+                                elif self.directions[i]['code'] == 'OR':
+                                    res = self.ts.Move(Angle(hz), Angle(v), 0)
+                                    if 'errorCode' not in res:
+                                        # wait for user to target on point
+                                        ww = self.prompt(target_msg.format(pn, self.directions[i]['code'], (n + k) % 2 + 1), session)
+                                        if ww is None:
+                                            j = self.maxtry   # lock not granted again
+                                            break
+                                        if ww == 's':
+                                            break
+                                else:
+                                    # unknown code skip
+                                    logging.warning("Invalid code %s(%s)", pn, self.directions[i]['code'])
+                                    break
+                                if 'errorCode' in res:
+                                    j += 1
+                                    time.sleep(self.delaytry)
+                                    continue
+                                if self.directions[i]['code'] == 'OR':
+                                    obs = self.ts.GetAngles()
+                                else:
+                                    obs = self.ts.GetMeasure()
+                                    # add inclination data to obs
+                                    w = self.ts.GetAngles()
+                                    if 'crossincline' in w and 'lengthincline' in w:
+                                        obs['crossincline'] = w['crossincline']
+                                        obs['lengthincline'] = w['lengthincline']
+                                if self.ts.measureIface.state != self.ts.measureIface.IF_OK or 'errorCode' in obs:
+                                    self.ts.measureIface.state = self.ts.measureIface.IF_OK
                                     j += 1
-                                    logging.warning("False direction %s", pn)
-                                    continue    # try again
-                                break   # observation OK
+                                    continue
+                                else:
+                                    # check false direction
+                                    if abs(hz - obs['hz'].GetAngle()) > self.dirLimit or \
+                                       abs(v - obs['v'].GetAngle()) > self.dirLimit or \
+                                       'distance' in obs and distance is not None and \
+                                       abs(obs['distance'] - distance) > self.distLimit:
+                                        j += 1
+                                        logging.warning("False direction %s", pn)
+                                        continue    # try again
+                                    break   # observation OK
+                        finally:
+                            if session:
+                                self.ts.measureIface.Unlock()
                         if j >= self.maxtry:
                             logging.error("Cannot measure point %s", pn)
                             continue
@@ -305,6 +342,8 @@ class Robot(object):
             self.ts.Move(self.directions[1]['hz'], self.directions[1]['v'], 0)
         except:
             pass
+        logging.info("%d settings not sent to instrument",
+                     self.ts.GetSavedTrips(True))
         return (obs_out, coo_out)
 
 if __name__ == "__main__":
@@ -427,7 +466,7 @@ if __name__ == "__main__":
         sys.exit()
     # interface to the totalstation
     iface = SerialIface("rs-232", port)
-    ts = TotalStation(stationtype, mu, iface)
+    ts = TotalStation(stationtype, mu, iface, shadow=True)
     if ts.measureIface.state != ts.measureIface.IF_OK:
         print("no serial communication")
         exit(-1)   # no serial communication available
@@ -29,7 +29,11 @@ Parameters are stored in config file using JSON format::
     delay_try: delay between tries, optional (default: 0)
     dir_limit: angle limit for false direction in radians (default 0.015. 5')
     dist_limit: distance limit for false direction in meters (default 0.1)
-    port: serial port to use (e.g. COM1 or /dev/ttyS0 or /dev/ttyUSB0)
+    port: serial port to use (e.g. COM1 or /dev/ttyS0 or /dev/ttyUSB0) or broker:host:port to use an instrument shared by brokerserver.py
+    broker_key: key file written by brokerserver.py, the ULYXES_BROKER_KEY environment variable is used if set, optional (default: broker.key)
+    max_baud: highest baud rate to negotiate with the instrument, optional (default: 0 no negotiation)
+    telemetry: JSON file to save time of communication, parsing and writing and error counts to, the profile of the cycle is printed and logged, optional (default: no telemetry)
+    timeout_stats: JSON file to keep command latency statistics in, timeouts are adapted to the latencies, optional (default: fixed timeout)
     coo_rd: source to get coordinates from
     coo_wr: target to send coordinates to
     obs_wr: target to send observations to
@@ -37,7 +41,7 @@ Parameters are stored in config file using JSON format::
     inf_wr: target to send general information to
     avg_wr: calculate averages from more faces if value 1, no average calculation if value is zero, optional (default: 1) DEPRICATED average always calculated
     decimals: number of decimals in output, optional (default: 4)
-    gama_path: path to GNU Gama executable, optional (default: empty, no adjustment)
+    gama_path: path to GNU Gama executable or native for the in process adjustment, optional (default: empty, no adjustment)
     stdev_angle: standard deviation of angle measurement (arc seconds), optional (default: 1)
     stdev_dist: additive tag for standard deviation of distance measurement (mm), optional (default: 1)
     stdev_dist1: multiplicative tag for standard deviation of distance measurement (mm), optional (default: 1.5)
@@ -67,6 +71,7 @@ if len([p for p in sys.path if 'pyapi' in p]) == 0:
         sys.exit(1)
 
 from angle import Angle
+from geometry import Bearing
 from httpreader import HttpReader
 from httpwriter import HttpWriter
 from georeader import GeoReader
@@ -77,6 +82,10 @@ from sqlitewriter import SqLiteWriter
 from confreader import ConfReader
 from filegen import ObsGen
 from serialiface import SerialIface
+from latencystats import LatencyStats
+from broker import Broker
+from brokeriface import BrokerIface
+from telemetry import Telemetry
 from totalstation import TotalStation
 from blindorientation import Orientation
 from anystation import AnyStation
@@ -251,13 +260,19 @@ if __name__ == "__main__":
         'dir_limit': {'required': False, 'type': 'float', 'default': 0.015},
         'dist_limit': {'required': False, 'type': 'float', 'default': 0.1},
         'port': {'required' : True, 'type': 'str'},
+        'broker_key': {'required': False, 'type': 'str',
+                       'default': 'broker.key'},
+        'max_baud': {'required': False, 'type': 'int', 'default': 0},
+        'timeout_stats': {'required': False, 'type': 'str'},
+        'telemetry': {'required': False, 'type': 'str'},
         'coo_rd': {'required' : True},
         'coo_wr': {'required' : True},
         'obs_wr': {'required': True},
         'met_wr': {'required': False},
         'inf_wr': {'required': False},
         'decimals': {'required': False, 'type': 'int', 'default': 4},
-        'gama_path': {'required': False, 'type': 'file'},
+        'gama_path': {'required': False, 'type': 'file',
+                      'keywords': ['native']},
         'stdev_angle': {'required': False, 'type': 'float', 'default': 1},
         'stdev_dist': {'required': False, 'type': 'float', 'default': 1},
         'stdev_dist1': {'required': False, 'type': 'float', 'default': 1.5},
@@ -307,15 +322,38 @@ if __name__ == "__main__":
         sys.exit(-1)
     if cr.json['station_type'] == 'local':
         iface = LocalIface('test', 'test_iface.txt', 'rand')
+    elif cr.json['port'].startswith('broker:'):
+        host, bport = cr.json['port'][7:].rsplit(':', 1)
+        key = Broker.AuthKey(cr.json['broker_key'])
+        if key is None:
+            logging.fatal("Broker key not found %s", cr.json['broker_key'])
+            sys.exit(-1)
+        try:
+            iface = BrokerIface('broker',
+                                Broker.Connect((host, int(bport)), key),
+                                Broker.MONITORING)
+        except Exception:
+            logging.fatal("Cannot connect to broker %s", cr.json['port'])
+            sys.exit(-1)
     else:
-        iface = SerialIface("rs-232", cr.json['port'])
+        stats = None
+        if cr.json.get('timeout_stats') is not None:
+            stats = LatencyStats(cr.json['timeout_stats'])
+        iface = SerialIface("rs-232", cr.json['port'], stats=stats)
     if iface.GetState():
         logging.fatal("Serial interface error")
         sys.exit(-1)
     if iface.state != iface.IF_OK:
         sys.exit(1)
 
-    ts = TotalStation(cr.json['station_type'], mu, iface)
+    # settings of an instrument shared by a broker can be changed by other
+    # clients, they are not shadowed
+    ts = TotalStation(cr.json['station_type'], mu, iface,
+                      shadow=not isinstance(iface, BrokerIface))
+    tel = None
+    if cr.json.get('telemetry') is not None:
+        tel = Telemetry()
+        ts.SetTelemetry(tel)
     for i in range(10):
         w = ts.GetATR() # wake up instrument
         if 'errorCode' in w or ts.measureIface.GetState():
@@ -326,6 +364,12 @@ if __name__ == "__main__":
     if 'errorCode' in w or ts.measureIface.GetState():
         logging.fatal("Instrument wake up failed")
         sys.exit(-1)
+    if cr.json['max_baud'] > 0 and isinstance(iface, SerialIface):
+        rates = [r for r in (115200, 57600, 38400, 19200, 9600)
+                 if r <= cr.json['max_baud']]
+        if ts.NegotiateBaudRate(rates) is None:
+            logging.fatal("Baud rate negotiation failed")
+            sys.exit(-1)
     # get meteorology data
     print("Getting met data...")
     if 'met' in cr.json and cr.json['met'] is not None:
@@ -494,6 +538,11 @@ if __name__ == "__main__":
                                    'std_north', 'std_elev', 'std_ori'])
         else:
             wrt2 = GeoWriter(fname=cr.json['inf_wr'], mode='a', dist=fmt)
+    if tel is not None:
+        tel.TimeWriter(wrt, 'coo')
+        tel.TimeWriter(wrt1, 'obs')
+        if 'inf_wr' in cr.json:
+            tel.TimeWriter(wrt2, 'inf')
     if 'mon_list' in cr.json and cr.json['mon_list'] is not None:
         # get monitoring coordinates from database
         print("Loading mon coords...")
@@ -636,8 +685,9 @@ if __name__ == "__main__":
                     logging.fatal("Backsite trouble")
                     sys.exit(1)
                 ori_p = [p for p in fix_coords if p['id'] == back_site][0]
-                bearing = Angle(math.atan2(ori_p['east'] - st_coord[0]['east'], \
-                                     ori_p['north'] - st_coord[0]['north']))
+                bearing = Angle(float(Bearing(st_coord[0]['east'],
+                                              st_coord[0]['north'],
+                                              ori_p['east'], ori_p['north'])))
                 # rotate to farest FIX and set orientation
                 ts.Move(obs_out[back_indx]['hz'], obs_out[back_indx]['v'], 1)
                 ans = ts.SetOri(bearing)
@@ -689,5 +739,12 @@ if __name__ == "__main__":
                 logging.error('Station inf write failed')
     # move telescope to safe position
     ans = ts.Move(Angle(0), Angle(180, "DEG")) # no ATR
+    if getattr(iface, 'stats', None) is not None:
+        iface.stats.Save()
+    if tel is not None:
+        profile = tel.Profile()
+        print(profile)
+        logging.info("Cycle profile\n%s", profile)
+        tel.Save(cr.json['telemetry'])
     #if cr.json['ts_off']:
     #    ts.SwitchOff(1)
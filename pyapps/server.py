@@ -1,23 +1,99 @@
-import sys
-sys.path.append('../pyapi/')
-from totalstationrequesthandler import TotalStationRequestHandler
-from leicatps1200 import LeicaTPS1200
-from serialiface import SerialIface
+#!/usr/bin/env python
+# -*- coding: UTF-8 -*-
+"""
+.. module:: server.py
 
-import SocketServer
-import threading
+.. moduleauthor:: Zoltan Siki
 
+Share a total station among network clients. The serial line is opened
+once, requests of the clients are serialized, see InstrumentGateway for the
+protocol. Clients can use TCPIface with a GeoCOM measure unit or with
+RemoteMeasureUnit, tracking observations can be streamed by SUBSCRIBE.
+Instruments with a Raspberry Pi camera are driven as CameraStation, so
+photos can be taken by the TAKEPHOTO request of RemoteMeasureUnit.
 
-if __name__ == "__main__":
+    :param argv[1] (sensor): 110n/180n/120n, default 1200
+    :param argv[2] (port): serial port, default /dev/ttyUSB0
+    :param argv[3] (host): address to listen on, default 127.0.0.1
+    :param argv[4] (tcp port): TCP port to listen on, default 8081
+    :param argv[5] (camera): 1 for a PiCamera on the instrument (CameraStation), default 0
+"""
+import re
+import sys
+import asyncio
+import logging
+import os.path
 
-    #iface = SerialIface('test', '/dev/ttyUSB0')
+# check PYTHONPATH
+if len([p for p in sys.path if 'pyapi' in p]) == 0:
+    if os.path.isdir('../pyapi/'):
+        sys.path.append('../pyapi/')
+    else:
+        print("pyapi not found")
+        print("Add pyapi directory to the Python path or start your application from ulyxes/pyapps folder")
+        sys.exit(1)
 
-    #mu = LeicaTPS1200()
+from serialiface import SerialIface
+from broker import Broker
+from instrumentgateway import InstrumentGateway
+from leicatcra1100 import LeicaTCRA1100
+from leicatca1800 import LeicaTCA1800
+from leicatps1200 import LeicaTPS1200
+from totalstation import TotalStation
 
+def CameraStationUnit(base):
+    """ Measure unit of a total station with PiCamera
 
-    server = SocketServer.TCPServer(('192.168.1.102', 8081), TotalStationRequestHandler)
+        :param base: class of total station measure unit
+        :returns: measure unit instance
+    """
+    # picamera and cv2 are needed only for camera stations
+    from picameraunit import PiCameraUnit
 
-    server.serve_forever()
+    class CameraUnit(PiCameraUnit, base):
+        """ total station and camera measure unit """
+        def __init__(self):
+            base.__init__(self)
+            PiCameraUnit.__init__(self, self.name, self.typ)
+    return CameraUnit()
 
-    #thread = threading.Thread(target=server.serve_forever)
-    #thread.start()
+async def main(gw):
+    """ run the gateway until interrupted """
+    address = await gw.Start()
+    print("gateway listening on %s:%d" % address[:2])
+    await asyncio.Event().wait()
+
+if __name__ == "__main__":
+    logging.getLogger().setLevel(logging.INFO)
+    stationtype = sys.argv[1] if len(sys.argv) > 1 else '1200'
+    port = sys.argv[2] if len(sys.argv) > 2 else '/dev/ttyUSB0'
+    host = sys.argv[3] if len(sys.argv) > 3 else '127.0.0.1'
+    tcpport = int(sys.argv[4]) if len(sys.argv) > 4 else 8081
+    camera = len(sys.argv) > 5 and sys.argv[5] == '1'
+    if re.search('120[0-9]$', stationtype):
+        mu = LeicaTPS1200
+    elif re.search('110[0-9]$', stationtype):
+        mu = LeicaTCRA1100
+    elif re.search('180[0-9]$', stationtype):
+        mu = LeicaTCA1800
+    else:
+        print("unsupported instrument type")
+        sys.exit(1)
+    instrument = TotalStation
+    if camera:
+        from camerastation import CameraStation
+        instrument = CameraStation
+        mu = CameraStationUnit(mu)
+    else:
+        mu = mu()
+    iface = SerialIface("rs-232", port)
+    if iface.GetState() != iface.IF_OK:
+        print("serial port not opened")
+        sys.exit(1)
+    broker = Broker(iface, aging=10)
+    try:
+        asyncio.run(main(InstrumentGateway(broker, mu, host, tcpport,
+                                           instrument)))
+    except KeyboardInterrupt:
+        pass
+    broker.Stop()